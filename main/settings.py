@@ -55,6 +55,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Latencia, SQL y serialización por ruta (orders/metrics.py, /api/metrics/)
+    'orders.metrics.RequestMetricsMiddleware',
 ]
 
 # Configuración de DRF para usar JWT
@@ -62,6 +64,16 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # JSON con orjson si está instalado (orders/fast_json.py); misma salida que los de DRF
+    'DEFAULT_RENDERER_CLASSES': (
+        'orders.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'orders.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 # Configuración opcional de JWT (para que los tokens duren un tiempo razonable)
@@ -115,6 +127,36 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache compartido entre procesos (la versión del catálogo de productos,
+# orders/catalog.py). En producción con varios workers debe apuntar a Redis
+# (p. ej. el mismo servidor de REDIS_URL, otra base: redis://localhost:6379/1);
+# sin CACHE_URL cada proceso tiene su cache y los cambios de productos llegan a
+# los demás workers recién cuando vence su copia (orders.catalog.MAX_AGE).
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": CACHE_URL}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Eventos de WebSocket (orders/outbox.py): True los envía en el mismo hilo al
+# confirmar la transacción, sin el hilo de fondo (útil en tests y scripts)
+ORDERS_OUTBOX_EAGER = config('ORDERS_OUTBOX_EAGER', default=False, cast=bool)
+
+# Loguea (WARNING, logger orders.metrics) las requests que tarden más que
+# esto, con sus consultas SQL más lentas. 0 = desactivado.
+ORDERS_SLOW_REQUEST_MS = config('ORDERS_SLOW_REQUEST_MS', default=0, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'orders': {'handlers': ['console'], 'level': config('ORDERS_LOG_LEVEL', default='INFO')},
+    },
+}
+
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -141,5 +183,8 @@ USE_I18N = True
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 
+# Carpeta donde run_report_worker deja los reportes generados
+REPORTS_ROOT = config('REPORTS_ROOT', default=str(BASE_DIR / 'reports'))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
@@ -11,7 +11,7 @@ from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
-from orders.views import OrderViewSet, ProductListView, TableViewSet, CustomerViewSet, DashboardViewSet
+from orders.views import OrderViewSet, ProductListView, TableViewSet, CustomerViewSet, DashboardViewSet, MetricsView
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='orders')
@@ -22,7 +22,8 @@ router.register(r'dashboard', DashboardViewSet, basename='dashboard')
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include(router.urls)),
-    path("api/products/", ProductListView.as_view()),
+    path("api/products/", ProductListView.as_view(), name='products'),
+    path("api/metrics/", MetricsView.as_view(), name='metrics'),
 
     # --- 2. NUEVAS RUTAS DE AUTENTICACIÓN ---
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'), # Login
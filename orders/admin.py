@@ -1,53 +1,66 @@
+import os
 from django.contrib import admin
-from .models import Order, OrderItem, Product, Table, Review
-
-# --- IMPORTACIONES PARA EXPORTAR A EXCEL ---
-import openpyxl
-import json
-from django.http import HttpResponse
-from django.utils import timezone
-
-
-# --- ACCIÓN DE EXPORTAR A EXCEL (Ya la tenías) ---
+from django.contrib.admin import helpers
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .jobs import enqueue_report
+from .models import Order, OrderItem, Product, Table, Review, ReportJob
+
+# --- IMPORTACIONES PARA EXPORTAR (XLSX / CSV en streaming) ---
+import tempfile
+from django.http import FileResponse, StreamingHttpResponse
+from .exports import ITEM_COLUMNS, csv_lines, export_filename, item_rows, write_xlsx
+
+
+# --- ACCIONES DE EXPORTAR ---
+# El libro se escribe en un archivo temporal (write-only) y se envía por bloques.
 @admin.action(description="Exportar seleccionados a Excel (XLSX)")
 def export_to_excel(modeladmin, request, queryset):
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Items de Pedidos"
-
-    columns = ["Item ID", "Order ID", "Mesa", "Producto", "Precio Unitario", "Fecha de Creación"]
-    ws.append(columns)
-
-    for item in queryset:
-        row_data = [
-            item.id,
-            item.order.id,
-            str(item.order.table.code) if item.order.table else "N/A",
-            item.product_name,
-            item.unit_price,
-            item.order.created_at.astimezone(timezone.get_current_timezone()).strftime("%Y-%m-%d %H:%M")
-        ]
-        ws.append(row_data)
+    tmp = tempfile.TemporaryFile()
+    write_xlsx(tmp, "Items de Pedidos", ITEM_COLUMNS, item_rows(queryset))
+    tmp.seek(0)
+    return FileResponse(
+        tmp,
+        as_attachment=True,
+        filename=export_filename("reporte_items", "xlsx"),
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
 
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column].width = adjusted_width
-
-    response = HttpResponse(content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-    filename = f"reporte_items_{timezone.now().strftime('%Y%m%d_%H%M')}.xlsx"
-    response["Content-Disposition"] = f"attachment; filename={filename}"
-    wb.save(response)
+
+@admin.action(description="Exportar seleccionados a CSV")
+def export_to_csv(modeladmin, request, queryset):
+    response = StreamingHttpResponse(csv_lines(ITEM_COLUMNS, item_rows(queryset)), content_type="text/csv")
+    response["Content-Disposition"] = f"attachment; filename={export_filename('reporte_items', 'csv')}"
     return response
 
 
+# --- REPORTES EN SEGUNDO PLANO ---
+# Solo encolan un ReportJob; el archivo lo genera `manage.py run_report_worker`.
+def background_report_action(kind, file_format):
+    @admin.action(description=f"Generar reporte {ReportJob.Format(file_format).label} en segundo plano")
+    def action(modeladmin, request, queryset):
+        if request.POST.get("select_across") == "1":
+            # "Seleccionar todo": se guardan los filtros, no los PKs; el worker arma la consulta
+            filters = {key: request.GET.getlist(key) for key in request.GET if key != "p"}
+            job = enqueue_report(kind, file_format, filters=filters, user=request.user)
+        else:
+            job = enqueue_report(kind, file_format, queryset=queryset, user=request.user)
+        modeladmin.message_user(request, f"Reporte #{job.id} en cola. Revisa 'Report jobs' para descargarlo.")
+
+    action.__name__ = f"background_{kind.lower()}_{file_format.lower()}"
+    return action
+
+
+# Recalcula todo el rollup: no usa la selección y se puede ejecutar sin
+# marcar pedidos (ver OrderAdmin.changelist_view)
+@admin.action(description="Recalcular Dashboard en segundo plano")
+def background_rollup(modeladmin, request, queryset):
+    job = enqueue_report(ReportJob.Kind.ROLLUP, user=request.user)
+    modeladmin.message_user(request, f"Recalculo #{job.id} en cola.")
+
+
 # --- REGISTROS DEL ADMIN ---
 
 @admin.register(Table)
@@ -88,7 +101,15 @@ class OrderAdmin(admin.ModelAdmin):
         "delivered_at"  # Hora de entrega
     )
     list_filter = ("status", "created_at")
+    list_select_related = ("table",)
     inlines = [OrderItemInline]
+    actions = [
+        background_report_action(ReportJob.Kind.ORDERS, ReportJob.Format.XLSX),
+        background_report_action(ReportJob.Kind.ORDERS, ReportJob.Format.CSV),
+        background_rollup,
+    ]
+    # Acciones que no dependen de la selección
+    actions_without_selection = ("background_rollup",)
     ordering = ("-created_at",)
     # Hacemos que todos los tiempos sean visibles en el detalle
     readonly_fields = (
@@ -96,12 +117,35 @@ class OrderAdmin(admin.ModelAdmin):
         'preparing_at', 'ready_at', 'delivered_at', 'paid_at'
     )
 
+    def changelist_view(self, request, extra_context=None):
+        # Django no ejecuta acciones sin filas marcadas: para estas se marca
+        # "todas" (select_across), que la acción igual ignora
+        if request.method == "POST" and not request.POST.getlist(helpers.ACTION_CHECKBOX_NAME):
+            try:
+                action = request.POST.getlist("action")[int(request.POST.get("index", 0))]
+            except (IndexError, ValueError):
+                action = None
+            if action in self.actions_without_selection:
+                request.POST = request.POST.copy()
+                request.POST.setlist(helpers.ACTION_CHECKBOX_NAME, ["0"])
+                request.POST["select_across"] = "1"
+        return super().changelist_view(request, extra_context)
+
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
     list_display = ("id", "order", "product_name", "unit_price", "notes")
+    # Order.__str__ usa la mesa
+    list_select_related = ("order__table",)
+    # Un <select> con todos los pedidos haría una consulta por pedido (Order.__str__)
+    raw_id_fields = ("order",)
     search_fields = ("product_name", "notes")
-    actions = [export_to_excel]
+    actions = [
+        export_to_excel,
+        export_to_csv,
+        background_report_action(ReportJob.Kind.ITEMS, ReportJob.Format.XLSX),
+        background_report_action(ReportJob.Kind.ITEMS, ReportJob.Format.CSV),
+    ]
 
 
 # --- NUEVO REGISTRO: CALIFICACIONES (Reviews) ---
@@ -109,9 +153,54 @@ class OrderItemAdmin(admin.ModelAdmin):
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ("id", "get_product_name", "rating", "comment", "created_at")
     list_filter = ("rating", "created_at")
+    list_select_related = ("order_item",)
+    raw_id_fields = ("order_item",)
     search_fields = ("comment", "order_item__product_name")
+    actions = [
+        background_report_action(ReportJob.Kind.REVIEWS, ReportJob.Format.XLSX),
+        background_report_action(ReportJob.Kind.REVIEWS, ReportJob.Format.CSV),
+    ]
 
     # Función auxiliar para mostrar el nombre del producto en la lista
     @admin.display(description='Producto')
     def get_product_name(self, obj):
-        return obj.order_item.product_name
\ No newline at end of file
+        return obj.order_item.product_name
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "file_format", "status", "get_progress", "requested_by", "created_at", "finished_at",
+                    "get_download")
+    list_filter = ("status", "kind", "file_format")
+    list_select_related = ("requested_by",)
+    readonly_fields = ("kind", "file_format", "status", "requested_by", "progress", "total", "file_path", "error",
+                       "created_at", "started_at", "finished_at")
+    exclude = ("object_ids", "filters")
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description='Avance')
+    def get_progress(self, obj):
+        if obj.total:
+            return f"{obj.progress}/{obj.total} ({obj.progress * 100 // obj.total}%)"
+        return obj.progress or "-"
+
+    @admin.display(description='Archivo')
+    def get_download(self, obj):
+        if obj.status != ReportJob.Status.DONE or not obj.file_path:
+            return "-"
+        url = reverse("admin:orders_reportjob_download", args=[obj.pk])
+        return format_html('<a href="{}">Descargar</a>', url)
+
+    def get_urls(self):
+        urls = [
+            path("<int:pk>/download/", self.admin_site.admin_view(self.download_view), name="orders_reportjob_download"),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, pk):
+        job = get_object_or_404(ReportJob, pk=pk, status=ReportJob.Status.DONE)
+        if not self.has_view_permission(request, job) or not os.path.exists(job.file_path):
+            raise Http404
+        return FileResponse(open(job.file_path, "rb"), as_attachment=True, filename=os.path.basename(job.file_path))
@@ -0,0 +1,119 @@
+# orders/catalog.py
+"""
+Catálogo de productos en memoria del proceso.
+
+Se indexa por nombre y por id. La versión vive en el cache de Django: al
+guardar o borrar un Product (vista, admin o shell) se incrementa y cada
+proceso descarta su copia en la siguiente consulta. Para que eso llegue a
+todos los workers el cache tiene que ser compartido (CACHE_URL, Redis); con
+el cache local por proceso (sin CACHE_URL) solo se entera el proceso que
+guardó. En cualquier caso ninguna copia dura más de MAX_AGE, así que un
+worker que no vio el cambio (o un cache caído) sirve precios viejos como
+mucho ese tiempo. Si falta algún nombre, se resuelve con una sola consulta
+`name__in`.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'orders:product_catalog:version'
+MAX_AGE = 60  # segundos
+
+CatalogProduct = namedtuple('CatalogProduct', ['id', 'name', 'category', 'base_price'])
+
+
+class ProductCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._loaded_at = None
+        self._by_name = {}
+        self._by_id = {}
+
+    def _current_version(self):
+        try:
+            version = cache.get(VERSION_KEY)
+            if version is None:
+                cache.add(VERSION_KEY, 1, timeout=None)
+                version = cache.get(VERSION_KEY, 1)
+        except Exception:
+            # Sin cache no hay versión: la copia local vence por MAX_AGE
+            logger.warning("Catálogo: no se pudo leer la versión del cache", exc_info=True)
+            return self._version
+        return version
+
+    def _sync(self):
+        version = self._current_version()
+        now = time.monotonic()
+        if version != self._version or self._loaded_at is None or now - self._loaded_at > MAX_AGE:
+            self._by_name = {}
+            self._by_id = {}
+            self._version = version
+            self._loaded_at = now
+
+    def _store(self, products):
+        for product in products:
+            entry = CatalogProduct(product.id, product.name, product.category, product.base_price)
+            # Si hay nombres repetidos gana el de menor id (el más antiguo)
+            if product.name not in self._by_name or self._by_name[product.name].id > product.id:
+                self._by_name[product.name] = entry
+            self._by_id[product.id] = entry
+
+    def get_many(self, names):
+        """{name: CatalogProduct} para los nombres que existen (como mucho 1 consulta)."""
+        names = set(names)
+        with self._lock:
+            self._sync()
+            missing = names - self._by_name.keys()
+            if missing:
+                self._store(Product.objects.filter(name__in=missing).order_by('id'))
+            return {name: self._by_name[name] for name in names if name in self._by_name}
+
+    def get(self, name):
+        return self.get_many([name]).get(name)
+
+    def get_by_id(self, product_id):
+        with self._lock:
+            self._sync()
+            if product_id not in self._by_id:
+                self._store(Product.objects.filter(pk=product_id))
+            return self._by_id.get(product_id)
+
+    def invalidate(self):
+        """
+        Invalida el catálogo en este proceso y en todos los que comparten el
+        cache (todos los workers si CACHE_URL apunta a Redis).
+        """
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, 1, timeout=None)
+        except Exception:
+            logger.warning("Catálogo: no se pudo invalidar en el cache", exc_info=True)
+        with self._lock:
+            self._loaded_at = None
+
+
+product_catalog = ProductCatalog()
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith(('LocMemCache', 'DummyCache')):
+        return [checks.Warning(
+            "El cache no es compartido entre procesos: un cambio de productos llega a los demás "
+            f"workers recién a los {MAX_AGE} s.",
+            hint="Configure CACHE_URL (Redis).",
+            id='orders.W001',
+        )]
+    return []
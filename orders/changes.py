@@ -0,0 +1,61 @@
+# orders/changes.py
+"""
+Cambios de pedidos desde un cursor, para que una pantalla que se reconecta
+pida solo lo que cambió en vez de recargar toda la lista.
+
+El cursor es (updated_at, id) opaco para el cliente. Un pedido cuyo
+updated_at ya se estampó pero cuya transacción aún no confirma podría quedar
+detrás del cursor; por eso el cursor final nunca pasa de `ahora - SETTLE_WINDOW`
+y esos segundos se vuelven a enviar en la siguiente consulta (el cliente
+reemplaza por id, los repetidos no molestan).
+
+Los borrados salen de OrderTombstone, que solo se guarda TOMBSTONE_RETENTION:
+un cursor más viejo que eso responde `reset` y el cliente recarga todo.
+"""
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .cursors import encode_cursor
+from .models import OrderTombstone
+
+SETTLE_WINDOW = timedelta(seconds=5)
+TOMBSTONE_RETENTION = timedelta(days=1)
+
+
+def get_changes(queryset, since, limit):
+    """
+    Pedidos de `queryset` modificados (o creados) después de `since` y los ids
+    borrados. Sin `since`, o con uno demasiado viejo, devuelve solo un cursor
+    nuevo con reset=True: el cliente debe pedir este cursor ANTES de cargar la
+    lista completa, así no se pierde nada entre ambas consultas.
+    """
+    now = timezone.now()
+    tail_cursor = encode_cursor(now - SETTLE_WINDOW, 0)
+    if since is None or since[0] < now - TOMBSTONE_RETENTION:
+        return {'orders': [], 'deleted': [], 'cursor': tail_cursor, 'has_more': False, 'reset': True}
+
+    updated_at, pk = since
+    orders = list(
+        queryset
+        .filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+        .order_by('updated_at', 'id')[:limit + 1]
+    )
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    deleted = list(
+        OrderTombstone.objects.filter(deleted_at__gte=updated_at)
+        .order_by('order_id').values_list('order_id', flat=True).distinct()
+    )
+
+    if has_more:
+        cursor = encode_cursor(orders[-1].updated_at, orders[-1].pk)
+    else:
+        cursor = tail_cursor
+    return {'orders': orders, 'deleted': deleted, 'cursor': cursor, 'has_more': has_more, 'reset': False}
+
+
+def record_deleted(order_id):
+    OrderTombstone.objects.create(order_id=order_id)
+    OrderTombstone.objects.filter(deleted_at__lt=timezone.now() - TOMBSTONE_RETENTION).delete()
@@ -0,0 +1,83 @@
+# orders/commands.py
+"""
+Acciones de la cocina y de la mesa que se pueden pedir por HTTP (views.py) o
+por el WebSocket ya abierto (consumers.py). Ambos caminos ejecutan lo mismo:
+la transición validada, el delta a la cocina y los mismos errores
+(APIException: 404, 409 con el estado actual, 400, 403).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from rest_framework.exceptions import NotFound, ParseError, PermissionDenied
+
+from .models import Order, Table
+from .order_items import build_items, write_order_items
+from .serializers import order_deltas
+from .stations import publish_delta, publish_waiter_call
+from .transitions import TRANSITIONS, TransitionConflict, apply_transition, changed_fields, status_transition
+
+
+def send_order_delta(order, fields):
+    # A la cocina solo los campos que cambiaron (ORDER_DELTA), y a cada
+    # estación solo si el pedido tiene items suyos (orders/stations.py)
+    [delta] = order_deltas([order], fields)
+    publish_delta(order, delta)
+
+
+def set_status(pk, new_status):
+    transition = status_transition(new_status)
+    order = apply_transition(pk, transition)
+    send_order_delta(order, changed_fields(transition))
+    return order
+
+
+def mark_delivered(pk):
+    transition = TRANSITIONS['deliver']
+    order = apply_transition(pk, transition)
+    send_order_delta(order, changed_fields(transition))
+    return order
+
+
+@transaction.atomic
+def accept_change(pk):
+    transition = TRANSITIONS['accept_change']
+    order = Order.objects.filter(pk=pk).first()
+    if order is None:
+        raise NotFound()
+    if order.status not in transition.sources:
+        raise TransitionConflict(transition, order.status)
+
+    items_data = order.proposed_changes.get('items')
+    if not items_data:
+        raise ParseError("Datos corruptos.")
+    try:
+        priced_items = build_items(items_data, lambda item: Decimal(str(item.get('unit_price', '0.00'))))
+    except (ValueError, ArithmeticError):
+        raise ParseError("Datos corruptos.")
+
+    # El UPDATE condicional decide quién gana; los items se escriben después
+    order = apply_transition(order.pk, transition, proposed_changes={})
+    write_order_items(order, priced_items)
+    send_order_delta(order, changed_fields(transition, 'proposed_changes', 'items', 'total_price'))
+    return order
+
+
+def reject_change(pk):
+    transition = TRANSITIONS['reject_change']
+    order = apply_transition(pk, transition, proposed_changes={})
+    send_order_delta(order, changed_fields(transition, 'proposed_changes'))
+    return order
+
+
+def call_waiter(table_code, token):
+    table = Table.objects.filter(code=table_code).first()
+    if table is None:
+        raise NotFound()
+    if table.session_token is None or str(table.session_token) != str(token):
+        raise PermissionDenied("Sesión inválida.")
+
+    table.needs_assistance = True
+    table.save(update_fields=['needs_assistance'])
+    # Avisa a los meseros que el cliente llama (no va a las estaciones)
+    publish_waiter_call(table.code, "ON")
+    return table
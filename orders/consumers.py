@@ -1,27 +1,285 @@
-import json
+import logging
+from urllib.parse import parse_qs
+
+import msgpack
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 
-# El nombre del grupo para la cocina (constante)
+from . import fast_json
+from .live import active_orders
+
+logger = logging.getLogger(__name__)
+
+# El nombre del grupo para la cocina (constante): vista completa
 KITCHEN_GROUP_NAME = "kitchen"
+# Meseros (vista completa + llamadas de mesa) y estaciones (ver orders/stations.py)
+WAITERS_GROUP_NAME = "kitchen.waiters"
+WAITERS_ROLE = "waiters"
+
+
+def station_group(station):
+    return f"kitchen.station.{station}"
+
+
+# Subprotocolo para recibir los mensajes en msgpack (frames binarios) en vez
+# de JSON: el cliente lo ofrece en Sec-WebSocket-Protocol y si no, JSON.
+MSGPACK_SUBPROTOCOL = "msgpack"
+MAX_SNAPSHOT_ORDERS = 500
+
+
+class FastJsonWebsocketConsumer(AsyncJsonWebsocketConsumer):
+    # JSON de los frames con orjson si está instalado (orders/fast_json.py)
+    @classmethod
+    async def decode_json(cls, text_data):
+        return fast_json.loads(text_data)
+
+    @classmethod
+    async def encode_json(cls, content):
+        # Los frames salen de representations.py y order_deltas (precios como
+        # string, fechas ISO): sin floats, no hace falta buscar NaN
+        return fast_json.dumps(content, check_floats=False).decode()
+
+
+class CommandsMixin:
+    """
+    Comandos del cliente por el socket ya abierto, en lugar de una request HTTP:
+
+        {"type": "<COMANDO>", "ref": <id del cliente>, ...argumentos}
+
+    Se ejecutan con las mismas funciones que la API (orders/commands.py) y se
+    responden al mismo cliente con la misma `ref`:
+
+        {"type": "ACK", "ref": ..., ...resultado}
+        {"type": "NACK", "ref": ..., "code": 409, "error": {...}}
+
+    `code` y `error` son el status y el cuerpo que daría la API HTTP. Los
+    demás clientes se enteran por los eventos de siempre (ORDER_DELTA, ...).
+    Un frame que no se puede decodificar responde NACK 400 sin `ref`, un
+    pedido que ya no existe 404 y cualquier otro error se registra y responde
+    500: el socket sigue abierto.
+    """
+    # type -> nombre del método async(content) que devuelve el resultado del ACK
+    command_handlers = {}
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        from rest_framework.exceptions import ParseError
+
+        try:
+            content = await self.decode_frame(text_data, bytes_data)
+        except ValueError:
+            await self.send_nack(None, ParseError())
+            return
+        await self.receive_json(content, **kwargs)
+
+    async def decode_frame(self, text_data, bytes_data):
+        if text_data is None:
+            raise ValueError("Frame sin texto.")
+        return await self.decode_json(text_data)
+
+    async def run_command(self, content):
+        from django.core.exceptions import ObjectDoesNotExist
+        from django.http import Http404
+        from rest_framework.exceptions import APIException, NotFound
+
+        ref = content.get("ref")
+        handler = getattr(self, self.command_handlers[content["type"]])
+        try:
+            result = await handler(content)
+        except APIException as exc:
+            await self.send_nack(ref, exc)
+        except (ObjectDoesNotExist, Http404):
+            await self.send_nack(ref, NotFound())
+        except Exception:
+            logger.exception("WebSocket: falló el comando %s", content["type"])
+            await self.send_nack(ref, APIException())
+        else:
+            await self.send_json({"type": "ACK", "ref": ref, **result})
+
+    async def send_nack(self, ref, exc):
+        await self.send_json({"type": "NACK", "ref": ref, "code": exc.status_code, "error": exc.detail})
+
+
+def _order_id(content):
+    from rest_framework.exceptions import ValidationError
+
+    order_id = content.get("order_id")
+    if not isinstance(order_id, int) or isinstance(order_id, bool):
+        raise ValidationError({'detail': 'order_id inválido'})
+    return order_id
+
+
+@database_sync_to_async
+def authenticate_jwt(raw_token):
+    # El mismo access token (SimpleJWT) que usa la API HTTP
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    if not isinstance(raw_token, str) or not raw_token:
+        raise AuthenticationFailed()
+    authentication = JWTAuthentication()
+    return authentication.get_user(authentication.get_validated_token(raw_token))
+
+
+@database_sync_to_async
+def order_snapshots(order_ids=None, station=None):
+    # Este módulo se importa antes de cargar los modelos (asgi.py) y
+    # serializers lo importa a él: se importan aquí
+    from .models import Order
+    from .representations import serialize_order_rows
+    from .stations import filter_for_station
+
+    orders = Order.objects.order_by("-created_at", "-id")
+    if order_ids:
+        orders = orders.filter(pk__in=order_ids[:MAX_SNAPSHOT_ORDERS])
+    else:
+        orders = orders.exclude(status=Order.Status.PAID)
+    data = serialize_order_rows(orders)
+    return data if station is None else filter_for_station(data, station)
+
+
+class KitchenConsumer(CommandsMixin, FastJsonWebsocketConsumer):
+    """
+    Pantallas de cocina y meseros.
+
+    ws/kitchen/                   todo (vista completa).
+    ws/kitchen/?station=JUICE     solo los pedidos e items de esa categoría.
+    ws/kitchen/?role=waiters      vista completa + llamadas de mesa.
 
+    Mensajes al cliente:
+      SNAPSHOT             al conectarse: todos los pedidos activos de su vista.
+      NEW_ORDER            pedido completo.
+      ORDER_DELTA          {id, version, changes}: solo los campos que cambiaron.
+                           Se aplica si version > la versión local; si el
+                           pedido no está en la pantalla, se pide un SNAPSHOT.
+      STATUS_UPDATE_BATCH  {deltas: [...]}, varios pedidos a la vez.
+      ORDER_DELETED        {id}.
+      SNAPSHOT             también como respuesta a {"type": "SNAPSHOT", "ids": [...]}
+                           (sin ids: todos los pedidos activos).
+
+    Comandos (ver CommandsMixin), con usuario de sesión o tras AUTH:
+      AUTH            {token}: access token JWT.
+      SET_STATUS      {order_id, status}.
+      MARK_DELIVERED  {order_id}.
+      ACCEPT_CHANGE   {order_id}.
+      REJECT_CHANGE   {order_id}.
+    Los de pedidos responden ACK {id, version}.
+    """
+    binary = False
+    station = None
+    user = None
+
+    command_handlers = {
+        "AUTH": "command_auth",
+        "SET_STATUS": "command_set_status",
+        "MARK_DELIVERED": "command_mark_delivered",
+        "ACCEPT_CHANGE": "command_accept_change",
+        "REJECT_CHANGE": "command_reject_change",
+    }
 
-class KitchenConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
-        # Unimos este cliente al grupo "kitchen"
+        from .stations import STATIONS
+
+        params = parse_qs(self.scope.get("query_string", b"").decode("latin-1"))
+        station = params.get("station", [None])[0]
+        role = params.get("role", [None])[0]
+        if station:
+            station = station.upper()
+            if station not in STATIONS:
+                await self.close(code=4400)
+                return
+            self.station = station
+            self.group_name = station_group(station)
+        elif role == WAITERS_ROLE:
+            self.group_name = WAITERS_GROUP_NAME
+        elif role:
+            await self.close(code=4400)
+            return
+        else:
+            self.group_name = KITCHEN_GROUP_NAME
+
+        user = self.scope.get("user")
+        if user is not None and user.is_authenticated:
+            self.user = user
+
+        # Unimos este cliente al grupo de su vista
         await self.channel_layer.group_add(
-            KITCHEN_GROUP_NAME,
+            self.group_name,
             self.channel_name
         )
-        await self.accept()
-        print(f"WebSocket: Cocina conectada: {self.channel_name}")
+        if MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", []):
+            self.binary = True
+            await self.accept(MSGPACK_SUBPROTOCOL)
+        else:
+            await self.accept()
+        logger.debug("WebSocket: Cocina conectada: %s (%s)", self.channel_name, self.group_name)
+
+        # Snapshot inicial desde la vista en memoria (ver orders/live.py), así
+        # la pantalla no necesita pedir la lista por REST al (re)conectarse
+        frame = await active_orders.snapshot_frame(self.station, self.binary, self.encode_json)
+        if self.binary:
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
 
     async def disconnect(self, close_code):
+        if not hasattr(self, "group_name"):
+            return  # Rechazado en connect()
         # Sacamos a este cliente del grupo
         await self.channel_layer.group_discard(
-            KITCHEN_GROUP_NAME,
+            self.group_name,
             self.channel_name
         )
-        print(f"WebSocket: Cocina desconectada: {self.channel_name}")
+        logger.debug("WebSocket: Cocina desconectada: %s", self.channel_name)
+
+    # --- Framing JSON / msgpack ---
+
+    async def decode_frame(self, text_data, bytes_data):
+        if bytes_data is not None and self.binary:
+            return msgpack.unpackb(bytes_data)
+        return await super().decode_frame(text_data, bytes_data)
+
+    async def send_json(self, content, close=False):
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb(content), close=close)
+        else:
+            await super().send_json(content, close)
+
+    # --- Mensajes del cliente ---
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict):
+            return
+        if content.get("type") == "SNAPSHOT":
+            ids = content.get("ids")
+            ids = [i for i in ids if isinstance(i, int)] if isinstance(ids, list) else None
+            await self.send_json({"type": "SNAPSHOT", "orders": await order_snapshots(ids, self.station)})
+        elif content.get("type") in self.command_handlers:
+            await self.run_command(content)
+
+    async def command_auth(self, content):
+        self.user = await authenticate_jwt(content.get("token"))
+        return {"user": self.user.get_username()}
+
+    async def _order_command(self, name, content, *args):
+        from rest_framework.exceptions import NotAuthenticated
+        from . import commands
+
+        if self.user is None:
+            raise NotAuthenticated()
+        order = await database_sync_to_async(getattr(commands, name))(_order_id(content), *args)
+        return {"id": order.id, "version": order.version}
+
+    async def command_set_status(self, content):
+        return await self._order_command("set_status", content, content.get("status"))
+
+    async def command_mark_delivered(self, content):
+        return await self._order_command("mark_delivered", content)
+
+    async def command_accept_change(self, content):
+        return await self._order_command("accept_change", content)
+
+    async def command_reject_change(self, content):
+        return await self._order_command("reject_change", content)
 
     # Este método maneja el evento "send.new.order" enviado desde la vista
     async def send_new_order(self, event):
@@ -31,13 +289,33 @@ class KitchenConsumer(AsyncJsonWebsocketConsumer):
             "order": event["order"]
         })
 
-    # Este método maneja el evento "send.status.update"
+    # Pedido completo (lo usaban las vistas antes de ORDER_DELTA)
     async def send_status_update(self, event):
         await self.send_json({
             "type": "STATUS_UPDATE",
             "order": event["order"]
         })
 
+    # Solo los campos que cambiaron, con la versión del pedido
+    async def send_order_delta(self, event):
+        await self.send_json({
+            "type": "ORDER_DELTA",
+            **event["delta"]
+        })
+
+    async def send_order_deleted(self, event):
+        await self.send_json({
+            "type": "ORDER_DELETED",
+            "id": event["id"]
+        })
+
+    # Varios pedidos cambiados a la vez (cerrar mesa, cambios masivos de estado)
+    async def send_orders_batch(self, event):
+        await self.send_json({
+            "type": "STATUS_UPDATE_BATCH",
+            "deltas": event["deltas"]
+        })
+
     # Manejo de alertas de mesero (Si usamos el mismo canal por ahora)
     async def waiter_call(self, event):
         await self.send_json({
@@ -48,7 +326,13 @@ class KitchenConsumer(AsyncJsonWebsocketConsumer):
 
 
 # --- NUEVO CONSUMER PARA CLIENTES EN MESAS ---
-class TableConsumer(AsyncJsonWebsocketConsumer):
+class TableConsumer(CommandsMixin, FastJsonWebsocketConsumer):
+    """
+    Comandos (ver CommandsMixin):
+      CALL_WAITER  {token}: el token de sesión de la mesa, como en la API.
+    """
+    command_handlers = {"CALL_WAITER": "command_call_waiter"}
+
     async def connect(self):
         # Obtenemos el código de la mesa de la URL (ej. M-01)
         # La URL en routing.py es: ws/table/(?P<table_code>...)/
@@ -68,8 +352,18 @@ class TableConsumer(AsyncJsonWebsocketConsumer):
             self.channel_name
         )
 
+    async def receive_json(self, content, **kwargs):
+        if isinstance(content, dict) and content.get("type") in self.command_handlers:
+            await self.run_command(content)
+
+    async def command_call_waiter(self, content):
+        from . import commands
+
+        await database_sync_to_async(commands.call_waiter)(self.table_code, content.get("token"))
+        return {}
+
     # Este método maneja los mensajes enviados desde las vistas (close_table)
     async def table_status_update(self, event):
         # Enviamos el mensaje al WebSocket del cliente (React)
         # event['data'] contiene { type: "TABLE_CLOSED", ... }
-        await self.send_json(event['data'])
\ No newline at end of file
+        await self.send_json(event['data'])
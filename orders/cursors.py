@@ -0,0 +1,41 @@
+# orders/cursors.py
+"""
+Cursores opacos (timestamp, id) compartidos por el listado paginado y por
+/api/orders/changes/: JSON compacto en base64 urlsafe.
+
+Un cursor mal formado o con una fecha sin zona horaria responde 400; comparar
+una fecha naive contra columnas con zona dispararía un error (o un filtro
+silenciosamente corrido) más abajo.
+"""
+import base64
+import json
+from datetime import datetime
+
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+
+
+class InvalidCursor(ParseError):
+    default_detail = 'Cursor inválido.'
+    default_code = 'invalid_cursor'
+
+
+def encode_cursor(timestamp, pk, reverse=False):
+    data = {'t': timestamp.isoformat(), 'i': pk}
+    if reverse:
+        data['r'] = 1
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """(timestamp, id, reverse) o InvalidCursor si el cursor no es válido."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        timestamp = datetime.fromisoformat(data['t'])
+        pk = int(data['i'])
+        reverse = bool(data.get('r'))
+    except (TypeError, ValueError, KeyError, AttributeError, UnicodeEncodeError):
+        raise InvalidCursor()
+    if timezone.is_naive(timestamp):
+        raise InvalidCursor()
+    return timestamp, pk, reverse
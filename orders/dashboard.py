@@ -0,0 +1,200 @@
+# orders/dashboard.py
+"""
+Consultas del Dashboard.
+
+Los pedidos PAID se leen de los rollups diarios (orders/rollups.py); los
+DELIVERED que aún no se pagan son pocos y se agregan en vivo con las mismas
+consultas agrupadas. El número de consultas es constante.
+
+Las series de tiempo se agrupan en SQL con Trunc(..., tzinfo=TIME_ZONE), que
+Django traduce para SQLite, PostgreSQL y MySQL (este último necesita las
+tablas de zonas horarias cargadas, igual que cualquier Trunc con USE_TZ).
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DateField, DateTimeField, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, Order, OrderItem
+from .rollups import item_day_product_sketches, item_day_product_totals, order_day_totals
+from .sketches import DDSketch
+
+TOP_PRODUCTS_LIMIT = 5
+PREP_TIME_CHART_LIMIT = 10
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+SALES_STATUSES = [Order.Status.PAID, Order.Status.DELIVERED]
+PERCENTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))
+
+
+def _minutes(seconds_total, count):
+    """Promedio en minutos redondeado a 1 decimal (0 si no hay dato)."""
+    if not count:
+        return 0
+    return round(seconds_total / count / 60, 1)
+
+
+def _percentiles(sketch):
+    """p50/p90/p99 en minutos (1 decimal) a partir de un DDSketch en segundos."""
+    result = {}
+    for name, q in PERCENTILES:
+        value = sketch.quantile(q)
+        result[name] = round(value / 60, 1) if value is not None else 0
+    return result
+
+
+def _local_bounds(date_from, date_to):
+    """Fechas locales (inclusive) -> rango [inicio, fin) de datetimes aware."""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(date_from, time.min), tz) if date_from else None
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz) if date_to else None
+    return start, end
+
+
+def _filter_created(queryset, start, end, prefix=''):
+    if start:
+        queryset = queryset.filter(**{f'{prefix}created_at__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{prefix}created_at__lt': end})
+    return queryset
+
+
+def _filter_dates(queryset, date_from, date_to):
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    return queryset
+
+
+def _sales_series(granularity, date_from, date_to, start, end, delivered_orders):
+    """Serie de ventas [(bucket, total)] agrupada en SQL según la granularidad."""
+    buckets = defaultdict(lambda: [0, Decimal('0.00')])
+    tz = timezone.get_current_timezone()
+
+    if granularity == 'hour':
+        # Los rollups son diarios: la vista por hora se agrupa sobre Order
+        orders = _filter_created(Order.objects.filter(status__in=SALES_STATUSES), start, end)
+        rows = (
+            orders
+            .annotate(bucket=Trunc('created_at', 'hour', output_field=DateTimeField(), tzinfo=tz))
+            .values('bucket')
+            .annotate(orders_count=Count('id'), total=Sum('total_price'))
+            .order_by()
+        )
+        for row in rows:
+            buckets[timezone.localtime(row['bucket'], tz)] = [row['orders_count'], row['total']]
+    else:
+        paid_rows = (
+            _filter_dates(DailySales.objects.all(), date_from, date_to)
+            .annotate(bucket=Trunc('date', granularity, output_field=DateField()))
+            .values('bucket')
+            .annotate(orders_count=Sum('orders_count'), total=Sum('total_sales'))
+            .order_by()
+        )
+        delivered_rows = (
+            delivered_orders
+            .annotate(bucket=Trunc('created_at', granularity, output_field=DateField(), tzinfo=tz))
+            .values('bucket')
+            .annotate(orders_count=Count('id'), total=Sum('total_price'))
+            .order_by()
+        )
+        for row in list(paid_rows) + list(delivered_rows):
+            buckets[row['bucket']][0] += row['orders_count']
+            buckets[row['bucket']][1] += row['total']
+
+    return [
+        {"date": bucket.isoformat(), "total": total}
+        for bucket, (count, total) in sorted(buckets.items())
+        if count
+    ]
+
+
+def get_dashboard_stats(date_from=None, date_to=None, granularity='day'):
+    """
+    date_from / date_to: fechas locales inclusive (None = sin límite).
+    granularity: 'hour', 'day', 'week' o 'month' para `sales_history`.
+    """
+    start, end = _local_bounds(date_from, date_to)
+
+    # Pedidos entregados pero aún no pagados (todavía no están en el rollup)
+    delivered_orders = _filter_created(
+        Order.objects.filter(status=Order.Status.DELIVERED), start, end
+    )
+    delivered_items = _filter_created(
+        OrderItem.objects.filter(order__status=Order.Status.DELIVERED), start, end, prefix='order__'
+    )
+
+    # 1. KPIs de ventas
+    orders_count, total_sales = 0, Decimal('0.00')
+    paid_days = _filter_dates(DailySales.objects.all(), date_from, date_to).aggregate(
+        orders_count=Sum('orders_count', default=0),
+        total_sales=Sum('total_sales', default=Decimal('0.00')),
+    )
+    orders_count += paid_days['orders_count']
+    total_sales += paid_days['total_sales']
+    for count, total in order_day_totals(delivered_orders).values():
+        orders_count += count
+        total_sales += total
+
+    # 2. Totales por producto: [items, segundos de preparación, items con tiempo]
+    #    y un DDSketch por producto para los percentiles (p50/p90/p99).
+    by_product = defaultdict(lambda: [0, 0.0, 0])
+    sketches = defaultdict(DDSketch)
+    paid_products = _filter_dates(DailyProductSales.objects.all(), date_from, date_to).values_list(
+        'product_name', 'items_count', 'prep_seconds_total', 'prep_count', 'prep_sketch'
+    )
+    for product_name, count, prep_seconds, prep_count, sketch in paid_products:
+        acc = by_product[product_name]
+        acc[0] += count
+        acc[1] += prep_seconds
+        acc[2] += prep_count
+        if sketch:
+            sketches[product_name].merge(DDSketch.from_dict(sketch))
+    for (_, product_name), (count, _, prep_seconds, prep_count) in item_day_product_totals(delivered_items).items():
+        acc = by_product[product_name]
+        acc[0] += count
+        acc[1] += prep_seconds
+        acc[2] += prep_count
+    for (_, product_name), sketch in item_day_product_sketches(delivered_items).items():
+        sketches[product_name].merge(sketch)
+
+    overall_sketch = DDSketch()
+    for sketch in sketches.values():
+        overall_sketch.merge(sketch)
+
+    top_products = sorted(
+        ({"product_name": name, "total": acc[0]} for name, acc in by_product.items() if acc[0]),
+        key=lambda x: (-x['total'], x['product_name'])
+    )[:TOP_PRODUCTS_LIMIT]
+
+    # 3. Tiempos de preparación (ready_at - created_at), ponderados por item.
+    #    Los más lentos primero.
+    slowest = sorted(
+        ((acc[1] / acc[2], name) for name, acc in by_product.items() if acc[2]),
+        key=lambda x: (-x[0], x[1])
+    )[:PREP_TIME_CHART_LIMIT]
+    prep_time_chart = [
+        {"product": name, "minutes": round(avg_seconds / 60, 1), **_percentiles(sketches[name])}
+        for avg_seconds, name in slowest
+    ]
+
+    return {
+        "kpi": {
+            "total_sales": total_sales,
+            "orders_count": orders_count,
+            "avg_prep_time_minutes": _minutes(
+                sum(acc[1] for acc in by_product.values()),
+                sum(acc[2] for acc in by_product.values()),
+            ),
+            "prep_time_percentiles_minutes": _percentiles(overall_sketch),
+        },
+        "top_products": top_products,
+        "prep_time_by_product": prep_time_chart,
+        "sales_history": _sales_series(
+            granularity, date_from, date_to, start, end, delivered_orders
+        ),
+    }
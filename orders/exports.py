@@ -0,0 +1,92 @@
+# orders/exports.py
+"""
+Exportaciones en streaming (XLSX y CSV).
+
+Las filas salen de un `values_list(...).iterator()` con los JOIN resueltos en
+SQL, así que en memoria solo hay un bloque de filas a la vez. El XLSX usa el
+modo write-only de openpyxl y calcula el ancho de columnas con una muestra.
+"""
+import csv
+import itertools
+
+import openpyxl
+from openpyxl.utils import get_column_letter
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+WIDTH_SAMPLE_SIZE = 500
+
+ITEM_COLUMNS = ["Item ID", "Order ID", "Mesa", "Producto", "Precio Unitario", "Fecha de Creación"]
+ORDER_COLUMNS = [
+    "Order ID", "Mesa", "Estado", "Total", "Fecha de Creación",
+    "En preparación", "Listo", "Entregado", "Pagado",
+]
+REVIEW_COLUMNS = ["Review ID", "Order ID", "Producto", "Calificación", "Comentario", "Fecha"]
+
+
+def _local(value):
+    return timezone.localtime(value).strftime("%Y-%m-%d %H:%M") if value else ""
+
+
+def item_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Filas de OrderItem para exportar (mismo formato que el Excel original)."""
+    rows = queryset.values_list(
+        'id', 'order_id', 'order__table__code', 'product_name', 'unit_price', 'order__created_at'
+    )
+    for item_id, order_id, table_code, product_name, unit_price, created_at in rows.iterator(chunk_size=chunk_size):
+        yield [item_id, order_id, table_code or "N/A", product_name, unit_price, _local(created_at)]
+
+
+def order_rows(queryset, chunk_size=CHUNK_SIZE):
+    rows = queryset.values_list(
+        'id', 'table__code', 'status', 'total_price', 'created_at',
+        'preparing_at', 'ready_at', 'delivered_at', 'paid_at',
+    )
+    for order_id, table_code, status, total, *timestamps in rows.iterator(chunk_size=chunk_size):
+        yield [order_id, table_code or "N/A", status, total] + [_local(value) for value in timestamps]
+
+
+def review_rows(queryset, chunk_size=CHUNK_SIZE):
+    rows = queryset.values_list(
+        'id', 'order_item__order_id', 'order_item__product_name', 'rating', 'comment', 'created_at'
+    )
+    for review_id, order_id, product_name, rating, comment, created_at in rows.iterator(chunk_size=chunk_size):
+        yield [review_id, order_id, product_name, rating, comment or "", _local(created_at)]
+
+
+def write_xlsx(fileobj, title, columns, rows, sample_size=WIDTH_SAMPLE_SIZE):
+    """Escribe `rows` (iterable) en `fileobj` como XLSX sin cargar el libro en memoria."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+
+    rows = iter(rows)
+    sample = list(itertools.islice(rows, sample_size))
+
+    # Ancho de columna estimado con el encabezado + la muestra
+    for index, column in enumerate(columns, start=1):
+        values = [column] + [row[index - 1] for row in sample]
+        ws.column_dimensions[get_column_letter(index)].width = max(len(str(v)) for v in values) + 2
+
+    ws.append(columns)
+    for row in itertools.chain(sample, rows):
+        ws.append(row)
+
+    wb.save(fileobj)
+
+
+class _Echo:
+    """Pseudo-buffer: csv.writer escribe y devolvemos la línea tal cual."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_filename(prefix, extension):
+    return f"{prefix}_{timezone.now().strftime('%Y%m%d_%H%M')}.{extension}"
@@ -0,0 +1,100 @@
+# orders/fast_json.py
+"""
+JSON rápido para la API (orders/renderers.py) y los WebSockets
+(consumers.py), con orjson si está instalado (`pip install orjson`) y si no,
+el módulo json estándar.
+
+La salida es la misma que la de JSONRenderer de DRF: compacta, UTF-8 sin
+escapar, datetimes ISO 8601 (UTC como "Z"), UUID como string y, para el
+resto (Decimal, lazy strings, timedelta, QuerySet...), las mismas reglas que
+rest_framework.utils.encoders.JSONEncoder. Lo que orjson no puede codificar
+(p. ej. enteros de más de 64 bits) se reintenta con el módulo estándar.
+
+Como el JSONRenderer estricto de DRF, NaN e Infinity lanzan ValueError (orjson
+los escribiría como null, así que con orjson se recorre el objeto buscándolos).
+Ese recorrido cuesta más que el propio orjson.dumps: quien sabe que su objeto
+no tiene floats (los frames de los WebSockets, armados con representations.py
+y order_deltas) lo salta con dumps(obj, check_floats=False).
+"""
+import json
+import math
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+# El mensaje de json.dumps(..., allow_nan=False)
+OUT_OF_RANGE = 'Out of range float values are not JSON compliant'
+
+if orjson is not None:
+    # Claves no string (p. ej. {order_id: error}) como las convierte json
+    ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+_encoder = None
+
+
+def _default(obj):
+    # El encoder de DRF se importa aquí: este módulo lo usa consumers.py,
+    # que se importa antes de cargar la configuración (asgi.py)
+    global _encoder
+    if _encoder is None:
+        from rest_framework.utils.encoders import JSONEncoder
+        _encoder = JSONEncoder()
+    value = _encoder.default(obj)
+    # p. ej. Decimal('NaN'), que el encoder de DRF pasa a float: se reintenta
+    # con json, que lanza el ValueError
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ValueError(OUT_OF_RANGE)
+    return value
+
+
+def _has_non_finite(values):
+    # orjson escribe NaN/Infinity como null sin avisar. Recorrido recursivo con
+    # los casos frecuentes primero (str, None, int)
+    for value in values:
+        kind = type(value)
+        if kind is str or value is None or kind is int or kind is bool:
+            continue
+        if isinstance(value, dict):
+            if _has_non_finite(value.values()):
+                return True
+        elif isinstance(value, (list, tuple)):
+            if _has_non_finite(value):
+                return True
+        elif isinstance(value, float) and not math.isfinite(value):
+            return True
+    return False
+
+
+def _stdlib_dumps(obj):
+    from rest_framework.utils.encoders import JSONEncoder
+
+    return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+def dumps(obj, check_floats=True):
+    """
+    `obj` como JSON (bytes UTF-8); ValueError si tiene NaN o Infinity.
+    check_floats=False solo si `obj` no puede tener floats: con orjson no se
+    verifica y un NaN saldría como null.
+    """
+    if orjson is not None:
+        try:
+            ret = orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            pass
+        else:
+            if check_floats and _has_non_finite((obj,)):
+                raise ValueError(OUT_OF_RANGE)
+            return ret
+    return _stdlib_dumps(obj)
+
+
+def loads(data):
+    """JSON (str o bytes UTF-8) a objetos de Python; ValueError si no es válido."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,140 @@
+# orders/jobs.py
+"""
+Reportes en segundo plano.
+
+El admin solo encola un ReportJob (una fila); `manage.py run_report_worker`
+los toma y los ejecuta en un pool de procesos, así los workers web quedan
+libres para los meseros durante el servicio.
+"""
+import io
+import itertools
+import os
+import traceback
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import close_old_connections
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+from .exports import (
+    ITEM_COLUMNS, ORDER_COLUMNS, REVIEW_COLUMNS, csv_lines, export_filename,
+    item_rows, order_rows, review_rows, write_xlsx,
+)
+from .models import Order, OrderItem, ReportJob, Review
+
+# Cada cuántas filas se guarda el avance en la base
+PROGRESS_EVERY = 5000
+# PKs por consulta al exportar una selección (límite de parámetros de SQLite)
+IDS_PER_QUERY = 500
+
+# kind -> (modelo, título de la hoja, prefijo del archivo, columnas, generador de filas)
+DATASETS = {
+    ReportJob.Kind.ORDERS: (Order, "Pedidos", "reporte_pedidos", ORDER_COLUMNS, order_rows),
+    ReportJob.Kind.ITEMS: (OrderItem, "Items de Pedidos", "reporte_items", ITEM_COLUMNS, item_rows),
+    ReportJob.Kind.REVIEWS: (Review, "Calificaciones", "reporte_calificaciones", REVIEW_COLUMNS, review_rows),
+}
+
+
+def enqueue_report(kind, file_format=ReportJob.Format.XLSX, queryset=None, user=None, filters=None):
+    """
+    Encola un reporte. Las filas a exportar son las de `queryset` (se guardan
+    sus PKs, para las filas marcadas a mano) o las del changelist del admin
+    con `filters` (sus parámetros GET, para "seleccionar todo"); sin ninguno
+    de los dos, todas. El worker vuelve a armar la consulta.
+    """
+    return ReportJob.objects.create(
+        kind=kind,
+        file_format=file_format,
+        object_ids=list(queryset.order_by('pk').values_list('pk', flat=True)) if queryset is not None else None,
+        filters=filters,
+        requested_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def claim_job():
+    """Toma el siguiente job en cola (UPDATE condicional: dos workers no toman el mismo)."""
+    for job_id in ReportJob.objects.filter(status=ReportJob.Status.PENDING).order_by('id').values_list('id', flat=True)[:10]:
+        claimed = ReportJob.objects.filter(pk=job_id, status=ReportJob.Status.PENDING).update(
+            status=ReportJob.Status.RUNNING, started_at=timezone.now(), error=''
+        )
+        if claimed:
+            return job_id
+    return None
+
+
+def _changelist_queryset(job, model):
+    # La misma consulta que el changelist del admin con esos filtros (búsqueda,
+    # list_filter, get_queryset), vista por quien pidió el reporte
+    from django.contrib import admin
+
+    if job.requested_by is None:
+        raise ValueError("El usuario que pidió el reporte ya no existe.")
+    request = HttpRequest()
+    request.method = 'GET'
+    request.GET = QueryDict(mutable=True)
+    for key, values in job.filters.items():
+        request.GET.setlist(key, values)
+    request.user = job.requested_by
+    model_admin = admin.site._registry[model]
+    return model_admin.get_changelist_instance(request).get_queryset(request)
+
+
+def _querysets_for(job, model):
+    """Consultas que cubren las filas del job (la selección, por bloques de PKs)."""
+    if job.filters is not None:
+        return [_changelist_queryset(job, model).order_by('pk')]
+    if job.object_ids is None:
+        return [model.objects.order_by('pk')]
+    ids = [int(pk) for pk in job.object_ids]
+    return [
+        model.objects.filter(pk__in=ids[start:start + IDS_PER_QUERY]).order_by('pk')
+        for start in range(0, len(ids), IDS_PER_QUERY)
+    ]
+
+
+def _with_progress(job_id, rows):
+    for count, row in enumerate(rows, start=1):
+        yield row
+        if count % PROGRESS_EVERY == 0:
+            ReportJob.objects.filter(pk=job_id).update(progress=count)
+
+
+def run_job(job_id):
+    """Ejecuta un job ya tomado (status RUNNING). Corre dentro del proceso del pool."""
+    close_old_connections()
+    job = ReportJob.objects.get(pk=job_id)
+    try:
+        if job.kind == ReportJob.Kind.ROLLUP:
+            call_command('rebuild_sales_rollup', stdout=io.StringIO())
+            ReportJob.objects.filter(pk=job_id).update(status=ReportJob.Status.DONE, finished_at=timezone.now())
+            return job_id
+
+        model, title, prefix, columns, row_fn = DATASETS[job.kind]
+        querysets = _querysets_for(job, model)
+        # Con selección, el total es lo seleccionado (lo borrado después no se exporta)
+        total = querysets[0].count() if job.object_ids is None else len(job.object_ids)
+        ReportJob.objects.filter(pk=job_id).update(total=total)
+
+        os.makedirs(settings.REPORTS_ROOT, exist_ok=True)
+        extension = job.file_format.lower()
+        path = os.path.join(settings.REPORTS_ROOT, f"{job_id}_{export_filename(prefix, extension)}")
+        rows = _with_progress(job_id, itertools.chain.from_iterable(row_fn(queryset) for queryset in querysets))
+
+        if job.file_format == ReportJob.Format.CSV:
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                f.writelines(csv_lines(columns, rows))
+        else:
+            with open(path, 'wb') as f:
+                write_xlsx(f, title, columns, rows)
+
+        ReportJob.objects.filter(pk=job_id).update(
+            status=ReportJob.Status.DONE, finished_at=timezone.now(), file_path=path, progress=total
+        )
+    except Exception:
+        ReportJob.objects.filter(pk=job_id).update(
+            status=ReportJob.Status.FAILED, finished_at=timezone.now(), error=traceback.format_exc()
+        )
+    finally:
+        close_old_connections()
+    return job_id
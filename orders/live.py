@@ -0,0 +1,152 @@
+# orders/live.py
+"""
+Vista en memoria de los pedidos activos (no PAID) para el snapshot que
+KitchenConsumer manda al conectarse.
+
+Hay una por proceso. Escucha el grupo "kitchen" con su propio canal y aplica
+los mismos eventos que reciben las pantallas (NEW_ORDER, deltas, lotes y
+borrados), ignorando los que traen una versión vieja. Así, tras un deploy o
+un corte de Wi-Fi, cien pantallas reconectando no hacen cien consultas: el
+snapshot se arma una vez y el frame ya codificado (JSON o msgpack, por
+estación) se reutiliza hasta el siguiente cambio.
+
+Si llega un delta de un pedido que no conoce, o pasó SNAPSHOT_TTL desde la
+última carga, se recarga desde la base en la siguiente conexión.
+"""
+import asyncio
+import time
+
+import msgpack
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+
+SNAPSHOT_TTL = 60  # segundos
+PAID = 'PAID'
+
+
+class ActiveOrders:
+    def __init__(self):
+        self._reset(None, None)
+
+    def _reset(self, loop, channel_layer):
+        self._loop = loop
+        self._layer = channel_layer
+        self._lock = asyncio.Lock() if loop else None
+        self._channel = None
+        self._listener = None
+        self._orders = {}
+        self._frames = {}
+        self._generation = 0
+        self._loaded_at = None
+        self._pending = None
+
+    async def _ensure_listening(self):
+        # En tests cada async_to_sync usa otro event loop (y otro channel layer)
+        loop = asyncio.get_running_loop()
+        channel_layer = get_channel_layer()
+        if self._loop is loop and self._layer is channel_layer and self._listener and not self._listener.done():
+            return
+        from .consumers import KITCHEN_GROUP_NAME
+
+        self._reset(loop, channel_layer)
+        self._channel = await channel_layer.new_channel()
+        await channel_layer.group_add(KITCHEN_GROUP_NAME, self._channel)
+        self._listener = loop.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            message = await self._layer.receive(self._channel)
+            if self._pending is not None:
+                self._pending.append(message)  # Se aplican al terminar la carga
+            else:
+                self._apply(message)
+
+    async def _reload(self):
+        from .consumers import KITCHEN_GROUP_NAME, order_snapshots
+
+        async with self._lock:
+            if self._is_fresh():
+                return
+            self._pending = []
+            try:
+                # También renueva la membresía del grupo (expira en channels_redis)
+                await self._layer.group_add(KITCHEN_GROUP_NAME, self._channel)
+                orders = await order_snapshots()
+                self._orders = {order['id']: dict(order) for order in orders}
+            finally:
+                pending, self._pending = self._pending, None
+            for message in pending:
+                self._apply(message)
+            self._changed()
+            self._loaded_at = time.monotonic()
+
+    def _is_fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < SNAPSHOT_TTL
+
+    # --- Eventos ---
+
+    def _apply(self, message):
+        kind = message.get('type')
+        if kind in ('send.new.order', 'send.status.update'):
+            self._upsert(message['order'])
+        elif kind == 'send.order.delta':
+            self._apply_delta(message['delta'])
+        elif kind == 'send.orders.batch':
+            for delta in message['deltas']:
+                self._apply_delta(delta)
+        elif kind == 'send.order.deleted':
+            self._orders.pop(message['id'], None)
+        else:
+            return
+        self._changed()
+
+    def _changed(self):
+        self._frames.clear()
+        self._generation += 1
+
+    def _upsert(self, order):
+        current = self._orders.get(order['id'])
+        if current is not None and current['version'] >= order['version']:
+            return
+        if order['status'] == PAID:
+            self._orders.pop(order['id'], None)
+        else:
+            self._orders[order['id']] = dict(order)
+
+    def _apply_delta(self, delta):
+        current = self._orders.get(delta['id'])
+        if current is None:
+            # No lo conocemos (p. ej. volvió de PAID): se recarga en la próxima conexión
+            if delta['changes'].get('status') != PAID:
+                self._loaded_at = None
+            return
+        if current['version'] >= delta['version']:
+            return
+        self._upsert({**current, **delta['changes'], 'version': delta['version']})
+
+    # --- Snapshot ---
+
+    async def snapshot_frame(self, station, binary, encode_json):
+        """Frame SNAPSHOT ya codificado (bytes si `binary`) para la vista `station`."""
+        await self._ensure_listening()
+        if not self._is_fresh():
+            await self._reload()
+
+        key = (station, binary)
+        if key in self._frames:
+            return self._frames[key]
+
+        generation = self._generation
+        orders = sorted(self._orders.values(), key=lambda o: (o['created_at'], o['id']), reverse=True)
+        if station:
+            from .stations import filter_for_station
+            orders = await database_sync_to_async(filter_for_station)(orders, station)
+        content = {"type": "SNAPSHOT", "orders": orders}
+        frame = msgpack.packb(content) if binary else await encode_json(content)
+        if generation == self._generation:
+            # Si mientras tanto llegó un evento, este frame ya no se guarda
+            self._frames[key] = frame
+        return frame
+
+
+active_orders = ActiveOrders()
@@ -0,0 +1,94 @@
+# Utilidades compartidas por los comandos bench_* (el "_" evita que Django
+# lo registre como comando).
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection
+from django.test.utils import override_settings
+
+from orders.models import Order, OrderItem, Table
+
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """
+    Crea una base de datos de prueba desechable (igual que `manage.py test`)
+    y apunta la conexión a ella; al salir se destruye. Así los benchmarks
+    nunca escriben en la base real.
+    """
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        with override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def best_time(function, repeat):
+    """El menor tiempo (segundos) de `repeat` llamadas a `function`."""
+    best = float('inf')
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def seed_active_orders(count, items_per_order, seed=0):
+    """`count` pedidos activos de 20 mesas, con `items_per_order` items cada uno."""
+    products = [('Jugo de Fresa', '8.50'), ('Club Sandwich', '15.00'), ('Jugo de Mango', '9.00'), ('Café', '6.50')]
+    statuses = ['NEW', 'PREPARING', 'READY', 'DELIVERED', 'CHANGE_REQUESTED']
+    rng = random.Random(seed)
+    tables = Table.objects.bulk_create([Table(code=f'B-{i:03d}') for i in range(20)])
+    orders = Order.objects.bulk_create([
+        Order(table=tables[i % len(tables)], status=rng.choice(statuses), total_price=Decimal('0.00'))
+        for i in range(count)
+    ])
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, product_name=name, unit_price=Decimal(price),
+            notes=rng.choice([None, '', 'Sin azúcar']), selected_options={'tamaño': 'grande'},
+        )
+        for order in orders
+        for name, price in rng.sample(products * items_per_order, items_per_order)
+    ])
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+@contextmanager
+def without_auto_now(*models):
+    """
+    Desactiva auto_now/auto_now_add mientras se cargan datos históricos: si
+    no, bulk_create pisa created_at/updated_at con la hora actual.
+    """
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def analyze_tables(*models):
+    """Actualiza las estadísticas del planificador después de cargar datos."""
+    with connection.cursor() as cursor:
+        for model in models:
+            table = connection.ops.quote_name(model._meta.db_table)
+            if connection.vendor == 'mysql':
+                cursor.execute(f"ANALYZE TABLE {table}")
+            else:
+                cursor.execute(f"ANALYZE {table}")
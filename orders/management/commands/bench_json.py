@@ -0,0 +1,67 @@
+import io
+import json
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from orders import fast_json
+from orders.models import Order
+from orders.renderers import FastJSONParser, FastJSONRenderer
+from orders.representations import serialize_order_rows
+from orders.views import OrderViewSet
+from orders.serializers import order_deltas
+
+from ._bench import best_time, scratch_database, seed_active_orders
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el JSON de DRF y del módulo json con orders/fast_json.py en el listado de pedidos '
+        'y en los mensajes de la cocina (base desechable)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500, help='Pedidos activos.')
+        parser.add_argument('--items', type=int, default=3, help='Items por pedido.')
+        parser.add_argument('--repeat', type=int, default=20, help='Repeticiones (se informa la mejor).')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            seed_active_orders(options['orders'], options['items'])
+            queryset = Order.objects.select_related('table').prefetch_related('items').order_by('-created_at', '-id')
+            order_list = serialize_order_rows(queryset)
+            orders = list(queryset)
+            deltas = order_deltas(orders, ['status', 'status_display', 'ready_at'])
+        new_orders = [{"type": "NEW_ORDER", "order": order} for order in order_list]
+        batch = {"type": "STATUS_UPDATE_BATCH", "deltas": deltas}
+
+        drf, fast = JSONRenderer(), FastJSONRenderer()
+        context = {'view': OrderViewSet()}
+        body = drf.render(order_list)
+        assert fast.render(order_list) == fast.render(order_list, renderer_context=context) == body
+        cases = [
+            # (payload, stdlib/DRF, fast_json)
+            ('GET /api/orders/ (render)',
+             lambda: drf.render(order_list, renderer_context=context),
+             lambda: fast.render(order_list, renderer_context=context)),
+            ('POST JSON (parse del listado)',
+             lambda: JSONParser().parse(io.BytesIO(body)), lambda: FastJSONParser().parse(io.BytesIO(body))),
+            # AsyncJsonWebsocketConsumer.encode_json es json.dumps(content); el de
+            # FastJsonWebsocketConsumer no busca NaN (los frames no tienen floats)
+            ('NEW_ORDER x pedido (WebSocket)',
+             lambda: [json.dumps(m) for m in new_orders],
+             lambda: [fast_json.dumps(m, check_floats=False).decode() for m in new_orders]),
+            ('STATUS_UPDATE_BATCH (WebSocket)',
+             lambda: json.dumps(batch), lambda: fast_json.dumps(batch, check_floats=False).decode()),
+        ]
+
+        self.stdout.write(
+            f"Backend: {fast_json.BACKEND}. {len(order_list)} pedidos x {options['items']} items "
+            f"({len(body) / 1024:.0f} KiB), mejor de {options['repeat']}"
+        )
+        self.stdout.write(f"  {'':<34} {'json/DRF':>10} {'fast_json':>10} {'aceleración':>12}")
+        for name, baseline, candidate in cases:
+            slow = best_time(baseline, options['repeat'])
+            quick = best_time(candidate, options['repeat'])
+            self.stdout.write(f"  {name:<34} {slow * 1000:>7.2f} ms {quick * 1000:>7.2f} ms {slow / quick:>11.1f}x")
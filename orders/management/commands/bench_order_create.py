@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from orders.catalog import product_catalog
+from orders.models import Product, Table
+from orders.serializers import OrderSerializer
+
+from ._bench import scratch_database
+
+
+class Command(BaseCommand):
+    help = 'Mide cuántas consultas SQL cuesta crear un pedido según la cantidad de items (base desechable)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,10,20,50', help='Cantidades de items por pedido.')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+
+        with scratch_database():
+            products = [
+                Product.objects.create(name=f"Producto {i}", category='JUICE', base_price=Decimal('10.00'))
+                for i in range(max(sizes))
+            ]
+            table = Table.objects.create(code='BENCH-01')
+
+            self.stdout.write(f"{'items':>6} {'consultas (frío)':>17} {'a Product':>10} {'consultas (tibio)':>18} {'a Product':>10}")
+            for size in sizes:
+                items = [{"product_name": p.name} for p in products[:size]]
+                product_catalog.invalidate()
+                cold = self._create(table, items)
+                warm = self._create(table, items)
+                self.stdout.write(
+                    f"{size:>6} {len(cold):>17} {self._product_queries(cold):>10} "
+                    f"{len(warm):>18} {self._product_queries(warm):>10}"
+                )
+
+    def _create(self, table, items):
+        serializer = OrderSerializer(data={"table": table.id, "items": items})
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as ctx:
+            serializer.save()
+        return ctx.captured_queries
+
+    @staticmethod
+    def _product_queries(queries):
+        return sum(1 for q in queries if 'FROM "orders_product"' in q['sql'] or 'FROM `orders_product`' in q['sql'])
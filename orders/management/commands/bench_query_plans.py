@@ -0,0 +1,156 @@
+import contextlib
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from orders.models import Order, Table
+
+from ._bench import analyze_tables, scratch_database, without_auto_now
+
+ACTIVE = [
+    Order.Status.NEW, Order.Status.WAITER_EDITING, Order.Status.PREPARING,
+    Order.Status.CHANGE_REQUESTED, Order.Status.READY, Order.Status.DELIVERED,
+]
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Imprime EXPLAIN y tiempos de las consultas calientes sobre Order, '
+        'con y sin los índices del modelo (--compare). Sin --seed solo consulta la base configurada; '
+        'con --seed N carga y mide en una base desechable (obligatorio para --compare).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Mide sobre una base desechable con N pedidos sintéticos (solo Order, sin items).')
+        parser.add_argument('--days', type=int, default=365, help='Días de historia para --seed.')
+        parser.add_argument('--tables', type=int, default=40, help='Mesas a usar para --seed.')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20, help='Repeticiones por consulta.')
+        parser.add_argument('--compare', action='store_true',
+                            help='Mide también sin los índices de Order (los borra de la base desechable; requiere --seed).')
+
+    def handle(self, *args, **options):
+        # --compare borra índices: en SQLite o MySQL el DDL no se revierte, así que
+        # nunca se ejecuta sobre la base configurada.
+        if options['compare'] and not options['seed']:
+            raise CommandError("--compare borra los índices de Order: úselo solo con --seed N (base desechable).")
+        # Los datos sintéticos nunca van a la base configurada
+        with scratch_database() if options['seed'] else contextlib.nullcontext():
+            if options['seed']:
+                self._seed(options['seed'], options['days'], options['tables'], options['chunk_size'])
+            self._run(options)
+
+    def _run(self, options):
+        table_id = Table.objects.order_by('?').values_list('id', flat=True).first()
+        if table_id is None or not Order.objects.exists():
+            self.stderr.write("No hay datos: use --seed N o populate_data.")
+            return
+
+        queries = self._hot_queries(table_id)
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Con índices ({connection.vendor}, {Order.objects.count()} pedidos)"))
+        with_idx = self._measure(queries, options['repeat'])
+
+        if options['compare']:
+            self.stdout.write(self.style.MIGRATE_HEADING("Sin los índices de Order"))
+            without_idx = self._measure_without_indexes(queries, options['repeat'])
+            self.stdout.write(self.style.MIGRATE_HEADING("Resumen (mediana en ms)"))
+            for name in queries:
+                self.stdout.write(f"  {name:<28} {without_idx[name]:>10.2f} -> {with_idx[name]:>10.2f}")
+
+    # --- Consultas medidas (las mismas que arman las vistas) ---
+
+    def _hot_queries(self, table_id):
+        now = timezone.now()
+        newest = Order.objects.order_by('-created_at', '-id').values_list('created_at', 'id')[1000:1001].first()
+        cursor_filter = Q()
+        if newest:
+            cursor_filter = Q(created_at__lt=newest[0]) | Q(created_at=newest[0], id__lt=newest[1])
+        return {
+            'kitchen_active_list': lambda: (
+                Order.objects.filter(status__in=ACTIVE).exclude(status=Order.Status.PAID).order_by('-created_at')
+            ),
+            'close_table_unpaid': lambda: Order.objects.filter(table_id=table_id).filter(~Q(status=Order.Status.PAID)),
+            'check_session_recent_paid': lambda: Order.objects.filter(
+                table_id=table_id, status=Order.Status.PAID, updated_at__gte=now - timedelta(minutes=30)
+            ),
+            'orders_page_cursor': lambda: Order.objects.filter(cursor_filter).order_by('-created_at', '-id')[:50],
+            'dashboard_hourly_range': lambda: Order.objects.filter(
+                status__in=[Order.Status.PAID, Order.Status.DELIVERED],
+                created_at__gte=now - timedelta(days=1),
+            ).values_list('created_at', 'total_price'),
+        }
+
+    def _measure(self, queries, repeat):
+        medians = {}
+        for name, build in queries.items():
+            self.stdout.write(self.style.SQL_KEYWORD(f"\n[{name}]"))
+            self.stdout.write(build().explain())
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(build())
+                timings.append((time.perf_counter() - start) * 1000)
+            medians[name] = statistics.median(timings)
+            self.stdout.write(f"mediana {medians[name]:.2f} ms, p90 {sorted(timings)[int(0.9 * (len(timings) - 1))]:.2f} ms")
+        return medians
+
+    def _measure_without_indexes(self, queries, repeat):
+        with connection.cursor() as cursor:
+            existing = connection.introspection.get_constraints(cursor, Order._meta.db_table)
+        indexes = [index for index in Order._meta.indexes if index.name in existing]
+        result = {}
+        try:
+            # SQLite exige desactivar las FK antes de abrir la transacción del DDL
+            with connection.constraint_checks_disabled(), transaction.atomic():
+                with connection.schema_editor(atomic=False) as editor:
+                    for index in indexes:
+                        editor.remove_index(Order, index)
+                result = self._measure(queries, repeat)
+                if connection.features.can_rollback_ddl:
+                    raise _Rollback
+                with connection.schema_editor(atomic=False) as editor:
+                    for index in indexes:
+                        editor.add_index(Order, index)
+        except _Rollback:
+            pass
+        return result
+
+    # --- Carga sintética ---
+
+    def _seed(self, total, days, tables_count, chunk_size):
+        tables = list(Table.objects.all()[:tables_count])
+        for i in range(len(tables), tables_count):
+            tables.append(Table.objects.create(code=f"B-{i:03d}"))
+
+        now = timezone.now()
+        start = time.perf_counter()
+        with without_auto_now(Order):
+            created = 0
+            while created < total:
+                batch = []
+                for _ in range(min(chunk_size, total - created)):
+                    created_at = now - timedelta(seconds=random.randint(0, days * 86400))
+                    # ~0.1% activos, el resto histórico pagado
+                    status = random.choice(ACTIVE) if random.random() < 0.001 else Order.Status.PAID
+                    paid_at = created_at + timedelta(minutes=45) if status == Order.Status.PAID else None
+                    batch.append(Order(
+                        table=random.choice(tables), status=status, total_price=Decimal(random.randint(10, 120)),
+                        created_at=created_at, updated_at=paid_at or created_at, paid_at=paid_at,
+                    ))
+                Order.objects.bulk_create(batch)
+                created += len(batch)
+                self.stdout.write(f"\r{created}/{total} pedidos", ending='')
+        analyze_tables(Order)
+        self.stdout.write(f"\nCarga: {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from orders.models import Order
+from orders.representations import serialize_order_rows, serialize_orders
+from orders.serializers import OrderSerializer
+
+from ._bench import best_time, scratch_database, seed_active_orders
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara OrderSerializer con la representación sin DRF (orders/representations.py) '
+        'listando pedidos activos (base desechable)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500, help='Pedidos activos.')
+        parser.add_argument('--items', type=int, default=3, help='Items por pedido.')
+        parser.add_argument('--repeat', type=int, default=5, help='Repeticiones (se informa la mejor).')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            seed_active_orders(options['orders'], options['items'])
+            queryset = (
+                Order.objects.select_related('table').prefetch_related('items')
+                .exclude(status=Order.Status.PAID).order_by('-created_at', '-id')
+            )
+            loaded = list(queryset)
+            assert serialize_order_rows(queryset) == OrderSerializer(loaded, many=True).data
+
+            # Los dos primeros incluyen las consultas; los otros dos solo serializan
+            cases = [
+                ('OrderSerializer (consulta + serializar)', lambda: OrderSerializer(queryset.all(), many=True).data),
+                ('serialize_order_rows (values_list)', lambda: serialize_order_rows(queryset)),
+                ('OrderSerializer (modelos ya cargados)', lambda: OrderSerializer(loaded, many=True).data),
+                ('serialize_orders (modelos ya cargados)', lambda: serialize_orders(loaded)),
+            ]
+            results = [best_time(function, options['repeat']) for _, function in cases]
+
+        self.stdout.write(f"{options['orders']} pedidos x {options['items']} items, mejor de {options['repeat']}")
+        for (name, _), seconds in zip(cases, results):
+            self.stdout.write(f"  {name:<42} {seconds * 1000:>9.1f} ms")
+        self.stdout.write(
+            f"Aceleración: {results[0] / results[1]:.1f}x con consultas, {results[2] / results[3]:.1f}x solo serializando"
+        )
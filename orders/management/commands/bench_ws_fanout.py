@@ -0,0 +1,184 @@
+import asyncio
+import contextlib
+import io
+import json
+import time
+import tracemalloc
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from orders.models import Product, Table
+
+from ._bench import percentile, scratch_database
+
+PRODUCTS = [('Jugo de Fresa', 'JUICE'), ('Club Sandwich', 'SANDWICH'), ('Jugo de Mango', 'JUICE')]
+
+
+class Command(BaseCommand):
+    help = (
+        'Abre N sockets de cocina y M de mesa contra la app ASGI, dispara ráfagas de pedidos y cambios '
+        'de estado por la API y mide la latencia del broadcast (base desechable)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kitchens', type=int, default=50, help='Sockets ws/kitchen/.')
+        parser.add_argument('--tables', type=int, default=20, help='Mesas, con un socket ws/table/ cada una.')
+        parser.add_argument('--bursts', type=int, default=5, help='Cantidad de ráfagas.')
+        parser.add_argument('--burst-size', type=int, default=20, help='Pedidos creados por ráfaga.')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Segundos máximos esperando mensajes.')
+        parser.add_argument(
+            '--redis', metavar='URL',
+            help='Usar channels_redis contra este Redis local (p. ej. redis://localhost:6379/15) y el '
+                 'outbox en segundo plano, en vez del channel layer en memoria.'
+        )
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            layers = settings.CHANNEL_LAYERS
+            if options['redis']:
+                layers = {"default": {
+                    "BACKEND": "channels_redis.core.RedisChannelLayer",
+                    "CONFIG": {"hosts": [options['redis']]},
+                }}
+            # En memoria el outbox tiene que enviar desde el mismo event loop
+            # que los consumers, así que va en modo eager (sin COALESCE_WINDOW)
+            with override_settings(CHANNEL_LAYERS=layers, ORDERS_OUTBOX_EAGER=not options['redis']):
+                self.host = next((h for h in settings.ALLOWED_HOSTS if h != '*' and not h.startswith('.')), 'localhost')
+                for name, category in PRODUCTS:
+                    Product.objects.create(name=name, category=category, base_price=Decimal('10.00'))
+                self.tables = [Table.objects.create(code=f'B-{i:03d}') for i in range(max(options['tables'], 1))]
+                async_to_sync(self._run)(options)
+
+    async def _run(self, options):
+        from main.asgi import application
+
+        self.application = application
+        layer = 'redis + outbox en segundo plano' if options['redis'] else 'en memoria + outbox eager'
+        self.stdout.write(f"Channel layer: {layer}")
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        with contextlib.redirect_stdout(io.StringIO()):
+            kitchens = [await self._connect('/ws/kitchen/') for _ in range(options['kitchens'])]
+            tables = [await self._connect(f'/ws/table/{t.code}/', t.code) for t in self.tables[:options['tables']]]
+            for kitchen in kitchens:
+                await kitchen.receive_output(timeout=options['timeout'])  # SNAPSHOT inicial
+        connections = len(kitchens) + len(tables)
+        per_connection = (tracemalloc.get_traced_memory()[0] - before) / max(connections, 1)
+        tracemalloc.stop()
+
+        # Cada cliente anota (tipo, clave, instante) de lo que recibe; las
+        # claves se cruzan después con el instante en que salió cada request
+        received = [[] for _ in range(connections)]
+        receivers = [
+            asyncio.ensure_future(self._receive(communicator, received[i]))
+            for i, communicator in enumerate(kitchens + tables)
+        ]
+        sent = {}
+
+        started = time.perf_counter()
+        order_ids = []
+        order_tables = {}
+        for burst in range(options['bursts']):
+            for i in range(options['burst_size']):
+                table = self.tables[i % len(self.tables)]
+                name = PRODUCTS[i % len(PRODUCTS)][0]
+                t0 = time.perf_counter()
+                order = await self._request('POST', '/api/orders/', {'table': table.id, 'items': [{'product_name': name}]})
+                sent[('NEW_ORDER', order['id'])] = t0
+                order_ids.append(order['id'])
+                order_tables[order['id']] = table.id
+            for new_status in ('PREPARING', 'READY'):
+                for order_id in order_ids[-options['burst_size']:]:
+                    t0 = time.perf_counter()
+                    await self._request('PATCH', f'/api/orders/{order_id}/set_status/', {'status': new_status})
+                    sent[(f'ORDER_DELTA:{new_status}', order_id)] = t0
+        used_tables = self.tables[:min(len(self.tables), options['burst_size'])] if order_ids else []
+        for table in used_tables:
+            t0 = time.perf_counter()
+            await self._request('POST', '/api/orders/close-table/', {'table_id': table.id})
+            sent[('STATUS_UPDATE_BATCH', table.id)] = t0
+            sent[('TABLE_CLOSED', table.code)] = t0
+
+        expected_kitchen = len(order_ids) * 3 + len(used_tables)
+        expected_table = {t.code: 1 for t in used_tables}
+        deadline = time.perf_counter() + options['timeout']
+        while time.perf_counter() < deadline:
+            kitchens_done = all(len(r) >= expected_kitchen for r in received[:len(kitchens)])
+            tables_done = all(len(r) >= expected_table.get(c.table_code, 0) for r, c in zip(received[len(kitchens):], tables))
+            if kitchens_done and tables_done:
+                break
+            await asyncio.sleep(0.01)
+        finished = max((t for r in received for _, _, t in r), default=started)
+
+        for receiver in receivers:
+            receiver.cancel()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for communicator in kitchens + tables:
+                await communicator.disconnect()
+
+        latencies = []
+        for messages in received:
+            for kind, key, at in messages:
+                if kind == 'STATUS_UPDATE_BATCH':
+                    key = order_tables.get(key)
+                if (kind, key) in sent:
+                    latencies.append((at - sent[(kind, key)]) * 1000)
+        latencies.sort()
+        total = sum(len(r) for r in received)
+        expected = expected_kitchen * len(kitchens) + sum(expected_table.get(c.table_code, 0) for c in tables)
+
+        self.stdout.write(f"Conexiones: {len(kitchens)} cocina + {len(tables)} mesa, "
+                          f"{per_connection / 1024:.1f} KiB por conexión")
+        self.stdout.write(f"Requests: {len(sent) - len(used_tables)}, mensajes entregados: {total}/{expected}")
+        elapsed = max(finished - started, 1e-9)
+        self.stdout.write(f"Duración: {elapsed:.2f} s, {total / elapsed:.0f} mensajes/s")
+        self.stdout.write(
+            f"Latencia del broadcast (ms): p50 {percentile(latencies, 0.50):.1f}  p90 {percentile(latencies, 0.90):.1f}  "
+            f"p99 {percentile(latencies, 0.99):.1f}  máx {latencies[-1] if latencies else 0:.1f}"
+        )
+
+    async def _connect(self, path, table_code=None):
+        communicator = WebsocketCommunicator(self.application, path, headers=[
+            (b'host', self.host.encode()), (b'origin', f'http://{self.host}'.encode()),
+        ])
+        connected, _ = await communicator.connect(timeout=10)
+        if not connected:
+            raise RuntimeError(f"No se pudo conectar a {path}")
+        communicator.table_code = table_code
+        return communicator
+
+    async def _receive(self, communicator, received):
+        while True:
+            output = await communicator.receive_output(timeout=3600)
+            at = time.perf_counter()
+            message = json.loads(output['text'])
+            kind = message['type']
+            if kind == 'NEW_ORDER':
+                received.append((kind, message['order']['id'], at))
+            elif kind == 'ORDER_DELTA':
+                received.append((f"{kind}:{message['changes'].get('status')}", message['id'], at))
+            elif kind == 'STATUS_UPDATE_BATCH':
+                # Un lote por mesa cerrada: se identifica por el primer pedido
+                received.append((kind, message['deltas'][0]['id'], at))
+            elif kind == 'TABLE_CLOSED':
+                received.append((kind, communicator.table_code, at))
+
+    async def _request(self, method, path, data):
+        body = json.dumps(data).encode()
+        communicator = HttpCommunicator(self.application, method, path, body=body, headers=[
+            (b'host', self.host.encode()), (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ])
+        response = await communicator.get_response(timeout=30)
+        # Cierra la request como lo haría el servidor (si no, Django deja la tarea que espera el disconnect)
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(timeout=30)
+        if response['status'] >= 400:
+            raise RuntimeError(f"{method} {path}: {response['status']} {response['body'][:200]!r}")
+        return json.loads(response['body']) if response['body'] else {}
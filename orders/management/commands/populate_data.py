@@ -1,105 +1,291 @@
+import multiprocessing
 import random
-from datetime import timedelta
+import time
+import uuid
+from datetime import datetime, timedelta
+from datetime import time as dt_time
+from decimal import Decimal
+
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
 from django.utils import timezone
-from decimal import Decimal
-from orders.models import Product, Table, Order, OrderItem
+
+from orders.models import Order, OrderItem, Product, Review, Table
+from orders.transitions import STAMPS
+
+from ._bench import analyze_tables, without_auto_now
+
+BASE_PRODUCTS = [
+    ("Jugo de Fresa", "JUICE", Decimal('12.00')),
+    ("Jugo de Mango", "JUICE", Decimal('14.00')),
+    ("Jugo de Papaya", "JUICE", Decimal('10.00')),
+    ("Surtido Especial", "JUICE", Decimal('15.00')),
+    ("Hamburguesa Royal", "SANDWICH", Decimal('25.00')),
+    ("Hamburguesa Clásica", "SANDWICH", Decimal('18.00')),
+    ("Club Sandwich", "SANDWICH", Decimal('28.00')),
+    ("Pollo Deshilachado", "SANDWICH", Decimal('16.00')),
+]
+
+# Pedidos por hora local (desayuno, almuerzo y cena) y por día de la semana (lunes = 0)
+HOUR_WEIGHTS = {
+    7: 2, 8: 5, 9: 6, 10: 4, 11: 5, 12: 9, 13: 12, 14: 9,
+    15: 4, 16: 3, 17: 4, 18: 6, 19: 9, 20: 10, 21: 6, 22: 2,
+}
+WEEKDAY_WEIGHTS = (0.85, 0.85, 0.9, 0.95, 1.1, 1.35, 1.25)
+
+MAX_ITEMS = 4
+ITEM_COUNT_WEIGHTS = (40, 35, 15, 10)  # 1, 2, 3 o 4 items
+RATING_WEIGHTS = {5: 45, 4: 30, 3: 13, 2: 7, 1: 5}
+COMMENTS = ["Muy rico", "Llegó frío", "Excelente atención", "Un poco caro", "Volveré", None, None, None]
+
+S = Order.Status
 
 
 class Command(BaseCommand):
-    help = 'Genera datos dummy históricos para probar el Dashboard'
+    help = (
+        'Genera datos sintéticos reproducibles (semilla) para el Dashboard y los benchmarks: horas punta, '
+        'todos los estados, solicitudes de cambio y reseñas, con bulk_create por lotes y varios procesos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='Misma semilla, mismos datos.')
+        parser.add_argument('--tables', type=int, default=10)
+        parser.add_argument('--products', type=int, default=len(BASE_PRODUCTS))
+        parser.add_argument('--days', type=int, default=30, help='Días de historia (incluye hoy).')
+        parser.add_argument('--orders-per-day', type=int, default=40, help='Promedio; varía por día de la semana.')
+        parser.add_argument('--active', type=int, default=20,
+                            help='Pedidos extra en los últimos 90 minutos (la mayoría en estados activos).')
+        parser.add_argument('--review-ratio', type=float, default=0.1, help='Fracción de pedidos pagados con reseña.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Pedidos por bulk_create.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Procesos en paralelo (no aplica a SQLite, que tiene un solo escritor).')
+        parser.add_argument('--skip-rollup', action='store_true',
+                            help='No reconstruir los rollups del Dashboard (con millones de pedidos tarda).')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite admite un solo escritor: se usa 1 proceso.'))
+            workers = 1
 
-    def handle(self, *args, **kwargs):
         self.stdout.write(self.style.WARNING('Iniciando generación de datos falsos...'))
+        rng = random.Random(options['seed'])
+        products = self._ensure_products(options['products'])
+        tables = self._ensure_tables(options['tables'])
+
+        now = timezone.now()
+        tasks = self._plan(rng, now, options)
+        total = sum(task['count'] for task in tasks)
+        self.stdout.write(f"{total} pedidos en {len(tasks)} tareas, {workers} proceso(s)...")
+
+        shared = {
+            'products': [(p.name, p.base_price) for p in products],
+            'tables': [t.id for t in tables],
+            'now': now,
+            'review_ratio': options['review_ratio'],
+            'chunk_size': options['chunk_size'],
+        }
+        start = time.perf_counter()
+        done = {'orders': 0, 'items': 0, 'reviews': 0}
+        if workers > 1:
+            # Cada proceso abre su propia conexión
+            connection.close()
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                for result in pool.imap_unordered(_generate, [(task, shared) for task in tasks]):
+                    self._progress(done, result, total)
+        else:
+            for task in tasks:
+                self._progress(done, _generate((task, shared)), total)
+        self.stdout.write(f"\nCarga: {time.perf_counter() - start:.1f} s "
+                          f"({done['items']} items, {done['reviews']} reseñas)")
+
+        self._reset_sequences()
+        self._open_tables(rng, tables)
+        analyze_tables(Order, OrderItem, Review)
+
+        # Los pedidos se crean directamente con su estado final: reconciliamos el rollup del Dashboard
+        if not options['skip_rollup']:
+            call_command('rebuild_sales_rollup', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f'¡Éxito! Se generaron {done["orders"]} pedidos.'))
+
+    # --- Catálogo y mesas (se reutilizan si ya existen) ---
+
+    def _ensure_products(self, count):
+        wanted = list(BASE_PRODUCTS[:count])
+        for i in range(len(wanted), count):
+            category = ("JUICE", "SANDWICH")[i % 2]
+            prefix = "Jugo" if category == "JUICE" else "Sandwich"
+            wanted.append((f"{prefix} Especial {i + 1}", category, Decimal(10 + i % 20)))
+        existing = set(Product.objects.filter(name__in=[name for name, _, _ in wanted]).values_list('name', flat=True))
+        Product.objects.bulk_create([
+            Product(name=name, category=category, base_price=price)
+            for name, category, price in wanted if name not in existing
+        ])
+        by_name = {p.name: p for p in Product.objects.filter(name__in=[name for name, _, _ in wanted])}
+        return [by_name[name] for name, _, _ in wanted]
+
+    def _ensure_tables(self, count):
+        codes = [f"M-{i:02d}" for i in range(1, count + 1)]
+        existing = set(Table.objects.filter(code__in=codes).values_list('code', flat=True))
+        Table.objects.bulk_create([Table(code=code, status='LIBRE') for code in codes if code not in existing])
+        return list(Table.objects.filter(code__in=codes).order_by('code'))
+
+    # --- Plan: cantidad de pedidos por día y rangos de ids ---
+
+    def _plan(self, rng, now, options):
+        """
+        Una tarea por día (más una para los pedidos activos), cada una con su
+        propia semilla y su rango de ids: el resultado no depende de cuántos
+        procesos se usen ni del orden en que terminen.
+        """
+        today = timezone.localtime(now).date()
+        counts = []
+        for offset in range(options['days'] - 1, -1, -1):
+            day = today - timedelta(days=offset)
+            count = round(options['orders_per_day'] * WEEKDAY_WEIGHTS[day.weekday()] * rng.uniform(0.9, 1.1))
+            if day == today:
+                # Hoy solo hasta la hora actual
+                hour = timezone.localtime(now).hour
+                done = sum(w for h, w in HOUR_WEIGHTS.items() if h < hour)
+                count = round(count * done / sum(HOUR_WEIGHTS.values()))
+            counts.append((day, count))
+        counts.append((None, options['active']))
+
+        order_id = (Order.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        item_id = (OrderItem.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        review_id = (Review.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        tasks = []
+        for day, count in counts:
+            if count <= 0:
+                continue
+            tasks.append({
+                'seed': rng.getrandbits(64), 'day': day, 'count': count,
+                'order_id': order_id, 'item_id': item_id, 'review_id': review_id,
+            })
+            # Cada pedido reserva MAX_ITEMS ids de item (y de reseña); los huecos no importan
+            order_id += count
+            item_id += count * MAX_ITEMS
+            review_id += count
+        return tasks
+
+    def _progress(self, done, result, total):
+        for key, value in result.items():
+            done[key] += value
+        self.stdout.write(f"\r{done['orders']}/{total} pedidos", ending='')
+
+    def _reset_sequences(self):
+        # Los ids se asignaron a mano: en PostgreSQL hay que adelantar las secuencias
+        statements = connection.ops.sequence_reset_sql(no_style(), [Order, OrderItem, Review])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def _open_tables(self, rng, tables):
+        # Las mesas con pedidos sin pagar quedan ocupadas, con su sesión
+        open_ids = set(
+            Order.objects.exclude(status=S.PAID).filter(table__in=tables).values_list('table_id', flat=True)
+        )
+        for table in tables:
+            if table.id in open_ids:
+                table.status = Table.Status.OCUPADA
+                table.session_token = uuid.UUID(int=rng.getrandbits(128), version=4)
+        Table.objects.bulk_update(tables, ['status', 'session_token'])
+
+
+# --- Generación (corre en los procesos hijos; funciones de módulo para poder usarlas en el Pool) ---
+
+def _generate(args):
+    task, shared = args
+    rng = random.Random(task['seed'])
+    products = shared['products']
+    product_weights = [1 / (rank + 1) for rank in range(len(products))]  # unos pocos se llevan casi todo
+    tz = timezone.get_current_timezone()
+    now = shared['now']
+
+    order_id, item_id, review_id = task['order_id'], task['item_id'], task['review_id']
+    result = {'orders': 0, 'items': 0, 'reviews': 0}
+    remaining = task['count']
+    with without_auto_now(Order, Review):
+        while remaining:
+            orders, items, reviews = [], [], []
+            for _ in range(min(shared['chunk_size'], remaining)):
+                position = (task['count'] - remaining + len(orders) + rng.random()) / task['count']
+                created_at = _created_at(rng, task['day'], tz, now, position)
+                chosen = rng.choices(products, product_weights, k=rng.choices(range(1, MAX_ITEMS + 1), ITEM_COUNT_WEIGHTS)[0])
+                order = _order(rng, order_id, rng.choice(shared['tables']), created_at, chosen, now)
+                orders.append(order)
+                for position, (name, price) in enumerate(chosen):
+                    items.append(OrderItem(id=item_id + position, order_id=order_id, product_name=name, unit_price=price))
+                if order.status == S.PAID and rng.random() < shared['review_ratio']:
+                    reviews.append(Review(
+                        id=review_id, order_item_id=item_id + rng.randrange(len(chosen)),
+                        rating=rng.choices(list(RATING_WEIGHTS), list(RATING_WEIGHTS.values()))[0],
+                        comment=rng.choice(COMMENTS),
+                        created_at=order.paid_at + timedelta(minutes=rng.randint(1, 30)),
+                    ))
+                order_id += 1
+                item_id += MAX_ITEMS
+                review_id += 1
+
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                OrderItem.objects.bulk_create(items)
+                Review.objects.bulk_create(reviews)
+            remaining -= len(orders)
+            result['orders'] += len(orders)
+            result['items'] += len(items)
+            result['reviews'] += len(reviews)
+    connection.close()
+    return result
+
+
+def _created_at(rng, day, tz, now, position):
+    if day is None:
+        # Pedidos activos: repartidos en los últimos 90 minutos, más densos
+        # cerca de ahora para que haya de cada estado (NEW dura pocos minutos)
+        return now - timedelta(seconds=90 * 60 * position ** 3)
+    hours = HOUR_WEIGHTS
+    if day == timezone.localtime(now, tz).date():
+        # Hoy solo hasta la hora actual (ver Command._plan)
+        hours = {h: w for h, w in HOUR_WEIGHTS.items() if h < timezone.localtime(now, tz).hour}
+    hour = rng.choices(list(hours), list(hours.values()))[0]
+    return datetime.combine(day, dt_time(hour, rng.randint(0, 59), rng.randint(0, 59)), tzinfo=tz)
+
+
+def _order(rng, order_id, table_id, created_at, chosen, now):
+    """Pedido con las fechas de cada etapa; el estado es la última etapa ya alcanzada a `now`."""
+    preparing_at = created_at + timedelta(minutes=rng.randint(1, 4))
+    ready_at = preparing_at + timedelta(minutes=rng.randint(4, 8) + 3 * len(chosen))
+    delivered_at = ready_at + timedelta(minutes=rng.randint(1, 10))
+    paid_at = delivered_at + timedelta(minutes=rng.randint(10, 60))
+    stages = [(S.PREPARING, preparing_at), (S.READY, ready_at), (S.DELIVERED, delivered_at), (S.PAID, paid_at)]
+
+    status, version, proposed_changes = S.NEW, 1, {}
+    stamps = {}
+    for stage, at in stages:
+        if at > now:
+            break
+        status, version = stage, version + 1
+        stamps[STAMPS[stage]] = at
+    updated_at = stamps.get(STAMPS.get(status), created_at)
+
+    # Algunos pedidos en curso están siendo editados o con un cambio pendiente
+    if status == S.NEW and rng.random() < 0.2:
+        status, version = S.WAITER_EDITING, version + 1
+    elif status == S.PREPARING and rng.random() < 0.2:
+        status, version = S.CHANGE_REQUESTED, version + 1
+        name, price = rng.choice(chosen)
+        proposed_changes = {"items": [
+            {"product_name": item_name, "unit_price": str(item_price), "notes": ""}
+            for item_name, item_price in chosen + [(name, price)]
+        ]}
 
-        if Product.objects.count() == 0:
-            self.stdout.write("Creando productos base...")
-            products_data = [
-                ("Jugo de Fresa", "JUICE", 12.00),
-                ("Jugo de Mango", "JUICE", 14.00),
-                ("Jugo de Papaya", "JUICE", 10.00),
-                ("Surtido Especial", "JUICE", 15.00),
-                ("Hamburguesa Royal", "SANDWICH", 25.00),
-                ("Hamburguesa Clásica", "SANDWICH", 18.00),
-                ("Club Sandwich", "SANDWICH", 28.00),
-                ("Pollo Deshilachado", "SANDWICH", 16.00),
-            ]
-            for name, cat, price in products_data:
-                Product.objects.create(name=name, category=cat, base_price=Decimal(price))
-
-        products = list(Product.objects.all())
-
-        # 2. ASEGURAR MESAS
-        if Table.objects.count() == 0:
-            self.stdout.write("Creando mesas...")
-            for i in range(1, 11):
-                Table.objects.create(code=f"M-{i:02d}", status='LIBRE')
-
-        tables = list(Table.objects.all())
-
-        # 3. GENERAR PEDIDOS HISTÓRICOS
-        # Generaremos 100 pedidos en los últimos 30 días
-        TOTAL_ORDERS = 100
-
-        for _ in range(TOTAL_ORDERS):
-            # A. Elegir fecha aleatoria en el pasado (entre hace 30 días y hoy)
-            days_ago = random.randint(0, 30)
-            # Hora aleatoria entre 8am y 10pm
-            hour = random.randint(8, 22)
-            minute = random.randint(0, 59)
-
-            # Fecha base de creación (Created At)
-            fake_created = timezone.now() - timedelta(days=days_ago)
-            fake_created = fake_created.replace(hour=hour, minute=minute)
-
-            # B. Calcular tiempos realistas
-            # Prep time: entre 5 y 25 minutos después de crear
-            prep_minutes = random.randint(5, 25)
-            fake_ready = fake_created + timedelta(minutes=prep_minutes)
-
-            # Delivery time: entre 1 y 10 minutos después de estar listo
-            deliver_minutes = random.randint(1, 10)
-            fake_delivered = fake_ready + timedelta(minutes=deliver_minutes)
-
-            # Pay time: entre 10 y 60 minutos después de entregar (el cliente come)
-            pay_minutes = random.randint(10, 60)
-            fake_paid = fake_delivered + timedelta(minutes=pay_minutes)
-
-            # C. Crear la orden
-            table = random.choice(tables)
-
-            order = Order.objects.create(
-                table=table,
-                status=Order.Status.PAID,  # Para que salga en los reportes
-                total_price=Decimal('0.00')
-            )
-
-            # IMPORTANTE: Django auto_now_add sobreescribe la fecha al crear.
-            # Debemos forzar la actualización manual de las fechas después de crear.
-            order.created_at = fake_created
-            order.preparing_at = fake_created + timedelta(minutes=1)
-            order.ready_at = fake_ready
-            order.delivered_at = fake_delivered
-            order.paid_at = fake_paid
-
-            # D. Agregar Items (1 a 4 productos por pedido)
-            num_items = random.randint(1, 4)
-            order_total = Decimal('0.00')
-
-            for _ in range(num_items):
-                prod = random.choice(products)
-                qty = 1  # Simplificamos a cantidad 1 por item row
-
-                OrderItem.objects.create(
-                    order=order,
-                    product_name=prod.name,
-                    unit_price=prod.base_price,
-                    notes="Generado automáticamente"
-                )
-                order_total += prod.base_price
-
-            # Actualizar precio y guardar fechas forzadas
-            order.total_price = order_total
-            order.save()
-
-        self.stdout.write(self.style.SUCCESS(f'¡Éxito! Se generaron {TOTAL_ORDERS} pedidos históricos.'))
\ No newline at end of file
+    return Order(
+        id=order_id, table_id=table_id, status=status, total_price=sum(price for _, price in chosen),
+        proposed_changes=proposed_changes, created_at=created_at, updated_at=updated_at, version=version,
+        **stamps,
+    )
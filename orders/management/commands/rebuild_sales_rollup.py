@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.models import DailyProductSales, DailySales, Order, OrderItem
+from orders.rollups import item_day_product_sketches, item_day_product_totals, order_day_totals
+
+
+class Command(BaseCommand):
+    help = 'Recalcula (backfill) y reconcilia los rollups diarios de ventas desde Order/OrderItem'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Solo reporta las diferencias, sin escribir nada.'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        with transaction.atomic():
+            paid_orders = Order.objects.filter(status=Order.Status.PAID)
+            paid_items = OrderItem.objects.filter(order__status=Order.Status.PAID)
+
+            expected_days = {
+                date: {'orders_count': count, 'total_sales': total}
+                for date, (count, total) in order_day_totals(paid_orders).items()
+            }
+            sketches = item_day_product_sketches(paid_items)
+            expected_products = {
+                key: {
+                    'items_count': count,
+                    'sales_total': total,
+                    'prep_seconds_total': prep_seconds,
+                    'prep_count': prep_count,
+                    'prep_sketch': sketches[key].to_dict() if key in sketches else {},
+                }
+                for key, (count, total, prep_seconds, prep_count) in item_day_product_totals(paid_items).items()
+            }
+
+            day_stats = self._reconcile(
+                DailySales.objects.select_for_update(),
+                lambda row: row.date,
+                lambda key: {'date': key},
+                expected_days, dry_run,
+            )
+            product_stats = self._reconcile(
+                DailyProductSales.objects.select_for_update(),
+                lambda row: (row.date, row.product_name),
+                lambda key: {'date': key[0], 'product_name': key[1]},
+                expected_products, dry_run,
+            )
+
+        prefix = '[dry-run] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}DailySales: {day_stats[0]} creadas, {day_stats[1]} corregidas, {day_stats[2]} borradas. "
+            f"DailyProductSales: {product_stats[0]} creadas, {product_stats[1]} corregidas, {product_stats[2]} borradas."
+        ))
+
+    def _reconcile(self, queryset, key_of, lookup_of, expected, dry_run):
+        model = queryset.model
+        to_create, to_update, to_delete = [], [], []
+
+        for row in queryset:
+            key = key_of(row)
+            values = expected.pop(key, None)
+            if values is None:
+                to_delete.append(row.pk)
+                continue
+            if any(not self._same(getattr(row, field), value) for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(row, field, value)
+                to_update.append(row)
+
+        for key, values in expected.items():
+            to_create.append(model(**lookup_of(key), **values))
+
+        if not dry_run:
+            model.objects.filter(pk__in=to_delete).delete()
+            if to_update:
+                model.objects.bulk_update(to_update, self._value_fields(model), batch_size=1000)
+            model.objects.bulk_create(to_create, batch_size=1000)
+
+        return len(to_create), len(to_update), len(to_delete)
+
+    @staticmethod
+    def _value_fields(model):
+        return [
+            f.attname for f in model._meta.concrete_fields
+            if not f.primary_key and f.name not in ('date', 'product_name')
+        ]
+
+    @staticmethod
+    def _same(current, expected):
+        if isinstance(current, float) or isinstance(expected, float):
+            return abs(float(current) - float(expected)) < 1e-6
+        return current == expected
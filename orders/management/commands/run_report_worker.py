@@ -0,0 +1,80 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+# Los procesos "spawn" importan este módulo antes de django.setup(): nada de
+# modelos a nivel de módulo, se importan dentro de las funciones.
+
+
+def _init_worker():
+    # Cada proceso arranca Django desde cero con su propia conexión
+    django.setup()
+
+
+def _run_job(job_id):
+    from orders.jobs import run_job
+    return run_job(job_id)
+
+
+class Command(BaseCommand):
+    help = 'Procesa los reportes en cola (ReportJob) en un pool de procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Procesos en paralelo (default: 2).')
+        parser.add_argument('--interval', type=float, default=2.0, help='Segundos entre consultas a la cola.')
+        parser.add_argument('--once', action='store_true', help='Procesa lo que haya en cola y termina.')
+        parser.add_argument(
+            '--requeue-running', action='store_true',
+            help='Devuelve a la cola los jobs que quedaron en RUNNING (p. ej. tras un reinicio).'
+        )
+
+    def handle(self, *args, **options):
+        from orders.jobs import claim_job
+        from orders.models import ReportJob
+
+        workers = options['workers']
+
+        if options['requeue_running']:
+            requeued = ReportJob.objects.filter(status=ReportJob.Status.RUNNING).update(
+                status=ReportJob.Status.PENDING, started_at=None, progress=0
+            )
+            self.stdout.write(f"{requeued} jobs devueltos a la cola.")
+
+        # No compartimos la conexión del proceso padre con los hijos
+        connections.close_all()
+        self.stdout.write(self.style.SUCCESS(f"Worker de reportes iniciado ({workers} procesos)."))
+
+        running = {}
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+            while True:
+                while len(running) < workers:
+                    job_id = claim_job()
+                    if job_id is None:
+                        break
+                    self.stdout.write(f"Job #{job_id} iniciado.")
+                    running[pool.submit(_run_job, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        # El proceso hijo murió antes de poder registrar el error
+                        ReportJob.objects.filter(pk=job_id).update(
+                            status=ReportJob.Status.FAILED, finished_at=timezone.now(), error=str(e)
+                        )
+                    status = ReportJob.objects.filter(pk=job_id).values_list('status', flat=True).first()
+                    self.stdout.write(f"Job #{job_id} terminado: {status}.")
@@ -0,0 +1,215 @@
+# orders/metrics.py
+"""
+Métricas de rendimiento en memoria del proceso, en formato Prometheus.
+
+RequestMetricsMiddleware mide cada request por ruta (nombre de la URL) y
+método: latencia, cantidad y tiempo de SQL, y tiempo de serialización (los
+serializers de la app usan TimedSerializerMixin). El outbox registra el
+tiempo y los fallos de cada group_send. Todo se acumula en histogramas que
+expone /api/metrics/ (solo admin).
+
+Cada proceso (worker de gunicorn/daphne) tiene sus propios números: el
+scraper debe consultar cada uno, o sumarlos.
+
+Con ORDERS_SLOW_REQUEST_MS > 0 se loguean las requests más lentas que eso,
+con sus consultas más lentas.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SLOW_REQUEST_QUERIES = 5  # consultas que se loguean por request lenta
+
+_lock = threading.Lock()
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help_text, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with _lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, values)} {total}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help_text, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label_values -> [conteos por bucket..., suma, total]
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        with _lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            for values, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(self.labels, values, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+
+ROUTE_LABELS = ('route', 'method')
+
+REQUESTS = Counter('orders_requests_total', 'Requests por ruta, método y status.', ROUTE_LABELS + ('status',))
+REQUEST_SECONDS = Histogram('orders_request_duration_seconds', 'Latencia de la request.', ROUTE_LABELS)
+SQL_QUERIES = Histogram('orders_request_sql_queries', 'Consultas SQL por request.', ROUTE_LABELS, QUERY_BUCKETS)
+SQL_SECONDS = Histogram('orders_request_sql_seconds', 'Tiempo en SQL por request.', ROUTE_LABELS)
+SERIALIZER_SECONDS = Histogram('orders_request_serializer_seconds', 'Tiempo serializando por request.', ROUTE_LABELS)
+GROUP_SEND_SECONDS = Histogram('orders_group_send_seconds', 'Duración de channel_layer.group_send.', ('group',))
+GROUP_SEND_FAILURES = Counter('orders_group_send_failures_total', 'group_send que fallaron.', ('group',))
+
+
+def render():
+    """Todas las métricas en formato de texto de Prometheus."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Por request ---
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_seconds', 'serializer_seconds', 'serializing', 'sql')
+
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+        self.sql = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.sql_seconds += elapsed
+            if self.sql is not None:
+                self.sql.append((elapsed, sql))
+
+
+_current = ContextVar('orders_request_stats', default=None)
+
+
+@contextmanager
+def timed_serialization():
+    """Suma al tiempo de serialización de la request (solo el nivel más externo)."""
+    stats = _current.get()
+    if stats is None or stats.serializing:
+        yield
+        return
+    stats.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializing = False
+        stats.serializer_seconds += time.perf_counter() - start
+
+
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        with timed_serialization():
+            return super().to_representation(instance)
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        slow_ms = getattr(settings, 'ORDERS_SLOW_REQUEST_MS', 0)
+        stats = RequestStats(keep_sql=slow_ms > 0)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        labels = (match.view_name if match else 'unmatched', request.method)
+        REQUESTS.inc(*labels, response.status_code)
+        REQUEST_SECONDS.observe(elapsed, *labels)
+        SQL_QUERIES.observe(stats.queries, *labels)
+        SQL_SECONDS.observe(stats.sql_seconds, *labels)
+        SERIALIZER_SECONDS.observe(stats.serializer_seconds, *labels)
+
+        if slow_ms and elapsed * 1000 > slow_ms:
+            slowest = sorted(stats.sql, key=lambda q: q[0], reverse=True)[:SLOW_REQUEST_QUERIES]
+            logger.warning(
+                "Request lenta: %s %s (%s) %.0f ms, %d consultas SQL (%.0f ms), serialización %.0f ms%s",
+                request.method, request.path, labels[0], elapsed * 1000, stats.queries, stats.sql_seconds * 1000,
+                stats.serializer_seconds * 1000,
+                ''.join(f"\n  {seconds * 1000:.1f} ms: {sql}" for seconds, sql in slowest),
+            )
+        return response
+
+
+# --- Channel layer ---
+
+def group_label(group):
+    # Un grupo por mesa: se agrupan para no crear una serie por mesa
+    return 'table' if group.startswith('table_') else group
+
+
+@contextmanager
+def timed_group_send(group):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        GROUP_SEND_FAILURES.inc(group_label(group))
+        raise
+    finally:
+        GROUP_SEND_SECONDS.observe(time.perf_counter() - start, group_label(group))
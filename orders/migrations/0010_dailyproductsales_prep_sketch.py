@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_daily_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyproductsales',
+            name='prep_sketch',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-17 20:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_dailyproductsales_prep_sketch'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ORDERS', 'Pedidos'), ('ITEMS', 'Items de pedidos'), ('REVIEWS', 'Calificaciones'), ('ROLLUP', 'Recalcular Dashboard')], max_length=20)),
+                ('file_format', models.CharField(choices=[('XLSX', 'Excel (XLSX)'), ('CSV', 'CSV')], default='XLSX', max_length=10)),
+                ('status', models.CharField(choices=[('PENDING', 'En cola'), ('RUNNING', 'Procesando'), ('DONE', 'Terminado'), ('FAILED', 'Falló')], default='PENDING', max_length=20)),
+                ('object_ids', models.JSONField(blank=True, editable=False, null=True)),
+                ('filters', models.JSONField(blank=True, editable=False, null=True)),
+                ('progress', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('file_path', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
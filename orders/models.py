@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from decimal import Decimal
 from django.utils import timezone
@@ -45,11 +46,43 @@ class Order(models.Model):
     delivered_at = models.DateTimeField(null=True, blank=True)
     paid_at = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Se incrementa en cada escritura; las pantallas ignoran deltas con versión vieja
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # Paginación por cursor del listado de pedidos (orders/pagination.py)
+            models.Index(fields=['-created_at', '-id'], name='order_created_id_idx'),
+            # Reportes por estado y rango de fechas: status IN (...) AND created_at >= ...
+            models.Index(fields=['status', '-created_at'], name='order_status_created_idx'),
+            # Pantalla de cocina: pedidos activos ORDER BY created_at DESC. Parcial:
+            # solo indexa lo que no está pagado (una fracción mínima de la tabla).
+            models.Index(fields=['-created_at'], condition=~models.Q(status='PAID'), name='order_active_created_idx'),
+            # check_session: table + status=PAID + updated_at >= hace 30 min
+            models.Index(fields=['table', 'status', 'updated_at'], name='order_table_status_upd_idx'),
+            # close_table: pedidos sin pagar de una mesa (índice parcial, muy chico;
+            # MySQL no soporta condiciones y lo omite)
+            models.Index(fields=['table'], condition=~models.Q(status='PAID'), name='order_open_by_table_idx'),
+            # Sincronización incremental: updated_at > cursor ORDER BY updated_at, id
+            models.Index(fields=['updated_at', 'id'], name='order_updated_id_idx'),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - Mesa {self.table.code} ({self.get_status_display()})"
 
 
+class OrderTombstone(models.Model):
+    """
+    Pedido borrado, para que /api/orders/changes/ pueda avisarlo. Se guardan
+    por un tiempo limitado (ver orders/changes.py).
+    """
+    order_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Order #{self.order_id} borrado ({self.deleted_at})"
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     product_name = models.CharField(max_length=100)
@@ -58,7 +91,7 @@ class OrderItem(models.Model):
     selected_options = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
-        return f"{self.product_name} (Order #{self.order.id})"
+        return f"{self.product_name} (Order #{self.order_id})"
 
 
 class Product(models.Model):
@@ -84,4 +117,80 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Review for {self.order_item.product_name} ({self.rating} stars)"
\ No newline at end of file
+        return f"Review for {self.order_item.product_name} ({self.rating} stars)"
+
+# --- ROLLUPS DIARIOS PARA EL DASHBOARD ---
+# Se actualizan cuando un pedido pasa a PAID (ver orders/rollups.py) y se
+# reconcilian con `manage.py rebuild_sales_rollup`.
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)  # Fecha LOCAL (TIME_ZONE) de created_at
+    orders_count = models.PositiveIntegerField(default=0)
+    total_sales = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.date}: {self.orders_count} pedidos / {self.total_sales}"
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product_name = models.CharField(max_length=100)
+    items_count = models.PositiveIntegerField(default=0)
+    sales_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    # Suma y cantidad de tiempos de preparación (ready_at - created_at) en segundos
+    prep_seconds_total = models.FloatField(default=0)
+    prep_count = models.PositiveIntegerField(default=0)
+    # DDSketch serializado (orders/sketches.py) para percentiles de preparación
+    prep_sketch = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product_name'], name='unique_daily_product_sales'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.product_name}: {self.items_count}"
+
+
+# --- REPORTES EN SEGUNDO PLANO ---
+# Los crea el admin y los procesa `manage.py run_report_worker` (ver orders/jobs.py).
+
+class ReportJob(models.Model):
+    class Kind(models.TextChoices):
+        ORDERS = 'ORDERS', 'Pedidos'
+        ITEMS = 'ITEMS', 'Items de pedidos'
+        REVIEWS = 'REVIEWS', 'Calificaciones'
+        ROLLUP = 'ROLLUP', 'Recalcular Dashboard'
+
+    class Format(models.TextChoices):
+        XLSX = 'XLSX', 'Excel (XLSX)'
+        CSV = 'CSV', 'CSV'
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'En cola'
+        RUNNING = 'RUNNING', 'Procesando'
+        DONE = 'DONE', 'Terminado'
+        FAILED = 'FAILED', 'Falló'
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    file_format = models.CharField(max_length=10, choices=Format.choices, default=Format.XLSX)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    # Filas a exportar: los PKs marcados en el admin o, con "seleccionar
+    # todo", los filtros del changelist (parámetros GET). Ambos null = todas
+    object_ids = models.JSONField(null=True, blank=True, editable=False)
+    filters = models.JSONField(null=True, blank=True, editable=False)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    file_path = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reporte #{self.id} - {self.get_kind_display()} ({self.get_status_display()})"
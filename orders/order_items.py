@@ -0,0 +1,62 @@
+# orders/order_items.py
+"""
+Escritura de los items de un pedido.
+
+Todos los caminos que (re)escriben items (crear, editar y aceptar cambios)
+pasan por aquí: se valida todo primero y luego va un solo bulk_create y un
+solo UPDATE del total, dentro de la misma transacción.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+
+def build_items(items_data, price_for):
+    """
+    Valida los items y devuelve [(item_data, unit_price)].
+    `price_for(item_data)` devuelve el precio o lanza la excepción que
+    corresponda al llamador. Si algo falla no se ha escrito nada.
+    """
+    priced = []
+    for item_data in items_data:
+        if not item_data.get('product_name'):
+            raise ValueError("Item sin product_name.")
+        priced.append((item_data, price_for(item_data)))
+    return priced
+
+
+@transaction.atomic
+def write_order_items(order, priced_items, replace=True, **order_updates):
+    """
+    Inserta los items ya validados de `order` (reemplazando los actuales si
+    `replace`) y guarda el nuevo total junto con `order_updates`.
+    """
+    if replace:
+        OrderItem.objects.filter(order=order).delete()
+
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            unit_price=unit_price,
+            product_name=item_data.get('product_name'),
+            notes=item_data.get('notes'),
+            selected_options=item_data.get('selected_options') or {},
+        )
+        for item_data, unit_price in priced_items
+    ])
+
+    order_total = sum((unit_price for _, unit_price in priced_items), Decimal('0.00'))
+    fields = {'total_price': order_total, 'updated_at': timezone.now(), **order_updates}
+    Order.objects.filter(pk=order.pk).update(version=F('version') + 1, **fields)
+
+    for field, value in fields.items():
+        setattr(order, field, value)
+    order.version += 1
+    # Igual que DRF en UpdateModelMixin: los items precargados ya no sirven
+    if hasattr(order, '_prefetched_objects_cache'):
+        order._prefetched_objects_cache.pop('items', None)
+    return order_total
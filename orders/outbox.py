@@ -0,0 +1,137 @@
+# orders/outbox.py
+"""
+Outbox de eventos de WebSocket.
+
+Las vistas no llaman al channel layer: `publish()` deja el evento para
+después del commit (transaction.on_commit), así un rollback no emite nada y
+Redis lento no alarga transacciones ni requests. Los eventos los envía un
+hilo de fondo con su propio event loop, que espera COALESCE_WINDOW desde el
+primer evento y, si en ese lapso llegaron varios del mismo tipo para el
+mismo pedido, manda solo el último (los deltas se fusionan en uno).
+
+Con ORDERS_OUTBOX_EAGER=True se envían en el hilo que hace commit (tests).
+Los eventos en cola al terminar el proceso se pierden: las pantallas se
+recuperan con /api/orders/changes/. Los envíos se miden y los fallos se
+loguean (ver orders/metrics.py).
+"""
+import asyncio
+import logging
+import os
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .metrics import timed_group_send
+
+logger = logging.getLogger(__name__)
+
+COALESCE_WINDOW = 0.05  # segundos
+MAX_PENDING = 10000
+
+
+def publish(group, message, key=None):
+    """
+    Encola `message` para `group` cuando confirme la transacción actual (o
+    ya mismo si no hay una). `key` (p. ej. el id del pedido) permite fusionar
+    eventos repetidos del mismo tipo.
+    """
+    transaction.on_commit(lambda: _dispatch(group, message, key))
+
+
+def _merge_delta(previous, message):
+    # Los deltas no se reemplazan: se acumulan los campos y queda la última versión
+    changes = {**previous['delta']['changes'], **message['delta']['changes']}
+    return {**message, 'delta': {**message['delta'], 'changes': changes}}
+
+
+# Tipos de evento que se fusionan en vez de reemplazarse
+MERGERS = {'send.order.delta': _merge_delta}
+
+
+def coalesce(events):
+    """[(group, message, key)] -> [(group, message)]: el último por clave, en el lugar del primero."""
+    result = []
+    positions = {}
+    for group, message, key in events:
+        if key is None:
+            result.append((group, message))
+            continue
+        slot = (group, message['type'], key)
+        if slot in positions:
+            merge = MERGERS.get(message['type'])
+            if merge:
+                message = merge(result[positions[slot]][1], message)
+            result[positions[slot]] = (group, message)
+        else:
+            positions[slot] = len(result)
+            result.append((group, message))
+    return result
+
+
+def _dispatch(group, message, key):
+    if settings.ORDERS_OUTBOX_EAGER:
+        try:
+            with timed_group_send(group):
+                async_to_sync(get_channel_layer().group_send)(group, message)
+        except Exception:
+            logger.exception("Error WS: group_send a %s (%s)", group, message.get('type'))
+    else:
+        _get_sender().submit((group, message, key))
+
+
+class OutboxSender:
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._queue = None
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(started,), name='orders-outbox', daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def _run(self, started):
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue(maxsize=MAX_PENDING)
+        started.set()
+        self._loop.run_until_complete(self._drain())
+
+    def submit(self, event):
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.error("Error WS: outbox lleno, evento descartado (%s)", event[0])
+
+    async def _drain(self):
+        while True:
+            events = [await self._queue.get()]
+            await asyncio.sleep(COALESCE_WINDOW)
+            while not self._queue.empty():
+                events.append(self._queue.get_nowait())
+
+            channel_layer = get_channel_layer()
+            for group, message in coalesce(events):
+                try:
+                    with timed_group_send(group):
+                        await channel_layer.group_send(group, message)
+                except Exception:
+                    logger.exception("Error WS: group_send a %s (%s)", group, message.get('type'))
+
+
+_sender = None
+_sender_pid = None
+_sender_lock = threading.Lock()
+
+
+def _get_sender():
+    # Uno por proceso (tras un fork el hilo del padre no existe en el hijo)
+    global _sender, _sender_pid
+    with _sender_lock:
+        if _sender is None or _sender_pid != os.getpid():
+            _sender = OutboxSender()
+            _sender_pid = os.getpid()
+        return _sender
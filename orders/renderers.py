@@ -0,0 +1,53 @@
+# orders/renderers.py
+"""
+Renderer y parser JSON de la API con orders/fast_json.py (orjson si está
+instalado). Se activan en REST_FRAMEWORK (DEFAULT_RENDERER_CLASSES y
+DEFAULT_PARSER_CLASSES); para volver a los de DRF basta con sacarlos de ahí.
+
+La respuesta es byte a byte la misma que la de JSONRenderer (y, como con
+STRICT_JSON, NaN e Infinity lanzan ValueError). Lo que el renderer rápido no
+cubre (JSON con sangría, como el de la API navegable, STRICT_JSON = False o
+un cuerpo que no viene en UTF-8) lo resuelve la clase de DRF.
+
+Buscar NaN cuesta más que codificar con orjson; las vistas cuyas respuestas
+no tienen floats lo evitan con el atributo `json_check_floats = False`.
+"""
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from . import fast_json
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Sin STRICT_JSON, DRF escribe NaN e Infinity: también lo resuelve DRF
+        if (self.ensure_ascii or not self.compact or not self.strict
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Una vista sin floats en sus respuestas lo declara con json_check_floats = False
+        view = (renderer_context or {}).get('view')
+        ret = fast_json.dumps(data, check_floats=getattr(view, 'json_check_floats', True))
+        # Igual que DRF: \u2028 y \u2029 escapados (JSON que también es JavaScript válido)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if fast_json.orjson is None or not self.strict or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return fast_json.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,137 @@
+# orders/representations.py
+"""
+Representación de lectura de los pedidos sin pasar por DRF.
+
+Da exactamente lo mismo que OrderSerializer(...).data (mismas claves, en el
+mismo orden, mismos formatos de precio y fecha), pero sin instanciar campos
+de DRF por pedido y por item. La usan el listado, el detalle, las respuestas
+de las acciones de la cocina, los mensajes de WebSocket y el snapshot.
+
+- serialize_order_rows(queryset): desde .values_list() de pedidos e items
+  (2 consultas y ningún modelo); para listas grandes.
+- serialize_order(order) / serialize_orders(orders): desde modelos ya
+  cargados (con la mesa e items precargados, como antes).
+
+OrderSerializer sigue siendo el que valida y escribe. Si se le agrega un
+campo hay que agregarlo aquí también (lo verifica un test de paridad).
+"""
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .metrics import timed_serialization
+from .models import Order, OrderItem
+
+STATUS_LABELS = dict(Order.Status.choices)
+CENTS = Decimal('0.01')
+
+ORDER_COLUMNS = (
+    'id', 'table__code', 'status', 'created_at', 'total_price', 'proposed_changes',
+    'preparing_at', 'ready_at', 'delivered_at', 'paid_at', 'version',
+)
+ITEM_COLUMNS = ('order_id', 'id', 'product_name', 'unit_price', 'notes', 'selected_options')
+
+
+def format_price(value):
+    # Como DecimalField de DRF: string con 2 decimales
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return format(value.quantize(CENTS), 'f')
+
+
+def format_datetime(value):
+    # Como DateTimeField de DRF: ISO 8601 en la zona horaria actual
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _order(pk, table_code, status, created_at, items, total_price, proposed_changes,
+           preparing_at, ready_at, delivered_at, paid_at, version):
+    data = {'id': pk}
+    if table_code is not None:
+        # OrderSerializer omite table_code si el pedido no tiene mesa
+        data['table_code'] = table_code
+    data['status'] = status
+    data['status_display'] = STATUS_LABELS.get(status, status)
+    data['created_at'] = format_datetime(created_at)
+    data['items'] = items
+    data['total_price'] = format_price(total_price)
+    data['proposed_changes'] = proposed_changes
+    data['preparing_at'] = format_datetime(preparing_at)
+    data['ready_at'] = format_datetime(ready_at)
+    data['delivered_at'] = format_datetime(delivered_at)
+    data['paid_at'] = format_datetime(paid_at)
+    data['version'] = version
+    return data
+
+
+def _item(pk, product_name, unit_price, notes, selected_options):
+    return {
+        'id': pk,
+        'product_name': product_name,
+        'unit_price': format_price(unit_price),
+        'notes': notes,
+        'selected_options': selected_options,
+    }
+
+
+def serialize_order_rows(queryset):
+    """Pedidos de `queryset` (con su orden) como los da OrderSerializer(many=True)."""
+    with timed_serialization():
+        rows = list(queryset.prefetch_related(None).values_list(*ORDER_COLUMNS))
+        if not rows:
+            return []
+        items = {row[0]: [] for row in rows}
+        item_rows = (
+            OrderItem.objects.filter(order_id__in=list(items))
+            .order_by('id').values_list(*ITEM_COLUMNS)
+        )
+        for order_id, *item in item_rows:
+            items[order_id].append(_item(*item))
+        return [_order(pk, table_code, status, created_at, items[pk], *rest)
+                for pk, table_code, status, created_at, *rest in rows]
+
+
+def serialize_order(order):
+    """`order` (modelo, con mesa e items precargados) como OrderSerializer(order).data."""
+    with timed_serialization():
+        return _order(
+            order.id, order.table.code if order.table_id is not None else None, order.status, order.created_at,
+            serialize_items(order.items.all()), order.total_price, order.proposed_changes,
+            order.preparing_at, order.ready_at, order.delivered_at, order.paid_at, order.version,
+        )
+
+
+def serialize_orders(orders):
+    with timed_serialization():
+        return [serialize_order(order) for order in orders]
+
+
+def serialize_items(items):
+    return [
+        _item(item.id, item.product_name, item.unit_price, item.notes, item.selected_options)
+        for item in items
+    ]
+
+
+# Un campo de la representación a partir del modelo (para ORDER_DELTA, que
+# solo manda los campos que cambiaron y no debe tocar los items si no cambiaron)
+FIELD_GETTERS = {
+    'id': lambda order: order.id,
+    'table_code': lambda order: order.table.code if order.table_id is not None else None,
+    'status': lambda order: order.status,
+    'status_display': lambda order: STATUS_LABELS.get(order.status, order.status),
+    'created_at': lambda order: format_datetime(order.created_at),
+    'items': lambda order: serialize_items(order.items.all()),
+    'total_price': lambda order: format_price(order.total_price),
+    'proposed_changes': lambda order: order.proposed_changes,
+    'preparing_at': lambda order: format_datetime(order.preparing_at),
+    'ready_at': lambda order: format_datetime(order.ready_at),
+    'delivered_at': lambda order: format_datetime(order.delivered_at),
+    'paid_at': lambda order: format_datetime(order.paid_at),
+    'version': lambda order: order.version,
+}
@@ -0,0 +1,148 @@
+# orders/rollups.py
+"""
+Mantenimiento de los rollups diarios (DailySales / DailyProductSales).
+
+Un pedido PAID ya no cambia, así que su aporte se suma una sola vez, dentro
+de la misma transacción que lo marca como pagado.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, Order, OrderItem
+from .sketches import DDSketch
+
+
+def _local_date(field):
+    return TruncDate(field, tzinfo=timezone.get_current_timezone())
+
+
+def order_day_totals(orders):
+    """Agrupa un queryset de Order por día local: {date: (orders_count, total_sales)}."""
+    rows = (
+        orders
+        .annotate(date=_local_date('created_at'))
+        .values('date')
+        .annotate(orders_count=Count('id'), total_sales=Sum('total_price'))
+        .order_by()
+    )
+    return {row['date']: (row['orders_count'], row['total_sales']) for row in rows}
+
+
+def _prep_time():
+    return ExpressionWrapper(F('order__ready_at') - F('order__created_at'), output_field=DurationField())
+
+
+def item_day_product_totals(items):
+    """
+    Agrupa un queryset de OrderItem por (día local, producto):
+    {(date, product_name): (items_count, sales_total, prep_seconds_total, prep_count)}
+    """
+    prep_time = _prep_time()
+    has_prep = Q(order__ready_at__isnull=False)
+    rows = (
+        items
+        .annotate(date=_local_date('order__created_at'))
+        .values('date', 'product_name')
+        .annotate(
+            items_count=Count('id'),
+            sales_total=Sum('unit_price'),
+            prep_total=Sum(prep_time, filter=has_prep),
+            prep_count=Count('id', filter=has_prep),
+        )
+        .order_by()
+    )
+    return {
+        (row['date'], row['product_name']): (
+            row['items_count'],
+            row['sales_total'] or Decimal('0.00'),
+            row['prep_total'].total_seconds() if row['prep_total'] else 0.0,
+            row['prep_count'],
+        )
+        for row in rows
+    }
+
+
+def item_day_product_sketches(items):
+    """
+    Recorre los tiempos de preparación de un queryset de OrderItem en bloques
+    y devuelve {(date, product_name): DDSketch}. La memoria depende de la
+    cantidad de grupos, no de la cantidad de items.
+    """
+    sketches = defaultdict(DDSketch)
+    rows = (
+        items
+        .filter(order__ready_at__isnull=False)
+        .annotate(date=_local_date('order__created_at'), prep_time=_prep_time())
+        .values_list('date', 'product_name', 'prep_time')
+        .order_by()
+    )
+    for date, product_name, prep_time in rows.iterator(chunk_size=2000):
+        sketches[(date, product_name)].add(prep_time.total_seconds())
+    return sketches
+
+
+def _increment(model, key_fields, deltas, sketches=None, sign=1):
+    """
+    Suma `deltas` ({clave: {campo: delta}}) a las filas de `model` con un
+    número fijo de consultas, sin importar cuántas claves haya: crea las que
+    faltan, las bloquea todas en un SELECT ... FOR UPDATE y escribe con un
+    solo bulk_update.
+    """
+    if not deltas:
+        return
+    lookups = [dict(zip(key_fields, key)) for key in deltas]
+    model.objects.bulk_create([model(**lookup) for lookup in lookups], ignore_conflicts=True)
+    rows = list(model.objects.select_for_update().filter(reduce(or_, (Q(**lookup) for lookup in lookups))))
+
+    fields = list(next(iter(deltas.values())))
+    for row in rows:
+        key = tuple(getattr(row, field) for field in key_fields)
+        for field, value in deltas[key].items():
+            setattr(row, field, getattr(row, field) + value)
+        # El JSON no se puede sumar en SQL: la fila ya está bloqueada
+        if sketches and key in sketches:
+            row.prep_sketch = DDSketch.from_dict(row.prep_sketch).merge(sketches[key], sign).to_dict()
+    if sketches:
+        fields.append('prep_sketch')
+    model.objects.bulk_update(rows, fields)
+
+
+def _apply(order_ids, sign):
+    if not order_ids:
+        return
+
+    orders = Order.objects.filter(id__in=order_ids)
+    _increment(DailySales, ('date',), {
+        (date,): {'orders_count': sign * count, 'total_sales': sign * total}
+        for date, (count, total) in order_day_totals(orders).items()
+    })
+
+    items = OrderItem.objects.filter(order_id__in=order_ids)
+    _increment(DailyProductSales, ('date', 'product_name'), {
+        key: {
+            'items_count': sign * count,
+            'sales_total': sign * total,
+            'prep_seconds_total': sign * prep_seconds,
+            'prep_count': sign * prep_count,
+        }
+        for key, (count, total, prep_seconds, prep_count) in item_day_product_totals(items).items()
+    }, sketches=item_day_product_sketches(items), sign=sign)
+
+
+@transaction.atomic
+def record_paid_orders(order_ids):
+    """Suma al rollup los pedidos que acaban de pasar a PAID."""
+    _apply(order_ids, 1)
+
+
+@transaction.atomic
+def remove_paid_orders(order_ids):
+    """Resta del rollup los pedidos que dejaron de estar en PAID."""
+    _apply(order_ids, -1)
@@ -0,0 +1,22 @@
+# orders/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import product_catalog
+from .changes import record_deleted
+from .models import Order, Product
+from .stations import publish_deleted
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_catalog(sender, **kwargs):
+    # Al confirmar: antes, otro worker podría recargar la fila vieja (aún
+    # confirmada) con la versión nueva y servirla hasta catalog.MAX_AGE
+    transaction.on_commit(product_catalog.invalidate)
+
+
+@receiver(post_delete, sender=Order)
+def record_order_tombstone(sender, instance, **kwargs):
+    record_deleted(instance.pk)
+    publish_deleted(instance.pk)
@@ -0,0 +1,162 @@
+# orders/sketches.py
+"""
+DDSketch mínimo para percentiles de tiempos (p50/p90/p99).
+
+Cada valor cae en un bucket logarítmico: el error relativo de cualquier
+percentil queda acotado por RELATIVE_ACCURACY y la memoria por MAX_BINS,
+sin importar cuántos valores se agreguen. Dos sketches se combinan sumando
+sus buckets, así que se pueden guardar por día y mezclar para cualquier
+rango de fechas.
+
+Quitar valores (peso negativo, o merge con sign=-1, al sacar un pedido de
+PAID) es exacto en los conteos mientras el valor caiga en su propio bucket.
+Si ya se juntaron buckets bajos (_collapse), el valor se resta del bucket
+que los juntó (`floor`): el conteo sigue siendo exacto, pero los percentiles
+de esa zona ya tenían menos precisión. min/max no se pueden recuperar al
+quitar; se acotan a los límites de los buckets que quedan, es decir, con el
+mismo error relativo que los percentiles.
+"""
+import math
+
+RELATIVE_ACCURACY = 0.01
+MAX_BINS = 512
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+# Valores menores se cuentan en el bucket "cero" (1 ms en segundos)
+_MIN_VALUE = 1e-3
+
+
+class DDSketch:
+    def __init__(self):
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+        # Índice donde se juntaron los buckets bajos (None si nunca pasó)
+        self.floor = None
+
+    # --- Carga ---
+
+    def _add_to_bin(self, index, count):
+        if self.floor is not None:
+            index = max(index, self.floor)
+        count += self.bins.get(index, 0)
+        if count > 0:
+            self.bins[index] = count
+        else:
+            # Al quitar nunca queda un conteo negativo
+            self.bins.pop(index, None)
+
+    def add(self, value, weight=1):
+        """Agrega `value` con peso `weight`; un peso negativo lo quita (ver arriba)."""
+        if value <= _MIN_VALUE:
+            self.zero_count = max(self.zero_count + weight, 0)
+        else:
+            self._add_to_bin(math.ceil(math.log(value) / _LOG_GAMMA), weight)
+            self._collapse()
+
+        if weight > 0:
+            self.count += weight
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+        else:
+            self._removed()
+        return self
+
+    def merge(self, other, sign=1):
+        if other.floor is not None and (self.floor is None or other.floor > self.floor):
+            self._fold(other.floor)
+        for index, count in other.bins.items():
+            self._add_to_bin(index, sign * count)
+        self.zero_count = max(self.zero_count + sign * other.zero_count, 0)
+        if sign > 0:
+            self.count += other.count
+            if other.count:
+                self.min = other.min if self.min is None else min(self.min, other.min)
+                self.max = other.max if self.max is None else max(self.max, other.max)
+            self._collapse()
+        else:
+            self._removed()
+        return self
+
+    def _fold(self, floor):
+        # Todo lo que está debajo de `floor` pasa a ese bucket
+        below = [index for index in self.bins if index < floor]
+        if below:
+            self.bins[floor] = self.bins.get(floor, 0) + sum(self.bins.pop(index) for index in below)
+        self.floor = floor
+
+    def _collapse(self):
+        # Al superar MAX_BINS se juntan los buckets más bajos: la cola alta
+        # (p90/p99) es la que interesa y conserva su precisión.
+        if len(self.bins) <= MAX_BINS:
+            return
+        indexes = sorted(self.bins)
+        self._fold(indexes[len(indexes) - MAX_BINS])
+
+    def _removed(self):
+        # Tras quitar: el total sale de los buckets y min/max se acotan a ellos
+        self.count = self.zero_count + sum(self.bins.values())
+        if self.count <= 0:
+            self.min = self.max = None
+            return
+        if self.max is not None:
+            self.max = min(self.max, _GAMMA ** max(self.bins) if self.bins else _MIN_VALUE)
+        if self.min is not None and not self.zero_count:
+            # El bucket `floor` junta valores de cualquier tamaño menor
+            low = min(self.bins)
+            if low != self.floor:
+                self.min = max(self.min, _GAMMA ** (low - 1))
+
+    # --- Consulta ---
+
+    def quantile(self, q):
+        if self.count <= 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+
+        value = None
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                value = 2 * _GAMMA ** index / (_GAMMA + 1)
+                break
+        if value is None:
+            value = self.max
+
+        # Nunca fuera del rango observado
+        if self.min is not None:
+            value = max(value, self.min)
+        if self.max is not None:
+            value = min(value, self.max)
+        return value
+
+    # --- Serialización (JSONField) ---
+
+    def to_dict(self):
+        return {
+            'bins': {str(index): count for index, count in sorted(self.bins.items())},
+            'zero': self.zero_count,
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'floor': self.floor,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        if data:
+            sketch.bins = {int(index): count for index, count in data.get('bins', {}).items()}
+            sketch.zero_count = data.get('zero', 0)
+            sketch.count = data.get('count', 0)
+            sketch.min = data.get('min')
+            sketch.max = data.get('max')
+            sketch.floor = data.get('floor')
+        return sketch
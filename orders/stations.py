@@ -0,0 +1,108 @@
+# orders/stations.py
+"""
+Ruteo de eventos de la cocina por estación.
+
+Las pantallas se suscriben con ws/kitchen/?station=JUICE (una categoría de
+producto), ?role=waiters o sin parámetros (todo, como antes). Cada evento de
+pedido va al grupo general, al de meseros y solo a las estaciones que tienen
+items de ese pedido, y cada estación recibe solo sus items. Las llamadas de
+mesero no llegan a las estaciones.
+
+La categoría de cada item sale del catálogo en memoria (orders/catalog.py)
+por product_name; un item de un producto que ya no existe solo se ve en las
+vistas completas.
+"""
+from .catalog import product_catalog
+from .consumers import KITCHEN_GROUP_NAME, WAITERS_GROUP_NAME, station_group
+from .models import Product
+from .outbox import publish
+
+STATIONS = tuple(category for category, _ in Product.CATEGORY_CHOICES)
+FULL_VIEW_GROUPS = (KITCHEN_GROUP_NAME, WAITERS_GROUP_NAME)
+
+
+def _item_name(item):
+    return item['product_name'] if isinstance(item, dict) else item.product_name
+
+
+def categories_by_name(items):
+    """{product_name: categoría} de los items (modelos o dicts serializados)."""
+    names = {_item_name(item) for item in items}
+    return {name: product.category for name, product in product_catalog.get_many(names).items()}
+
+
+def station_items(items, station, categories):
+    return [item for item in items if categories.get(_item_name(item)) == station]
+
+
+def order_stations(items, categories):
+    return {categories[_item_name(item)] for item in items if _item_name(item) in categories}
+
+
+def filter_for_station(orders, station):
+    """Pedidos serializados con solo los items de `station` (y solo los que tienen alguno)."""
+    categories = categories_by_name(item for order in orders for item in order['items'])
+    filtered = []
+    for order in orders:
+        items = station_items(order['items'], station, categories)
+        if items:
+            filtered.append({**order, 'items': items})
+    return filtered
+
+
+def publish_new_order(order_data):
+    categories = categories_by_name(order_data['items'])
+    message = {"type": "send.new.order", "order": order_data}
+    for group in FULL_VIEW_GROUPS:
+        publish(group, message, key=order_data['id'])
+    for station in sorted(order_stations(order_data['items'], categories)):
+        station_order = {**order_data, 'items': station_items(order_data['items'], station, categories)}
+        publish(station_group(station), {"type": "send.new.order", "order": station_order}, key=order_data['id'])
+
+
+def publish_delta(order, delta):
+    """`order` con sus items (precargados) para saber a qué estaciones le importa."""
+    message = {"type": "send.order.delta", "delta": delta}
+    for group in FULL_VIEW_GROUPS:
+        publish(group, message, key=order.id)
+
+    changed_items = delta['changes'].get('items')
+    if changed_items is None:
+        categories = categories_by_name(order.items.all())
+        for station in sorted(order_stations(order.items.all(), categories)):
+            publish(station_group(station), message, key=order.id)
+        return
+
+    # Cambiaron los items: todas las estaciones reciben su parte (vacía si el
+    # pedido ya no tiene nada suyo, para que lo quiten de la pantalla)
+    categories = categories_by_name(changed_items)
+    for station in STATIONS:
+        changes = {**delta['changes'], 'items': station_items(changed_items, station, categories)}
+        publish(station_group(station), {**message, "delta": {**delta, 'changes': changes}}, key=order.id)
+
+
+def publish_batch(orders, deltas):
+    message = {"type": "send.orders.batch", "deltas": deltas}
+    for group in FULL_VIEW_GROUPS:
+        publish(group, message)
+
+    by_station = {}
+    items = [item for order in orders for item in order.items.all()]
+    categories = categories_by_name(items)
+    for order, delta in zip(orders, deltas):
+        for station in order_stations(order.items.all(), categories):
+            by_station.setdefault(station, []).append(delta)
+    for station, station_deltas in sorted(by_station.items()):
+        publish(station_group(station), {**message, "deltas": station_deltas})
+
+
+def publish_waiter_call(table_code, status):
+    message = {"type": "waiter.call", "table_code": table_code, "status": status}
+    for group in FULL_VIEW_GROUPS:
+        publish(group, message, key=table_code)
+
+
+def publish_deleted(order_id):
+    message = {"type": "send.order.deleted", "id": order_id}
+    for group in FULL_VIEW_GROUPS + tuple(station_group(station) for station in STATIONS):
+        publish(group, message, key=order_id)
@@ -1,3 +1,1686 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import math
+import os
+import random
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+import uuid
 
-# Create your tests here.
+import msgpack
+import openpyxl
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib import admin
+from django.contrib.auth.models import Group, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .changes import SETTLE_WINDOW
+from .consumers import KitchenConsumer, TableConsumer
+from .cursors import encode_cursor
+from .jobs import claim_job, enqueue_report, run_job
+from .order_items import build_items, write_order_items
+from . import fast_json
+from . import catalog
+from .catalog import ProductCatalog, product_catalog
+from .models import DailyProductSales, DailySales, Order, OrderItem, Product, ReportJob, Review, Table
+from .metrics import GROUP_SEND_FAILURES, render
+from .outbox import coalesce, publish
+from .representations import FIELD_GETTERS, serialize_order, serialize_order_rows, serialize_orders
+from .renderers import FastJSONParser, FastJSONRenderer
+from .rollups import record_paid_orders, remove_paid_orders
+from .serializers import OrderSerializer, order_deltas
+from .sketches import MAX_BINS, RELATIVE_ACCURACY, DDSketch
+from .transitions import TRANSITIONS, TransitionConflict, apply_transition, status_transition
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class DashboardStatsTests(APITestCase):
+    """Series del Dashboard agrupadas en SQL respetando TIME_ZONE='America/Lima' (UTC-5)."""
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('admin', password='x'))
+        self.table = Table.objects.create(code='M-01')
+
+        # 03:30 UTC del 10/01 = 22:30 del 09/01 en Lima
+        a = self._order(utc(2025, 1, 10, 3, 30), Order.Status.PAID, [('Jugo de Fresa', '10.00')])
+        b = self._order(utc(2025, 1, 10, 15, 0), Order.Status.PAID, [('Club Sandwich', '20.00')])
+        self._order(utc(2025, 1, 10, 15, 40), Order.Status.DELIVERED, [('Jugo de Fresa', '5.00')])
+        d = self._order(utc(2025, 2, 3, 17, 0), Order.Status.PAID, [('Club Sandwich', '7.00')])
+        record_paid_orders([a.id, b.id, d.id])
+
+    def _order(self, created_at, status, items, prep_minutes=10):
+        order = Order.objects.create(table=self.table, status=status)
+        for name, price in items:
+            OrderItem.objects.create(order=order, product_name=name, unit_price=Decimal(price))
+        Order.objects.filter(pk=order.pk).update(
+            created_at=created_at,
+            ready_at=created_at + timedelta(minutes=prep_minutes),
+            total_price=sum(Decimal(price) for _, price in items),
+        )
+        return order
+
+    def _stats(self, **params):
+        response = self.client.get('/api/dashboard/stats/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def _history(self, **params):
+        return [(row['date'], row['total']) for row in self._stats(**params)['sales_history']]
+
+    def test_daily_buckets_use_local_date(self):
+        self.assertEqual(self._history(), [
+            ('2025-01-09', Decimal('10.00')),
+            ('2025-01-10', Decimal('25.00')),
+            ('2025-02-03', Decimal('7.00')),
+        ])
+
+    def test_hourly_buckets(self):
+        self.assertEqual(self._history(granularity='hour', **{'from': '2025-01-10', 'to': '2025-01-10'}), [
+            ('2025-01-10T10:00:00-05:00', Decimal('25.00')),
+        ])
+
+    def test_weekly_and_monthly_buckets(self):
+        self.assertEqual(self._history(granularity='week'), [
+            ('2025-01-06', Decimal('35.00')),
+            ('2025-02-03', Decimal('7.00')),
+        ])
+        self.assertEqual(self._history(granularity='month'), [
+            ('2025-01-01', Decimal('35.00')),
+            ('2025-02-01', Decimal('7.00')),
+        ])
+
+    def test_date_range_limits_every_block(self):
+        data = self._stats(**{'from': '2025-01-10', 'to': '2025-01-31'})
+        self.assertEqual(data['kpi']['orders_count'], 2)
+        self.assertEqual(data['kpi']['total_sales'], Decimal('25.00'))
+        self.assertEqual(data['top_products'], [
+            {'product_name': 'Club Sandwich', 'total': 1},
+            {'product_name': 'Jugo de Fresa', 'total': 1},
+        ])
+
+    def test_prep_time_percentiles(self):
+        slow = self._order(utc(2025, 1, 11, 15, 0), Order.Status.PAID, [('Jugo de Fresa', '10.00')], prep_minutes=30)
+        slowest = self._order(utc(2025, 1, 12, 15, 0), Order.Status.PAID, [('Jugo de Fresa', '10.00')], prep_minutes=60)
+        record_paid_orders([slow.id, slowest.id])
+
+        def percentiles():
+            stats = self._stats()
+            juice = next(row for row in stats['prep_time_by_product'] if row['product'] == 'Jugo de Fresa')
+            return stats['kpi']['prep_time_percentiles_minutes'], juice
+
+        # Todos: 10 x5, 30, 60 minutos. Jugo de Fresa: 10, 10, 30, 60
+        overall, juice = percentiles()
+        for result, expected in ((overall, (10, 30, 30)), (juice, (10, 30, 30))):
+            for name, minutes in zip(('p50', 'p90', 'p99'), expected):
+                self.assertAlmostEqual(result[name], minutes, delta=minutes * 0.01 + 0.05)
+
+        # Al dejar de estar en PAID sale del sketch guardado en el rollup
+        Order.objects.filter(pk=slow.pk).update(status=Order.Status.READY)
+        remove_paid_orders([slow.id])
+        overall, juice = percentiles()
+        self.assertAlmostEqual(overall['p99'], 10, delta=0.15)
+        self.assertAlmostEqual(juice['p90'], 10, delta=0.15)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/dashboard/stats/', {'granularity': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/dashboard/stats/', {'from': '10/01/2025'}).status_code, 400)
+
+
+class RollupTests(APITestCase):
+    """Rollups diarios: suma/resta al pagar y reconciliación con rebuild_sales_rollup."""
+
+    def setUp(self):
+        self.table = Table.objects.create(code='M-01')
+
+    def _paid(self, created_at, items, prep_minutes=10):
+        order = Order.objects.create(table=self.table, status=Order.Status.PAID)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_name=name, unit_price=Decimal(price)) for name, price in items
+        ])
+        Order.objects.filter(pk=order.pk).update(
+            created_at=created_at, ready_at=created_at + timedelta(minutes=prep_minutes),
+            total_price=sum(Decimal(price) for _, price in items),
+        )
+        return order.pk
+
+    def _products(self):
+        return {
+            (row.date.isoformat(), row.product_name): (row.items_count, row.sales_total, row.prep_count)
+            for row in DailyProductSales.objects.all()
+        }
+
+    def test_record_and_remove(self):
+        # 03:30 UTC del 10/01 es el 09/01 en Lima
+        a = self._paid(utc(2025, 1, 10, 3, 30), [('Jugo de Fresa', '10.00'), ('Café', '6.50')])
+        b = self._paid(utc(2025, 1, 10, 15, 0), [('Jugo de Fresa', '10.00')])
+        record_paid_orders([a, b])
+        self.assertEqual(
+            {row.date.isoformat(): (row.orders_count, row.total_sales) for row in DailySales.objects.all()},
+            {'2025-01-09': (1, Decimal('16.50')), '2025-01-10': (1, Decimal('10.00'))},
+        )
+        self.assertEqual(self._products(), {
+            ('2025-01-09', 'Jugo de Fresa'): (1, Decimal('10.00'), 1),
+            ('2025-01-09', 'Café'): (1, Decimal('6.50'), 1),
+            ('2025-01-10', 'Jugo de Fresa'): (1, Decimal('10.00'), 1),
+        })
+
+        c = self._paid(utc(2025, 1, 10, 16, 0), [('Jugo de Fresa', '10.00')])
+        record_paid_orders([c])
+        remove_paid_orders([a])
+        self.assertEqual(DailySales.objects.get(date='2025-01-10').orders_count, 2)
+        self.assertEqual(self._products(), {
+            ('2025-01-09', 'Jugo de Fresa'): (0, Decimal('0.00'), 0),
+            ('2025-01-09', 'Café'): (0, Decimal('0.00'), 0),
+            ('2025-01-10', 'Jugo de Fresa'): (2, Decimal('20.00'), 2),
+        })
+        sketch = DDSketch.from_dict(DailyProductSales.objects.get(date='2025-01-10').prep_sketch)
+        self.assertEqual(sketch.count, 2)
+
+    def test_constant_queries_for_distinct_products(self):
+        counts = []
+        for products in (1, 10):
+            order = self._paid(utc(2025, 1, 10, 15, 0), [(f'Producto {n}', '1.00') for n in range(products)])
+            with CaptureQueriesContext(connection) as queries:
+                record_paid_orders([order])
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(DailyProductSales.objects.filter(items_count=1).count(), 9)
+        self.assertEqual(DailyProductSales.objects.get(product_name='Producto 0').items_count, 2)
+
+    def _rebuild(self, *args):
+        out = io.StringIO()
+        call_command('rebuild_sales_rollup', *args, stdout=out)
+        return out.getvalue()
+
+    def test_rebuild_creates_fixes_and_deletes(self):
+        recorded = self._paid(utc(2025, 1, 10, 15, 0), [('Jugo de Fresa', '10.00')])
+        record_paid_orders([recorded])
+        # Pagado sin pasar por el rollup, una fila desfasada y una que sobra
+        self._paid(utc(2025, 1, 11, 15, 0), [('Café', '6.50')])
+        DailySales.objects.filter(date='2025-01-10').update(orders_count=5)
+        DailyProductSales.objects.create(date='2025-01-12', product_name='Club Sandwich', items_count=3)
+        before = (list(DailySales.objects.values()), list(DailyProductSales.objects.values()))
+
+        output = self._rebuild('--dry-run')
+        self.assertIn('[dry-run] DailySales: 1 creadas, 1 corregidas, 0 borradas.', output)
+        self.assertIn('DailyProductSales: 1 creadas, 0 corregidas, 1 borradas.', output)
+        self.assertEqual((list(DailySales.objects.values()), list(DailyProductSales.objects.values())), before)
+
+        self._rebuild()
+        self.assertEqual(
+            {row.date.isoformat(): row.orders_count for row in DailySales.objects.all()},
+            {'2025-01-10': 1, '2025-01-11': 1},
+        )
+        self.assertEqual(self._products(), {
+            ('2025-01-10', 'Jugo de Fresa'): (1, Decimal('10.00'), 1),
+            ('2025-01-11', 'Café'): (1, Decimal('6.50'), 1),
+        })
+        self.assertIn('DailySales: 0 creadas, 0 corregidas, 0 borradas.', self._rebuild())
+
+
+class BenchQueryPlansTests(APITestCase):
+    """bench_query_plans nunca altera el esquema de la base configurada."""
+
+    def _indexes(self):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.get_constraints(cursor, Order._meta.db_table))
+
+    def test_compare_requires_seed(self):
+        before = self._indexes()
+        with self.assertRaisesMessage(CommandError, '--seed'):
+            call_command('bench_query_plans', '--compare', stdout=io.StringIO())
+        self.assertEqual(self._indexes(), before)
+
+    def test_measures_the_configured_database_read_only(self):
+        table = Table.objects.create(code='T1')
+        Order.objects.create(table=table, status=Order.Status.PAID, total_price=Decimal('10.00'))
+        before = (self._indexes(), Order.objects.count())
+        out = io.StringIO()
+        call_command('bench_query_plans', '--repeat', '1', stdout=out)
+        self.assertIn('[close_table_unpaid]', out.getvalue())
+        self.assertEqual((self._indexes(), Order.objects.count()), before)
+
+
+class PopulateDataTests(APITestCase):
+    """populate_data: datos coherentes, reproducibles con la misma semilla y con el rollup al día."""
+
+    now = utc(2025, 1, 10, 20, 0)  # 15:00 en Lima
+
+    def _populate(self, *args):
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            call_command('populate_data', '--days', '3', '--orders-per-day', '12', '--active', '6',
+                         '--tables', '4', '--chunk-size', '5', *args, stdout=io.StringIO())
+
+    def _snapshot(self):
+        return (
+            list(Order.objects.order_by('id').values()),
+            list(OrderItem.objects.order_by('id').values()),
+            list(Review.objects.order_by('id').values()),
+        )
+
+    def test_consistent_and_reproducible(self):
+        self._populate()
+        orders = Order.objects.prefetch_related('items')
+        self.assertGreater(len(orders), 20)
+        self.assertEqual(Table.objects.count(), 4)
+        for order in orders:
+            items = list(order.items.all())
+            self.assertTrue(1 <= len(items) <= 4)
+            self.assertEqual(order.total_price, sum(item.unit_price for item in items))
+            self.assertLessEqual(order.created_at, self.now)
+            if order.status == Order.Status.PAID:
+                self.assertTrue(order.created_at < order.preparing_at < order.ready_at < order.paid_at <= self.now)
+        self.assertTrue(Order.objects.exclude(status=Order.Status.PAID).exists())
+        # Las mesas con pedidos sin pagar quedan ocupadas
+        self.assertEqual(
+            set(Table.objects.filter(status=Table.Status.OCUPADA).values_list('id', flat=True)),
+            set(Order.objects.exclude(status=Order.Status.PAID).values_list('table_id', flat=True)),
+        )
+        # Rollup reconstruido
+        self.assertEqual(
+            sum(DailySales.objects.values_list('orders_count', flat=True)),
+            Order.objects.filter(status=Order.Status.PAID).count(),
+        )
+
+        first = self._snapshot()
+        Order.objects.all().delete()
+        self._populate()
+        self.assertEqual(self._snapshot(), first)
+
+        Order.objects.all().delete()
+        self._populate('--seed', '7')
+        self.assertNotEqual(self._snapshot(), first)
+
+
+class ReportJobTests(APITestCase):
+    """Reportes en segundo plano: encolar, tomar, ejecutar y descargar."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='clave-segura')
+        table = Table.objects.create(code='M-01')
+        self.orders = [Order.objects.create(table=table, status=Order.Status.PAID) for _ in range(3)]
+        for order in self.orders:
+            OrderItem.objects.create(order=order, product_name='Jugo de Fresa', unit_price=Decimal('4.50'))
+        reports_root = tempfile.TemporaryDirectory()
+        self.addCleanup(reports_root.cleanup)
+        self.enterContext(override_settings(REPORTS_ROOT=reports_root.name))
+
+    def _run(self, job):
+        self.assertEqual(claim_job(), job.id)
+        run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.Status.DONE, job.error)
+        return job
+
+    def test_enqueue_stores_the_selected_pks(self):
+        selected = Order.objects.filter(pk__in=[self.orders[2].pk, self.orders[0].pk])
+        job = enqueue_report(ReportJob.Kind.ORDERS, ReportJob.Format.CSV, queryset=selected, user=self.admin)
+        job.refresh_from_db()
+        self.assertEqual(job.object_ids, [self.orders[0].pk, self.orders[2].pk])
+        self.assertEqual(job.requested_by, self.admin)
+        self.assertIsNone(enqueue_report(ReportJob.Kind.ORDERS).object_ids)
+
+    def test_claim_job_takes_each_job_once(self):
+        first = enqueue_report(ReportJob.Kind.ORDERS)
+        second = enqueue_report(ReportJob.Kind.ITEMS)
+        self.assertEqual([claim_job(), claim_job(), claim_job()], [first.id, second.id, None])
+        first.refresh_from_db()
+        self.assertEqual(first.status, ReportJob.Status.RUNNING)
+        self.assertIsNotNone(first.started_at)
+
+    def test_run_job_exports_only_the_selection(self):
+        selected = Order.objects.filter(pk__in=[self.orders[0].pk, self.orders[2].pk])
+        job = self._run(enqueue_report(ReportJob.Kind.ORDERS, ReportJob.Format.CSV, queryset=selected))
+        with open(job.file_path, newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0][:3], ['Order ID', 'Mesa', 'Estado'])
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.orders[0].pk), str(self.orders[2].pk)])
+        self.assertEqual((job.total, job.progress), (2, 2))
+
+        # Sin selección: todas las filas, también en XLSX
+        job = self._run(enqueue_report(ReportJob.Kind.ITEMS))
+        self.assertTrue(job.file_path.endswith('.xlsx'))
+        self.assertEqual(job.total, 3)
+
+    def test_run_job_records_failures(self):
+        job = enqueue_report(ReportJob.Kind.ORDERS)
+        claim_job()
+        with mock.patch('orders.jobs.write_xlsx', side_effect=OSError('disco lleno')):
+            run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.Status.FAILED)
+        self.assertIn('disco lleno', job.error)
+
+    def test_admin_download(self):
+        job = self._run(enqueue_report(ReportJob.Kind.ORDERS, ReportJob.Format.CSV))
+        pending = enqueue_report(ReportJob.Kind.ORDERS)
+        url = reverse('admin:orders_reportjob_download', args=[job.pk])
+
+        self.assertEqual(self.client.get(url).status_code, 302)  # Login del admin
+        self.client.force_login(self.admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'Order ID,Mesa'))
+        self.assertEqual(self.client.get(reverse('admin:orders_reportjob_download', args=[pending.pk])).status_code, 404)
+
+    def test_select_all_stores_the_changelist_filters(self):
+        Order.objects.create(table=self.orders[0].table, status=Order.Status.NEW)
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:orders_order_changelist') + '?status__exact=PAID&p=1', {
+            'action': 'background_orders_csv', 'index': 0, 'select_across': '1',
+            '_selected_action': [self.orders[0].pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        job = ReportJob.objects.get()
+        self.assertEqual((job.object_ids, job.filters), (None, {'status__exact': ['PAID']}))
+
+        job = self._run(job)
+        with open(job.file_path, newline='', encoding='utf-8') as f:
+            exported = [row[0] for row in list(csv.reader(f))[1:]]
+        self.assertEqual(exported, [str(order.pk) for order in self.orders])
+        self.assertEqual(job.total, 3)
+
+    def test_rollup_action_needs_no_selection(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(reverse('admin:orders_order_changelist'),
+                                    {'action': 'background_rollup', 'index': 0})
+        self.assertEqual(response.status_code, 302)
+        job = ReportJob.objects.get()
+        self.assertEqual((job.kind, job.object_ids), (ReportJob.Kind.ROLLUP, None))
+
+        # Las demás acciones siguen pidiendo filas marcadas
+        self.client.post(reverse('admin:orders_order_changelist'), {'action': 'background_orders_csv', 'index': 0})
+        self.assertEqual(ReportJob.objects.count(), 1)
+
+
+class ProductCatalogTests(APITestCase):
+    """Catálogo de productos en memoria: aciertos sin consultas, faltantes con una, invalidación."""
+
+    def setUp(self):
+        self.juice = Product.objects.create(name='Jugo de Fresa', category='JUICE', base_price=Decimal('8.50'))
+        Product.objects.create(name='Club Sandwich', category='SANDWICH', base_price=Decimal('15.00'))
+        self.catalog = ProductCatalog()
+
+    def test_misses_load_with_one_query(self):
+        with self.assertNumQueries(1):
+            found = self.catalog.get_many(['Jugo de Fresa', 'Club Sandwich', 'No existe'])
+        self.assertEqual(set(found), {'Jugo de Fresa', 'Club Sandwich'})
+        self.assertEqual(found['Jugo de Fresa'].base_price, Decimal('8.50'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.catalog.get('Club Sandwich').category, 'SANDWICH')
+            self.assertEqual(self.catalog.get_by_id(self.juice.id).name, 'Jugo de Fresa')
+        # Lo que no existe se vuelve a buscar (puede crearse después)
+        with self.assertNumQueries(1):
+            self.assertIsNone(self.catalog.get('No existe'))
+
+    def test_saving_a_product_invalidates_every_copy(self):
+        # `other` hace de otro proceso que comparte el cache
+        other = ProductCatalog()
+        self.catalog.get('Jugo de Fresa')
+        other.get('Jugo de Fresa')
+
+        self.juice.base_price = Decimal('9.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.juice.save()
+        self.assertEqual(self.catalog.get('Jugo de Fresa').base_price, Decimal('9.00'))
+        self.assertEqual(other.get('Jugo de Fresa').base_price, Decimal('9.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.juice.delete()
+        self.assertIsNone(other.get('Jugo de Fresa'))
+
+    def test_version_changes_only_on_commit(self):
+        before = catalog.cache.get(catalog.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.juice.base_price = Decimal('9.00')
+            self.juice.save()
+            # Todavía dentro de la transacción: otro worker ve la fila vieja
+            self.assertEqual(catalog.cache.get(catalog.VERSION_KEY), before)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(catalog.cache.get(catalog.VERSION_KEY), before)
+
+    def test_copies_expire_without_the_shared_cache(self):
+        self.catalog.get('Jugo de Fresa')
+        Product.objects.filter(pk=self.juice.pk).update(base_price=Decimal('9.00'))  # Sin señales
+        self.assertEqual(self.catalog.get('Jugo de Fresa').base_price, Decimal('8.50'))
+
+        later = catalog.time.monotonic() + catalog.MAX_AGE + 1
+        with mock.patch.object(catalog.time, 'monotonic', return_value=later):
+            self.assertEqual(self.catalog.get('Jugo de Fresa').base_price, Decimal('9.00'))
+
+    def test_cache_errors_fall_back_to_the_database(self):
+        self.catalog.get('Jugo de Fresa')
+        with mock.patch.object(catalog.cache, 'get', side_effect=ConnectionError('redis caído')), \
+                self.assertLogs('orders.catalog', 'WARNING'):
+            self.assertEqual(self.catalog.get('Jugo de Fresa').base_price, Decimal('8.50'))
+
+
+class OrderPaginationTests(APITestCase):
+    """Listado de pedidos por cursor (created_at, id), también con created_at repetidos."""
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create_user('mesero'))
+        table = Table.objects.create(code='M-01')
+        orders = Order.objects.bulk_create([
+            Order(table=table, status=Order.Status.PAID if i % 2 else Order.Status.NEW) for i in range(7)
+        ])
+        # Tres pedidos con el mismo created_at, en medio del listado
+        same = utc(2025, 1, 10, 12, 0)
+        for i, order in enumerate(orders):
+            created_at = same if 2 <= i <= 4 else utc(2025, 1, 10, 12, 0) + timedelta(minutes=i - 3)
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        self.expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def _ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [order['id'] for order in response.json()['results']]
+
+    def test_next_and_previous_across_equal_created_at(self):
+        pages, response = [], self.client.get('/api/orders/?page_size=2')
+        while True:
+            pages.append(self._ids(response))
+            if response.json()['next'] is None:
+                break
+            response = self.client.get(response.json()['next'])
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+
+        # De vuelta con previous: las mismas páginas, en orden inverso
+        back = []
+        while response.json()['previous'] is not None:
+            response = self.client.get(response.json()['previous'])
+            back.append(self._ids(response))
+        self.assertEqual(back, pages[-2::-1])
+
+    def test_page_size_is_capped(self):
+        table = Table.objects.get()
+        Order.objects.bulk_create([Order(table=table) for _ in range(500)])
+        response = self.client.get('/api/orders/?page_size=100000')
+        self.assertEqual(len(self._ids(response)), 500)
+        self.assertIsNotNone(response.json()['next'])
+        self.assertEqual(len(self._ids(self.client.get('/api/orders/?page_size=abc'))), 50)
+
+    def test_malformed_cursor_is_rejected(self):
+        naive = encode_cursor(datetime(2025, 1, 10, 12, 0), 1)
+        for cursor in ('no-es-base64', 'eyJ0IjoieCJ9', naive):  # el segundo: {"t":"x"}
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/orders/?cursor={cursor}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['detail'], 'Cursor inválido.')
+
+    def test_active_status_filter_is_not_paginated(self):
+        active = self.client.get('/api/orders/?status=NEW,READY&page_size=1').json()
+        self.assertIsInstance(active, list)
+        self.assertEqual(len(active), 4)
+
+        for status in ('PAID', 'NEW,PAID'):
+            with self.subTest(status=status):
+                paid = self.client.get(f'/api/orders/?status={status}&page_size=1').json()
+                self.assertEqual(len(paid['results']), 1)
+                self.assertIsNotNone(paid['next'])
+
+
+class DDSketchTests(APITestCase):
+    """Percentiles de tiempos de preparación (orders/sketches.py)."""
+
+    def setUp(self):
+        rng = random.Random(4)
+        # Minutos de preparación en segundos: cola larga, como en la cocina
+        self.values = [rng.lognormvariate(6, 0.6) for _ in range(5000)]
+
+    def _sketch(self, values):
+        sketch = DDSketch()
+        for value in values:
+            sketch.add(value)
+        return sketch
+
+    def assertAccurate(self, sketch, values):
+        ordered = sorted(values)
+        for q in (0.0, 0.25, 0.5, 0.9, 0.99, 1.0):
+            exact = ordered[math.floor(q * (len(ordered) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), RELATIVE_ACCURACY * exact + 1e-9, q)
+
+    def test_relative_accuracy(self):
+        sketch = self._sketch(self.values)
+        self.assertAccurate(sketch, self.values)
+        self.assertEqual((sketch.min, sketch.max), (min(self.values), max(self.values)))
+        self.assertIsNone(DDSketch().quantile(0.5))
+
+    def test_merge_equals_one_sketch(self):
+        merged = self._sketch(self.values[:2000]).merge(self._sketch(self.values[2000:]))
+        self.assertEqual(merged.to_dict(), self._sketch(self.values).to_dict())
+
+    def test_round_trip(self):
+        sketch = self._sketch(self.values + [0.0])
+        data = json.loads(json.dumps(sketch.to_dict()))
+        self.assertEqual(DDSketch.from_dict(data).to_dict(), sketch.to_dict())
+        self.assertEqual(DDSketch.from_dict(None).count, 0)
+
+    def test_removal_is_exact_and_bounds_min_max(self):
+        kept, removed = self.values[:4000], self.values[4000:]
+        sketch = self._sketch(self.values)
+        for value in removed:
+            sketch.add(value, -1)
+        expected = self._sketch(kept)
+        self.assertEqual((sketch.bins, sketch.count), (expected.bins, expected.count))
+        self.assertAccurate(sketch, kept)
+        # min/max quedan dentro de la precisión del sketch
+        self.assertLessEqual(sketch.max, max(kept) * (1 + 2 * RELATIVE_ACCURACY))
+        self.assertGreaterEqual(sketch.min, min(kept) * (1 - 2 * RELATIVE_ACCURACY))
+
+        # Quitar con merge(sign=-1), como remove_paid_orders
+        sketch.merge(self._sketch(kept), sign=-1)
+        self.assertEqual((sketch.count, sketch.bins, sketch.min, sketch.max), (0, {}, None, None))
+        sketch.add(5.0, -1)  # Quitar de más no deja conteos negativos
+        self.assertEqual(sketch.count, 0)
+
+    def test_removal_after_collapsing_low_bins(self):
+        # Valores en más de MAX_BINS buckets: los más bajos se juntan en `floor`
+        values = [1.03 ** i for i in range(MAX_BINS + 100)]
+        sketch = self._sketch(values)
+        self.assertEqual(len(sketch.bins), MAX_BINS)
+        self.assertIsNotNone(sketch.floor)
+        for value in values[:50]:
+            sketch.add(value, -1)
+        self.assertEqual(sketch.count, len(values) - 50)
+        self.assertEqual(sum(sketch.bins.values()), sketch.count)
+        self.assertTrue(all(count > 0 for count in sketch.bins.values()))
+        # La cola alta no se ve afectada
+        self.assertAlmostEqual(sketch.quantile(1.0), values[-1], delta=values[-1] * RELATIVE_ACCURACY)
+
+        # Mezclar con un sketch sin colapsar respeta el floor
+        other = self._sketch(values[:10])
+        other.merge(sketch)
+        self.assertEqual(other.floor, sketch.floor)
+        self.assertTrue(all(index >= sketch.floor for index in other.bins))
+        other.merge(self._sketch(values[:10]), sign=-1)
+        self.assertEqual(other.to_dict()['bins'], sketch.to_dict()['bins'])
+
+
+class ExportTests(APITestCase):
+    """Exportaciones del admin en streaming (CSV y XLSX write-only)."""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='clave-segura'))
+        order = Order.objects.create(table=Table.objects.create(code='M-01'))
+        Order.objects.filter(pk=order.pk).update(created_at=utc(2025, 1, 10, 15, 30))
+        self.item = OrderItem.objects.create(order=order, product_name='Jugo de Fresa', unit_price=Decimal('4.50'))
+        OrderItem.objects.create(order=order, product_name='Club Sandwich', unit_price=Decimal('15.00'))
+
+    def _export(self, action):
+        response = self.client.post(reverse('admin:orders_orderitem_changelist'), {
+            'action': action, 'index': 0, admin.helpers.ACTION_CHECKBOX_NAME: [self.item.pk],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self._export('export_to_csv').decode())))
+        self.assertEqual(rows, [
+            ['Item ID', 'Order ID', 'Mesa', 'Producto', 'Precio Unitario', 'Fecha de Creación'],
+            [str(self.item.pk), str(self.item.order_id), 'M-01', 'Jugo de Fresa', '4.50', '2025-01-10 10:30'],
+        ])
+
+    def test_xlsx(self):
+        workbook = openpyxl.load_workbook(io.BytesIO(self._export('export_to_excel')), read_only=True)
+        sheet = workbook['Items de Pedidos']
+        rows = [list(row) for row in sheet.iter_rows(values_only=True)]
+        self.assertEqual(rows[0], ['Item ID', 'Order ID', 'Mesa', 'Producto', 'Precio Unitario', 'Fecha de Creación'])
+        self.assertEqual(rows[1:], [[self.item.pk, self.item.order_id, 'M-01', 'Jugo de Fresa', 4.5, '2025-01-10 10:30']])
+
+
+class OrderChangesTests(APITestCase):
+    """Sincronización incremental de /api/orders/changes/."""
+
+    def setUp(self):
+        self.table = Table.objects.create(code='M-01')
+        self.old = Order.objects.create(table=self.table)
+        self.recent = Order.objects.create(table=self.table)
+        # El cursor queda entre ambos pedidos
+        Order.objects.filter(pk=self.old.pk).update(updated_at=utc(2025, 1, 10, 12, 0))
+        Order.objects.filter(pk=self.recent.pk).update(updated_at=utc(2025, 1, 10, 12, 5))
+        self.cursor = encode_cursor(utc(2025, 1, 10, 12, 1), 0)
+
+    def _changes(self, **params):
+        response = self.client.get('/api/orders/changes/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_without_cursor_only_returns_a_new_cursor(self):
+        data = self._changes()
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['orders'], [])
+
+    def test_returns_changed_and_deleted_orders_since_cursor(self):
+        with mock.patch('django.utils.timezone.now', return_value=utc(2025, 1, 10, 13, 0)):
+            deleted = Order.objects.create(table=self.table)
+            deleted_id = deleted.id
+            deleted.delete()
+            data = self._changes(since=self.cursor)
+
+        self.assertFalse(data['reset'])
+        self.assertEqual([o['id'] for o in data['orders']], [self.recent.id])
+        self.assertEqual(data['deleted'], [deleted_id])
+
+    def test_pages_with_limit_and_keeps_settle_window(self):
+        with mock.patch('django.utils.timezone.now', return_value=utc(2025, 1, 10, 13, 0)):
+            first = self._changes(since=encode_cursor(utc(2025, 1, 10), 0), limit=1)
+            second = self._changes(since=first['cursor'], limit=1)
+        self.assertTrue(first['has_more'])
+        self.assertEqual([o['id'] for o in first['orders']], [self.old.id])
+        self.assertFalse(second['has_more'])
+        self.assertEqual([o['id'] for o in second['orders']], [self.recent.id])
+        self.assertEqual(second['cursor'], encode_cursor(utc(2025, 1, 10, 13, 0) - SETTLE_WINDOW, 0))
+
+    def test_invalid_cursor(self):
+        naive = encode_cursor(datetime(2025, 1, 10, 12, 0), 0)
+        for since in ('xx', 'eyJ0IjoieCJ9', naive):
+            with self.subTest(since=since):
+                response = self.client.get('/api/orders/changes/', {'since': since})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['detail'], 'Cursor inválido.')
+
+
+IN_MEMORY_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class OrderItemsWriteTests(APITestCase):
+    """Escritura de items (orders/order_items.py): validación, total y versión."""
+
+    def setUp(self):
+        self.table = Table.objects.create(code='M-01')
+        Product.objects.create(name='Jugo de Fresa', category='JUICE', base_price=Decimal('8.50'))
+        self.order = Order.objects.create(table=self.table)
+        OrderItem.objects.create(order=self.order, product_name='Club Sandwich', unit_price=Decimal('15.00'))
+
+    def test_build_items_validates_everything_first(self):
+        prices = {'Jugo de Fresa': Decimal('8.50')}
+        self.assertEqual(build_items([{'product_name': 'Jugo de Fresa'}], lambda item: prices[item['product_name']]),
+                         [({'product_name': 'Jugo de Fresa'}, Decimal('8.50'))])
+        for items in ([{'notes': 'sin nombre'}], [{'product_name': ''}]):
+            with self.subTest(items=items), self.assertRaises(ValueError):
+                build_items(items, lambda item: Decimal('1'))
+        with self.assertRaises(KeyError):
+            build_items([{'product_name': 'Jugo de Fresa'}, {'product_name': 'No existe'}],
+                        lambda item: prices[item['product_name']])
+
+    def test_write_replaces_items_and_recomputes_total(self):
+        order = Order.objects.prefetch_related('items').get(pk=self.order.pk)
+        self.assertEqual(len(order.items.all()), 1)
+        priced = build_items(
+            [{'product_name': 'Jugo de Fresa', 'notes': 'Sin azúcar'}, {'product_name': 'Jugo de Fresa'}],
+            lambda item: Decimal('8.50'),
+        )
+        total = write_order_items(order, priced, status=Order.Status.PREPARING)
+
+        self.assertEqual(total, Decimal('17.00'))
+        self.assertEqual((order.total_price, order.version, order.status), (Decimal('17.00'), 2, 'PREPARING'))
+        # Los items precargados se descartan: se leen de nuevo
+        self.assertEqual([item.notes for item in order.items.order_by('id')], ['Sin azúcar', None])
+        order.refresh_from_db()
+        self.assertEqual((order.total_price, order.version, order.status), (Decimal('17.00'), 2, 'PREPARING'))
+
+        write_order_items(order, build_items([{'product_name': 'Café'}], lambda item: Decimal('6.50')), replace=False)
+        order.refresh_from_db()
+        self.assertEqual((order.items.count(), order.version), (3, 3))
+        # El total es el de los items escritos en esta llamada
+        self.assertEqual(order.total_price, Decimal('6.50'))
+
+    def test_invalid_item_payloads_write_nothing(self):
+        self.client.force_authenticate(User.objects.create_user('mesero'))
+        for items in ([{'product_name': 'No existe'}], [{'notes': 'sin producto'}]):
+            with self.subTest(items=items):
+                response = self.client.post('/api/orders/', {'table': self.table.id, 'items': items}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+        response = self.client.put(f'/api/orders/{self.order.pk}/', {'items': [{'product_name': 'No existe'}]},
+                                   format='json')
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.version, self.order.items.get().product_name), (1, 'Club Sandwich'))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class CloseTableTests(APITestCase):
+    """Cerrar mesa: mismas consultas y un solo mensaje sin importar cuántos pedidos haya."""
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)('kitchen', self.channel)
+
+    def _table_with_orders(self, code, count, products=1):
+        table = Table.objects.create(code=code, status=Table.Status.OCUPADA)
+        for n in range(count):
+            order = Order.objects.create(table=table, status=Order.Status.DELIVERED, total_price=Decimal('4.50'))
+            OrderItem.objects.create(order=order, product_name=f'Producto {n % products}', unit_price=Decimal('4.50'))
+        Order.objects.create(table=table, status=Order.Status.PAID, total_price=Decimal('9.99'))
+        return table
+
+    def _close(self, table):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/orders/close-table/', {'table_id': table.id}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response, len(queries)
+
+    def test_constant_queries_and_single_batch(self):
+        # El primer cierre del día crea las filas del rollup
+        self._close(self._table_with_orders('M-00', 1))
+        _, few = self._close(self._table_with_orders('M-01', 1))
+        async_to_sync(self.layer.receive)(self.channel)
+        async_to_sync(self.layer.receive)(self.channel)
+
+        # Ni la cantidad de pedidos ni la de productos distintos (filas nuevas
+        # de DailyProductSales) cambian las consultas
+        paid, seen = 2, 1
+        for orders, products in ((8, 1), (8, 8), (3, 3), (12, 5)):
+            with self.subTest(orders=orders, products=products):
+                table = self._table_with_orders(f'M-{orders:02d}-{products}', orders, products)
+                response, many = self._close(table)
+                paid += orders
+                self.assertEqual(few, many)
+                self.assertEqual(response.data['total_billed'], Decimal('4.50') * orders)
+                self.assertFalse(Order.objects.filter(table=table).exclude(status=Order.Status.PAID).exists())
+                self.assertEqual(DailySales.objects.get().orders_count, paid)
+                seen = max(seen, products)
+                self.assertEqual(
+                    set(DailyProductSales.objects.values_list('product_name', flat=True)),
+                    {f'Producto {n}' for n in range(seen)},
+                )
+
+                message = async_to_sync(self.layer.receive)(self.channel)
+                self.assertEqual(message['type'], 'send.orders.batch')
+                self.assertEqual(len(message['deltas']), orders)
+                self.assertTrue(all(
+                    d['changes']['status'] == 'PAID' and d['changes']['paid_at'] and d['version'] == 2
+                    for d in message['deltas']
+                ))
+        self.assertEqual(
+            sum(DailyProductSales.objects.values_list('items_count', flat=True)), paid,
+        )
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class BulkStatusTests(APITestCase):
+    """POST /api/orders/bulk-status/: mismas reglas que set_status y mark-delivered, todo o nada."""
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)('kitchen', self.channel)
+        self.table = Table.objects.create(code='M-01')
+
+    def _bulk(self, ids, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/orders/bulk-status/', {'ids': ids, 'status': status}, format='json')
+
+    def test_stamps_only_missing_timestamps_and_sends_one_batch(self):
+        stamped = utc(2025, 1, 10, 12, 0)
+        a = Order.objects.create(table=self.table, status=Order.Status.PREPARING)
+        b = Order.objects.create(table=self.table, status=Order.Status.PREPARING, ready_at=stamped)
+
+        response = self._bulk([a.id, b.id], Order.Status.READY)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['updated'], 2)
+
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.status, b.status), (Order.Status.READY, Order.Status.READY))
+        self.assertIsNotNone(a.ready_at)
+        self.assertEqual(b.ready_at, stamped)
+
+        message = async_to_sync(self.layer.receive)(self.channel)
+        self.assertEqual(message['type'], 'send.orders.batch')
+        self.assertEqual([d['id'] for d in message['deltas']], [a.id, b.id])
+        self.assertEqual(set(message['deltas'][0]['changes']), {'status', 'status_display', 'ready_at'})
+
+    def test_invalid_transition_changes_nothing(self):
+        ready = Order.objects.create(table=self.table, status=Order.Status.READY)
+        new = Order.objects.create(table=self.table, status=Order.Status.NEW)
+
+        response = self._bulk([ready.id, new.id, 999], Order.Status.DELIVERED)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['errors']), {new.id, 999})
+        self.assertEqual(Order.objects.get(pk=ready.pk).status, Order.Status.READY)
+        self.assertEqual(self._bulk([ready.id], 'LISTO').status_code, 400)
+
+    def test_paid_follows_the_set_status_rules_and_rollup(self):
+        a = Order.objects.create(table=self.table, status=Order.Status.DELIVERED, total_price=Decimal('10.00'))
+        b = Order.objects.create(table=self.table, status=Order.Status.DELIVERED, total_price=Decimal('5.00'))
+        self.assertEqual(self._bulk([a.id, b.id], Order.Status.PAID).status_code, 200)
+        self.assertEqual(DailySales.objects.get().orders_count, 2)
+
+        # PAID -> PAID es 409 en set_status: aquí tampoco cuenta dos veces
+        response = self._bulk([a.id], Order.Status.PAID)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data['errors']), {a.id})
+        self.assertEqual(DailySales.objects.get().orders_count, 2)
+
+        self.assertEqual(self._bulk([a.id], Order.Status.DELIVERED).status_code, 400)
+        self.assertEqual(self._bulk([a.id], Order.Status.READY).status_code, 200)
+        sales = DailySales.objects.get()
+        self.assertEqual((sales.orders_count, sales.total_sales), (1, Decimal('5.00')))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class StaleTransitionTests(APITestCase):
+    """
+    La misma carrera que ConcurrentTransitionTests, en secuencia (corre
+    también en SQLite): dos meseros leyeron el mismo estado y ambos aplican
+    la transición; el UPDATE condicional deja ganar solo al primero.
+    """
+
+    def setUp(self):
+        self.table = Table.objects.create(code='M-01')
+
+    def test_second_delivery_conflicts(self):
+        order = Order.objects.create(table=self.table, status=Order.Status.READY)
+        winner = apply_transition(order.pk, TRANSITIONS['deliver'])
+        with self.assertRaises(TransitionConflict) as conflict:
+            apply_transition(order.pk, TRANSITIONS['deliver'])
+
+        self.assertEqual((winner.status, winner.version), (Order.Status.DELIVERED, 2))
+        self.assertEqual(conflict.exception.current_status, Order.Status.DELIVERED)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.version, order.delivered_at), ('DELIVERED', 2, winner.delivered_at))
+
+    def test_second_payment_conflicts_and_is_not_counted(self):
+        order = Order.objects.create(table=self.table, status=Order.Status.DELIVERED, total_price=Decimal('8.00'))
+        apply_transition(order.pk, status_transition(Order.Status.PAID))
+        with self.assertRaises(TransitionConflict):
+            apply_transition(order.pk, status_transition(Order.Status.PAID))
+
+        self.assertEqual(DailySales.objects.get().orders_count, 1)
+
+    def test_stale_request_gets_409_with_current_status(self):
+        order = Order.objects.create(table=self.table, status=Order.Status.READY)
+        self.client.force_authenticate(User.objects.create_user('mesero'))
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.patch(f'/api/orders/{order.id}/mark-delivered/')
+            second = self.client.patch(f'/api/orders/{order.id}/mark-delivered/')
+
+        self.assertEqual((first.status_code, second.status_code), (200, 409))
+        self.assertEqual(second.data['status'], Order.Status.DELIVERED)
+
+
+@skipUnlessDBFeature('test_db_allows_multiple_connections')  # SQLite en memoria no
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class ConcurrentTransitionTests(TransactionTestCase):
+    """Muchos meseros sobre el mismo pedido: el UPDATE condicional deja ganar a uno solo."""
+
+    THREADS = 8
+
+    def _race(self, request):
+        def run(_):
+            try:
+                return request(APIClient()).status_code
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            return sorted(pool.map(run, range(self.THREADS)))
+
+    def test_only_one_delivery_wins(self):
+        order = Order.objects.create(table=Table.objects.create(code='M-01'), status=Order.Status.READY)
+        codes = self._race(lambda client: client.patch(f'/api/orders/{order.id}/mark-delivered/'))
+
+        self.assertEqual(codes, [200] + [409] * (self.THREADS - 1))
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.Status.DELIVERED)
+
+    def test_only_one_payment_reaches_the_rollup(self):
+        order = Order.objects.create(
+            table=Table.objects.create(code='M-01'), status=Order.Status.DELIVERED, total_price=Decimal('8.00')
+        )
+        codes = self._race(lambda client: client.patch(
+            f'/api/orders/{order.id}/set_status/', {'status': 'PAID'}, format='json'
+        ))
+
+        self.assertEqual(codes.count(200), 1)
+        self.assertEqual(DailySales.objects.get().orders_count, 1)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class OutboxTests(APITestCase):
+    """Los eventos salen solo después del commit y se fusionan por pedido."""
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)('kitchen', self.channel)
+
+    def test_events_wait_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            publish('kitchen', {'type': 'send.status.update', 'order': {'id': 1}}, key=1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotIn(self.channel, self.layer.channels)
+
+        callbacks[0]()
+        message = async_to_sync(self.layer.receive)(self.channel)
+        self.assertEqual(message['order'], {'id': 1})
+
+    def test_coalesce_keeps_last_event_per_order_and_type(self):
+        events = [
+            ('kitchen', {'type': 'send.new.order', 'order': {'id': 1, 'v': 1}}, 1),
+            ('kitchen', {'type': 'send.status.update', 'order': {'id': 1, 'v': 2}}, 1),
+            ('kitchen', {'type': 'send.status.update', 'order': {'id': 2, 'v': 1}}, 2),
+            ('kitchen', {'type': 'send.status.update', 'order': {'id': 1, 'v': 3}}, 1),
+            ('kitchen', {'type': 'send.orders.batch', 'orders': []}, None),
+        ]
+        self.assertEqual([(m['type'], m.get('order')) for _, m in coalesce(events)], [
+            ('send.new.order', {'id': 1, 'v': 1}),
+            ('send.status.update', {'id': 1, 'v': 3}),
+            ('send.status.update', {'id': 2, 'v': 1}),
+            ('send.orders.batch', None),
+        ])
+
+    def test_coalesce_merges_deltas(self):
+        def delta(version, **changes):
+            return ('kitchen', {'type': 'send.order.delta', 'delta': {'id': 1, 'version': version, 'changes': changes}}, 1)
+
+        [(_, message)] = coalesce([delta(2, status='PREPARING', preparing_at='t1'), delta(3, status='READY', ready_at='t2')])
+        self.assertEqual(message['delta'], {
+            'id': 1, 'version': 3, 'changes': {'status': 'READY', 'preparing_at': 't1', 'ready_at': 't2'},
+        })
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class MetricsTests(APITestCase):
+    """Histogramas por ruta y /api/metrics/ en formato Prometheus."""
+
+    def setUp(self):
+        self.order = Order.objects.create(table=Table.objects.create(code='M-01'))
+        OrderItem.objects.create(order=self.order, product_name='Jugo de Fresa', unit_price=Decimal('4.50'))
+
+    def _sample(self, text, prefix):
+        [line] = [line for line in text.splitlines() if line.startswith(prefix)]
+        return float(line.rsplit(' ', 1)[1])
+
+    def test_records_requests_and_requires_admin(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.client.force_authenticate(User.objects.create_user('mesero'))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+        labels = '{route="orders-set-status",method="PATCH"}'
+        before = render()
+        count = 'orders_request_duration_seconds_count' + labels
+        previous = self._sample(before, count) if count in before else 0
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/orders/{self.order.id}/set_status/', {'status': 'READY'}, format='json')
+
+        self.client.force_authenticate(User.objects.create_superuser('admin'))
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertEqual(self._sample(text, count), previous + 1)
+        self.assertIn('# TYPE orders_request_sql_queries histogram', text)
+        self.assertGreater(self._sample(text, 'orders_request_sql_queries_sum' + labels), 0)
+        self.assertGreater(self._sample(text, 'orders_request_serializer_seconds_sum' + labels), 0)
+        self.assertIn('orders_group_send_seconds_count{group="kitchen"}', text)
+
+        # Histograma completo de la ruta: buckets acumulados y +Inf igual al total
+        self.assertIn('# TYPE orders_request_duration_seconds histogram', text)
+        prefix = 'orders_request_duration_seconds_bucket{route="orders-set-status",method="PATCH",le='
+        buckets = [float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if line.startswith(prefix)]
+        self.assertGreater(len(buckets), 1)
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(self._sample(text, prefix + '"+Inf"}'), self._sample(text, count))
+
+    def test_failed_group_send_is_counted_and_logged(self):
+        failures = GROUP_SEND_FAILURES._values.get(('table',), 0)
+        with mock.patch('channels.layers.InMemoryChannelLayer.group_send', side_effect=RuntimeError('redis caído')), \
+                self.assertLogs('orders.outbox', 'ERROR') as logs, self.captureOnCommitCallbacks(execute=True):
+            publish('table_M-01', {'type': 'table.status.update', 'data': {}})
+        self.assertEqual(GROUP_SEND_FAILURES._values[('table',)], failures + 1)
+        self.assertIn('redis caído', logs.output[0])
+
+    @override_settings(ORDERS_SLOW_REQUEST_MS=0.001)
+    def test_slow_requests_log_their_sql(self):
+        with self.assertLogs('orders.metrics', 'WARNING') as logs:
+            self.client.get(f'/api/orders/{self.order.id}/')
+        self.assertIn('Request lenta: GET', logs.output[0])
+        self.assertIn('orders_order', logs.output[0])
+
+
+class OrderRepresentationTests(APITestCase):
+    """La representación sin DRF (orders/representations.py) es idéntica a OrderSerializer."""
+
+    def setUp(self):
+        table = Table.objects.create(code='M-01')
+        new = Order.objects.create(table=table)
+        OrderItem.objects.create(order=new, product_name='Jugo de Fresa', unit_price=Decimal('4.5'))
+        OrderItem.objects.create(order=new, product_name='Club Sandwich', unit_price=Decimal('12.00'),
+                                 notes='Sin mayonesa', selected_options={'pan': 'integral', 'extras': ['palta']})
+        changed = Order.objects.create(table=table, status=Order.Status.CHANGE_REQUESTED,
+                                       proposed_changes={'items': [{'product_name': 'Jugo de Mango'}]})
+        OrderItem.objects.create(order=changed, product_name='Jugo de Mango', unit_price=Decimal('0.00'))
+        Order.objects.create(status=Order.Status.NEW)  # Sin mesa y sin items
+        paid = Order.objects.create(table=table, status=Order.Status.PAID, version=7)
+        Order.objects.filter(pk=paid.pk).update(
+            total_price=Decimal('1234.50'), preparing_at=utc(2025, 1, 10, 3, 30, 0, 120),
+            ready_at=utc(2025, 1, 10, 4, 0), delivered_at=utc(2025, 1, 10, 4, 5), paid_at=utc(2025, 1, 10, 5, 0),
+        )
+        self.queryset = Order.objects.select_related('table').prefetch_related('items').order_by('-created_at', '-id')
+
+    def assertSameJSON(self, fast, drf):
+        # Mismo contenido y mismo orden de claves (el JSON de la respuesta es idéntico)
+        self.assertEqual(json.dumps(fast), json.dumps(drf))
+
+    def test_matches_order_serializer(self):
+        for zone in ('America/Lima', 'UTC'):
+            with self.subTest(zone=zone), timezone.override(zone):
+                expected = OrderSerializer(self.queryset, many=True).data
+                self.assertEqual(len(expected), 4)
+                self.assertSameJSON(serialize_order_rows(self.queryset), expected)
+                self.assertSameJSON(serialize_orders(self.queryset), expected)
+                self.assertSameJSON(serialize_order(self.queryset[0]), OrderSerializer(self.queryset[0]).data)
+
+    def test_covers_every_serializer_field(self):
+        readable = [name for name, field in OrderSerializer().fields.items() if not field.write_only]
+        self.assertEqual(list(FIELD_GETTERS), readable)
+
+        order = self.queryset.filter(table__isnull=False)[0]
+        [delta] = order_deltas([order], readable)
+        self.assertSameJSON(delta['changes'], OrderSerializer(order).data)
+
+    def test_list_and_detail_use_it(self):
+        self.client.force_authenticate(User.objects.create_user('mesero'))
+        active = self.queryset.exclude(status=Order.Status.PAID)
+        self.assertEqual(self.client.get('/api/orders/?status=NEW,CHANGE_REQUESTED').json(),
+                         json.loads(json.dumps(OrderSerializer(active, many=True).data)))
+        self.assertEqual(self.client.get('/api/orders/').json()['results'],
+                         json.loads(json.dumps(OrderSerializer(self.queryset, many=True).data)))
+        order = self.queryset[0]
+        self.assertEqual(self.client.get(f'/api/orders/{order.id}/').json(),
+                         json.loads(json.dumps(OrderSerializer(order).data)))
+
+
+class FastJSONTests(APITestCase):
+    """orders/fast_json.py y sus renderer/parser dan lo mismo que el JSON de DRF, con o sin orjson."""
+
+    payload = {
+        'total': Decimal('12.50'),
+        'token': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'utc': utc(2025, 1, 10, 3, 30, 0, 120),
+        'lima': timezone.localtime(utc(2025, 1, 10, 3, 30)),
+        'date': utc(2025, 1, 10).date(),
+        'detail': gettext_lazy('Not found.'),
+        'errors': {7: 'Pedido no encontrado.'},
+        'notes': 'Sin azúcar \u2028 ni hielo',
+        'items': [(1, None, True, 1.5)],
+    }
+
+    def test_renders_like_drf(self):
+        expected = JSONRenderer().render(self.payload)
+        self.assertEqual(FastJSONRenderer().render(self.payload), expected)
+        with mock.patch.object(fast_json, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.payload), expected)
+        # NaN e Infinity no son JSON: DRF (strict) lanza ValueError y orjson escribiría null
+        for invalid in ({'p95': math.nan}, [None, (1.5, -math.inf)], OrderedDict(p50=[{'p95': math.inf}]),
+                        {'total': Decimal('NaN')}):
+            with self.subTest(payload=invalid):
+                self.assertRaises(ValueError, JSONRenderer().render, invalid)
+                self.assertRaises(ValueError, FastJSONRenderer().render, invalid)
+                with mock.patch.object(fast_json, 'orjson', None):
+                    self.assertRaises(ValueError, FastJSONRenderer().render, invalid)
+        # Sin STRICT_JSON se escriben como DRF
+        lenient, fast_lenient = JSONRenderer(), FastJSONRenderer()
+        lenient.strict = fast_lenient.strict = False
+        self.assertEqual(fast_lenient.render({'p95': math.nan}), lenient.render({'p95': math.nan}))
+        # orjson no codifica enteros de más de 64 bits: se reintenta con json
+        self.assertEqual(fast_json.dumps({'big': 2 ** 70}), b'{"big":1180591620717411303424}')
+        # Con sangría (API navegable) lo hace DRF
+        self.assertEqual(FastJSONRenderer().render({'a': 1}, 'application/json; indent=2'), b'{\n  "a": 1\n}')
+
+    def test_parses_like_drf(self):
+        body = JSONRenderer().render({'items': [{'product_name': 'Café', 'notes': None}], 'table': 3})
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+        for invalid in (b'{"a": ', b'{"a": NaN}'):
+            with self.subTest(body=invalid), self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(invalid))
+
+    def test_api_uses_it(self):
+        self.client.force_authenticate(User.objects.create_user('mesero'))
+        with mock.patch.object(fast_json, 'dumps', wraps=fast_json.dumps) as dumps:
+            response = self.client.get('/api/orders/?status=NEW')
+        self.assertEqual(response.json(), [])
+        # OrderViewSet declara que sus respuestas no tienen floats
+        dumps.assert_called_once_with([], check_floats=False)
+
+    def test_float_check_is_skipped_only_when_declared(self):
+        view = mock.Mock(json_check_floats=False)
+        with mock.patch.object(fast_json, '_has_non_finite', wraps=fast_json._has_non_finite) as check:
+            self.assertEqual(FastJSONRenderer().render({'notes': None}, renderer_context={'view': view}),
+                             b'{"notes":null}')
+            self.assertEqual(async_to_sync(KitchenConsumer.encode_json)({'notes': None}), '{"notes":null}')
+            check.assert_not_called()
+            # Sin declararlo se busca aunque la salida no tenga null
+            self.assertRaises(ValueError, FastJSONRenderer().render, {'p95': math.inf}, None, {'view': object()})
+            check.assert_called()
+
+
+class QueryCountTests(APITestCase):
+    """
+    Consultas SQL por ruta con dos tamaños de datos: deben ser las mismas (y
+    no más que el presupuesto). Si una ruta empieza a depender de la cantidad
+    de filas (N+1), falla aquí. Cada ruta con nombre de main/urls.py necesita
+    al menos un caso (si no, falla al final de la medición); las vistas y
+    acciones de cada ModelAdmin se toman del registro.
+    """
+    SMALL, LARGE = 2, 8
+    # También crece la cantidad de items por pedido (inlines, exportaciones...)
+    ITEMS_PER_ORDER = {SMALL: 1, LARGE: 3}
+    # Rutas sin caso, con el motivo
+    UNMEASURED = {
+        'admin:autocomplete': 'ningún ModelAdmin usa autocomplete_fields',
+        'admin:view_on_site': 'ningún modelo define get_absolute_url',
+        'admin:orders_reportjob_add': 'los ReportJob solo se crean desde las acciones (403)',
+    }
+
+    # nombre -> consultas máximas (con sesión y cachés en frío)
+    BUDGETS = {
+        'api-root': 0, 'orders-list': 2, 'orders-list-active': 2, 'orders-create': 11, 'orders-changes': 3,
+        'orders-detail': 2, 'orders-update': 19, 'orders-destroy': 9, 'orders-set-status': 7,
+        'orders-mark-delivered': 6, 'orders-accept-change': 17, 'orders-reject-change': 6, 'orders-bulk-status': 6,
+        'orders-close-table': 19, 'customer-check-session': 4, 'customer-call-waiter': 2, 'customer-rate': 2,
+        'tables-list': 1, 'tables-create': 2, 'tables-detail': 1, 'tables-update': 2, 'tables-mark-attended': 2,
+        'dashboard-stats': 7, 'products': 1, 'metrics': 0, 'token': 1, 'token-refresh': 1,
+        'admin-index': 3, 'admin-app-list': 2, 'admin-login': 2, 'admin-logout': 4, 'admin-password-change': 2,
+        'admin-password-change-done': 2, 'admin-jsi18n': 2, 'admin-user-password': 3, 'admin-reportjob-download': 3,
+        'admin-group-changelist': 5, 'admin-group-add': 4, 'admin-group-change': 6, 'admin-group-history': 5,
+        'admin-group-delete': 5, 'admin-group-delete_selected': 8,
+        'admin-user-changelist': 6, 'admin-user-add': 3, 'admin-user-change': 8, 'admin-user-history': 5,
+        'admin-user-delete': 6, 'admin-user-delete_selected': 11,
+        'admin-table-changelist': 5, 'admin-table-add': 3, 'admin-table-change': 4, 'admin-table-history': 5,
+        'admin-table-delete': 4, 'admin-table-delete_selected': 7,
+        'admin-product-changelist': 5, 'admin-product-add': 3, 'admin-product-change': 4, 'admin-product-history': 5,
+        'admin-product-delete': 3, 'admin-product-delete_selected': 6,
+        'admin-order-changelist': 5, 'admin-order-add': 4, 'admin-order-change': 7, 'admin-order-history': 6,
+        'admin-order-delete': 6, 'admin-order-delete_selected': 8, 'admin-order-background_orders_xlsx': 6,
+        'admin-order-background_orders_csv': 6, 'admin-order-background_rollup': 5,
+        'admin-orderitem-changelist': 5, 'admin-orderitem-add': 3, 'admin-orderitem-change': 6,
+        'admin-orderitem-history': 5, 'admin-orderitem-delete': 4, 'admin-orderitem-delete_selected': 7,
+        'admin-orderitem-export_to_excel': 5, 'admin-orderitem-export_to_csv': 5,
+        'admin-orderitem-background_items_xlsx': 6, 'admin-orderitem-background_items_csv': 6,
+        'admin-review-changelist': 6, 'admin-review-add': 3, 'admin-review-change': 6, 'admin-review-history': 6,
+        'admin-review-delete': 4, 'admin-review-delete_selected': 6, 'admin-review-background_reviews_xlsx': 6,
+        'admin-review-background_reviews_csv': 6,
+        'admin-reportjob-changelist': 5, 'admin-reportjob-change': 5, 'admin-reportjob-history': 5,
+        'admin-reportjob-delete': 3, 'admin-reportjob-delete_selected': 6,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='clave-segura')
+        Group.objects.create(name='Cocina')
+        for name, category in [('Jugo de Fresa', 'JUICE'), ('Club Sandwich', 'SANDWICH')]:
+            Product.objects.create(name=name, category=category, base_price=Decimal('10.00'))
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+        reports_root = tempfile.TemporaryDirectory()
+        self.addCleanup(reports_root.cleanup)
+        self.reports_root = reports_root.name
+
+    def _seed(self, size):
+        """
+        `size` pedidos por estado (con ITEMS_PER_ORDER[size] items y reseñas)
+        y `size` ReportJob, el primero terminado y con su archivo.
+        """
+        open_table = Table.objects.create(code='Q-OPEN', status='OCUPADA', session_token=uuid.uuid4())
+        free_table = Table.objects.create(code='Q-FREE')
+        by_status = {}
+        for status in Order.Status.values:
+            proposed = {'items': [{'product_name': 'Club Sandwich', 'unit_price': '10.00'}]}
+            orders = Order.objects.bulk_create([
+                Order(table=free_table if status == 'PAID' else open_table, status=status, total_price=Decimal('20.00'),
+                      proposed_changes=proposed if status == 'CHANGE_REQUESTED' else {})
+                for _ in range(size)
+            ])
+            by_status[status] = [order.id for order in orders]
+        items = OrderItem.objects.bulk_create([
+            OrderItem(order_id=order_id, product_name=name, unit_price=Decimal('10.00'))
+            for index, order_id in enumerate(order_id for ids in by_status.values() for order_id in ids)
+            for name in self._item_names(index, self.ITEMS_PER_ORDER[size])
+        ])
+        Review.objects.bulk_create([Review(order_item=item, rating=5) for item in items[::2]])
+        report = os.path.join(self.reports_root, f'reporte_{size}.csv')
+        with open(report, 'w') as file:
+            file.write('id\n1\n')
+        ReportJob.objects.bulk_create(
+            [ReportJob(kind='ORDERS', requested_by=self.admin, status=ReportJob.Status.DONE, file_path=report)]
+            + [ReportJob(kind='ORDERS', requested_by=self.admin) for _ in range(size - 1)]
+        )
+        # Fuera de la ventana de asentamiento de /changes/, dentro de la de check_session
+        Order.objects.update(updated_at=timezone.now() - timedelta(minutes=1))
+        return {
+            'open': open_table, 'free': free_table, 'by_status': by_status, 'items': [item.id for item in items],
+            'since': encode_cursor(timezone.now() - timedelta(minutes=2), 0),
+            'pks': {model: list(model._default_manager.order_by('pk').values_list('pk', flat=True))
+                    for model in admin.site._registry},
+        }
+
+    @staticmethod
+    def _item_names(index, count):
+        # Los mismos productos distintos con ambos tamaños (el rollup escribe una fila por producto)
+        names = ['Jugo de Fresa', 'Club Sandwich', 'Café']
+        return [names[(index + offset) % len(names)] for offset in range(count)]
+
+    def _cases(self):
+        client = self.client
+        first = lambda f, status: f['by_status'][status][0]  # noqa: E731
+        cases = {
+            'api-root': lambda f: client.get('/api/'),
+            'orders-list': lambda f: client.get('/api/orders/'),
+            'orders-list-active': lambda f: client.get('/api/orders/?status=NEW,PREPARING,READY'),
+            'orders-create': lambda f: client.post('/api/orders/', {
+                'table': f['open'].id, 'items': [{'product_name': 'Jugo de Fresa'}, {'product_name': 'Club Sandwich'}],
+            }, format='json'),
+            'orders-changes': lambda f: client.get(f"/api/orders/changes/?since={f['since']}"),
+            'orders-detail': lambda f: client.get(f"/api/orders/{first(f, 'NEW')}/"),
+            'orders-update': lambda f: client.put(f"/api/orders/{first(f, 'NEW')}/", {
+                'items': [{'product_name': 'Jugo de Fresa'}],
+            }, format='json'),
+            'orders-destroy': lambda f: client.delete(f"/api/orders/{first(f, 'NEW')}/"),
+            'orders-set-status': lambda f: client.patch(
+                f"/api/orders/{first(f, 'NEW')}/set_status/", {'status': 'PREPARING'}, format='json'),
+            'orders-mark-delivered': lambda f: client.patch(f"/api/orders/{first(f, 'READY')}/mark-delivered/"),
+            'orders-accept-change': lambda f: client.post(f"/api/orders/{first(f, 'CHANGE_REQUESTED')}/accept-change/"),
+            'orders-reject-change': lambda f: client.post(f"/api/orders/{first(f, 'CHANGE_REQUESTED')}/reject-change/"),
+            'orders-bulk-status': lambda f: client.post('/api/orders/bulk-status/', {
+                'ids': f['by_status']['NEW'], 'status': 'PREPARING',
+            }, format='json'),
+            'orders-close-table': lambda f: client.post('/api/orders/close-table/', {'table_id': f['open'].id}),
+            'customer-check-session': lambda f: client.get(f"/api/customer/table/{f['free'].code}/"),
+            'customer-call-waiter': lambda f: client.post(
+                f"/api/customer/table/{f['open'].code}/call/", {'token': str(f['open'].session_token)}),
+            'customer-rate': lambda f: client.post('/api/customer/rate/', {'order_item': f['items'][0], 'rating': 4}),
+            'tables-list': lambda f: client.get('/api/tables/'),
+            'tables-create': lambda f: client.post('/api/tables/', {'code': 'Q-NEW'}),
+            'tables-detail': lambda f: client.get(f"/api/tables/{f['open'].id}/"),
+            'tables-update': lambda f: client.patch(f"/api/tables/{f['open'].id}/", {'is_active': False}),
+            'tables-mark-attended': lambda f: client.post(f"/api/tables/{f['open'].id}/mark_attended/"),
+            'dashboard-stats': lambda f: client.get('/api/dashboard/stats/'),
+            'products': lambda f: client.get('/api/products/'),
+            'metrics': lambda f: client.get('/api/metrics/'),
+            'token': lambda f: client.post('/api/token/', {'username': 'admin', 'password': 'clave-segura'}),
+            'token-refresh': lambda f: client.post(
+                '/api/token/refresh/', {'refresh': str(RefreshToken.for_user(self.admin))}),
+            'admin-index': lambda f: client.get(reverse('admin:index')),
+            'admin-app-list': lambda f: client.get(reverse('admin:app_list', args=['orders'])),
+            'admin-login': lambda f: client.get(reverse('admin:login')),
+            'admin-logout': lambda f: client.post(reverse('admin:logout')),
+            'admin-password-change': lambda f: client.get(reverse('admin:password_change')),
+            'admin-password-change-done': lambda f: client.get(reverse('admin:password_change_done')),
+            'admin-jsi18n': lambda f: client.get(reverse('admin:jsi18n')),
+            'admin-user-password': lambda f: client.get(
+                reverse('admin:auth_user_password_change', args=[self.admin.pk])),
+            'admin-reportjob-download': lambda f: client.get(
+                reverse('admin:orders_reportjob_download', args=[f['pks'][ReportJob][0]])),
+        }
+        for model, model_admin in admin.site._registry.items():
+            prefix = f'admin:{model._meta.app_label}_{model._meta.model_name}'
+            name = f'admin-{model._meta.model_name}'
+            cases[f'{name}-changelist'] = lambda f, url=reverse(f'{prefix}_changelist'): client.get(url)
+            if f'{prefix}_add' not in self.UNMEASURED:
+                cases[f'{name}-add'] = lambda f, url=reverse(f'{prefix}_add'): client.get(url)
+            for view in ('change', 'history', 'delete'):
+                cases[f'{name}-{view}'] = lambda f, view=f'{prefix}_{view}', model=model: client.get(
+                    reverse(view, args=[f['pks'][model][0]]))
+            # Acciones sobre todas las filas (delete_selected solo muestra la confirmación)
+            actions = [action for action, _ in admin.site.actions] + [action.__name__ for action in model_admin.actions]
+            for action in actions:
+                cases[f'{name}-{action}'] = lambda f, url=reverse(f'{prefix}_changelist'), action=action, model=model: (
+                    client.post(url, {'action': action, '_selected_action': f['pks'][model]}))
+        return cases
+
+    def _count(self, size, case):
+        savepoint = transaction.savepoint()
+        try:
+            fixture = self._seed(size)
+            # La sesión se crea aquí: admin-logout la borra
+            self.client.force_login(self.admin)
+            # Cachés de proceso en frío en ambas mediciones
+            product_catalog.invalidate()
+            ContentType.objects.clear_cache()
+            with CaptureQueriesContext(connection) as queries:
+                response = case(fixture)
+                b''.join(response.streaming_content) if response.streaming else response.content
+            self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+            return len(queries), response.resolver_match.view_name
+        finally:
+            transaction.savepoint_rollback(savepoint)
+
+    def _route_names(self, resolver=None, namespace=''):
+        for pattern in (resolver or get_resolver()).url_patterns:
+            if isinstance(pattern, URLResolver):
+                prefix = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+                yield from self._route_names(pattern, prefix)
+            elif pattern.name:
+                yield namespace + pattern.name
+
+    def test_every_case_has_a_budget(self):
+        self.assertEqual(set(self._cases()) ^ set(self.BUDGETS), set())
+        routes = set(self._route_names())
+        self.assertIn('admin:orders_reportjob_download', routes)
+        self.assertLessEqual(set(self.UNMEASURED), routes)
+
+    @override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+    def test_query_count_does_not_grow_with_data(self):
+        measured = set()
+        for name, case in self._cases().items():
+            with self.subTest(name):
+                (small, route), (large, _) = self._count(self.SMALL, case), self._count(self.LARGE, case)
+                measured.add(route)
+                self.assertEqual(small, large, f"{name}: {small} consultas con {self.SMALL}, {large} con {self.LARGE}")
+                self.assertLessEqual(large, self.BUDGETS[name], f"{name}: presupuesto de consultas superado")
+        # Una ruta nueva sin caso hace fallar el test
+        self.assertEqual(set(self._route_names()) - set(self.UNMEASURED) - measured, set(), "rutas sin caso")
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class KitchenConsumerTests(APITestCase):
+    """Deltas con versión y framing msgpack negociado por subprotocolo."""
+
+    def setUp(self):
+        self.order = Order.objects.create(table=Table.objects.create(code='M-01'))
+        OrderItem.objects.create(order=self.order, product_name='Jugo de Fresa', unit_price=Decimal('4.50'))
+
+    def _set_status(self, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(f'/api/orders/{self.order.id}/set_status/', {'status': status}, format='json')
+
+    def _create_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(table=self.order.table).delete()
+
+    def test_msgpack_delta_and_snapshot(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(KitchenConsumer.as_asgi(), '/ws/kitchen/', subprotocols=['msgpack'])
+            connected, subprotocol = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual(subprotocol, 'msgpack')
+            initial = msgpack.unpackb((await communicator.receive_output())['bytes'])
+            self.assertEqual((initial['type'], [o['id'] for o in initial['orders']]), ('SNAPSHOT', [self.order.id]))
+
+            await sync_to_async(self._set_status)('PREPARING')
+            delta = msgpack.unpackb((await communicator.receive_output())['bytes'])
+            self.assertEqual(delta['type'], 'ORDER_DELTA')
+            self.assertEqual((delta['id'], delta['version']), (self.order.id, 2))
+            self.assertEqual(set(delta['changes']), {'status', 'status_display', 'preparing_at'})
+
+            await communicator.send_to(bytes_data=msgpack.packb({'type': 'SNAPSHOT', 'ids': [self.order.id]}))
+            snapshot = msgpack.unpackb((await communicator.receive_output())['bytes'])
+            self.assertEqual(snapshot['type'], 'SNAPSHOT')
+            self.assertEqual(snapshot['orders'][0]['items'][0]['product_name'], 'Jugo de Fresa')
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_json_is_the_default(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(KitchenConsumer.as_asgi(), '/ws/kitchen/')
+            connected, subprotocol = await communicator.connect()
+            self.assertIsNone(subprotocol)
+            self.assertEqual((await communicator.receive_json_from())['type'], 'SNAPSHOT')
+            await sync_to_async(self._set_status)('READY')
+            delta = await communicator.receive_json_from()
+            self.assertEqual(delta['changes']['status'], 'READY')
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_connect_snapshot_comes_from_the_live_view(self):
+        async def connect():
+            communicator = WebsocketCommunicator(KitchenConsumer.as_asgi(), '/ws/kitchen/')
+            self.assertTrue((await communicator.connect())[0])
+            snapshot = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return {o['id']: o for o in snapshot['orders']}
+
+        async def scenario():
+            self.assertEqual(list(await connect()), [self.order.id])
+
+            # La vista se actualiza con los eventos, sin volver a consultar la base
+            await sync_to_async(self._set_status)('PREPARING')
+            await sync_to_async(self._create_and_delete)()
+            await asyncio.sleep(0.05)
+            with mock.patch('orders.consumers.order_snapshots') as load:
+                orders = await connect()
+            load.assert_not_called()
+            self.assertEqual(list(orders), [self.order.id])
+            self.assertEqual((orders[self.order.id]['status'], orders[self.order.id]['version']), ('PREPARING', 2))
+
+            await sync_to_async(self._set_status)('PAID')
+            await asyncio.sleep(0.05)
+            self.assertEqual(await connect(), {})
+
+        async_to_sync(scenario)()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class WebSocketCommandTests(TransactionTestCase):
+    """Comandos por el socket: misma transición que la API, con ACK/NACK por ref."""
+
+    def setUp(self):
+        self.table = Table.objects.create(code='M-01', status='OCUPADA', session_token=uuid.uuid4())
+        self.order = Order.objects.create(table=self.table)
+        self.token = str(AccessToken.for_user(User.objects.create_user('cocina', password='x')))
+
+    async def _kitchen(self):
+        communicator = WebsocketCommunicator(KitchenConsumer.as_asgi(), '/ws/kitchen/')
+        self.assertTrue((await communicator.connect())[0])
+        self.assertEqual((await communicator.receive_json_from())['type'], 'SNAPSHOT')
+        return communicator
+
+    def test_kitchen_commands(self):
+        async def scenario():
+            kitchen, other = await self._kitchen(), await self._kitchen()
+            command = {'type': 'SET_STATUS', 'ref': 'c1', 'order_id': self.order.id, 'status': 'READY'}
+
+            await kitchen.send_json_to(command)
+            self.assertEqual(await kitchen.receive_json_from(), {
+                'type': 'NACK', 'ref': 'c1', 'code': 401, 'error': mock.ANY,
+            })
+
+            await kitchen.send_json_to({'type': 'AUTH', 'ref': 'a1', 'token': 'basura'})
+            self.assertEqual((await kitchen.receive_json_from())['code'], 401)
+            await kitchen.send_json_to({'type': 'AUTH', 'ref': 'a2', 'token': self.token})
+            self.assertEqual(await kitchen.receive_json_from(), {'type': 'ACK', 'ref': 'a2', 'user': 'cocina'})
+
+            await kitchen.send_json_to(command)
+            messages = [await kitchen.receive_json_from(), await kitchen.receive_json_from()]
+            self.assertIn({'type': 'ACK', 'ref': 'c1', 'id': self.order.id, 'version': 2}, messages)
+            delta = await other.receive_json_from()
+            self.assertEqual((delta['type'], delta['changes']['status']), ('ORDER_DELTA', 'READY'))
+
+            await kitchen.send_json_to({'type': 'ACCEPT_CHANGE', 'ref': 'c2', 'order_id': self.order.id})
+            self.assertEqual(await kitchen.receive_json_from(), {
+                'type': 'NACK', 'ref': 'c2', 'code': 409,
+                'error': {'detail': 'El pedido no está en solicitud de cambio.', 'status': 'READY'},
+            })
+            await kitchen.send_json_to({'type': 'MARK_DELIVERED', 'ref': 'c3', 'order_id': 'x'})
+            self.assertEqual((await kitchen.receive_json_from())['code'], 400)
+
+            await kitchen.disconnect()
+            await other.disconnect()
+
+        async_to_sync(scenario)()
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ('READY', 2))
+
+    def test_malformed_frames_are_rejected(self):
+        async def scenario():
+            kitchen = await self._kitchen()
+            for frame in ('{"type": "SET_STATUS"', '[1, 2'):
+                await kitchen.send_to(text_data=frame)
+                self.assertEqual(await kitchen.receive_json_from(), {
+                    'type': 'NACK', 'ref': None, 'code': 400, 'error': mock.ANY,
+                })
+            await kitchen.disconnect()
+
+            packed = WebsocketCommunicator(KitchenConsumer.as_asgi(), '/ws/kitchen/', subprotocols=['msgpack'])
+            self.assertTrue((await packed.connect())[0])
+            await packed.receive_output()  # SNAPSHOT
+            for frame in (b'\xc1', b'\x92\x01', msgpack.packb({'type': 'SNAPSHOT'}) + b'\x01'):
+                await packed.send_to(bytes_data=frame)
+                nack = msgpack.unpackb((await packed.receive_output())['bytes'])
+                self.assertEqual((nack['type'], nack['code']), ('NACK', 400))
+            await packed.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_missing_order_and_unexpected_errors(self):
+        async def scenario():
+            kitchen = await self._kitchen()
+            await kitchen.send_json_to({'type': 'AUTH', 'ref': 'a1', 'token': self.token})
+            await kitchen.receive_json_from()
+
+            await kitchen.send_json_to({'type': 'MARK_DELIVERED', 'ref': 'c0'})
+            self.assertEqual((await kitchen.receive_json_from())['code'], 400)
+            await kitchen.send_json_to({'type': 'SET_STATUS', 'ref': 'c1', 'order_id': deleted_id, 'status': 'READY'})
+            self.assertEqual(await kitchen.receive_json_from(), {
+                'type': 'NACK', 'ref': 'c1', 'code': 404, 'error': mock.ANY,
+            })
+            # Borrado entre el UPDATE y la lectura del pedido
+            with mock.patch('orders.commands.apply_transition', side_effect=Order.DoesNotExist):
+                await kitchen.send_json_to({'type': 'MARK_DELIVERED', 'ref': 'c2', 'order_id': self.order.id})
+                self.assertEqual((await kitchen.receive_json_from())['code'], 404)
+            with mock.patch('orders.commands.apply_transition', side_effect=RuntimeError('falla')), \
+                    self.assertLogs('orders.consumers', 'ERROR'):
+                await kitchen.send_json_to({'type': 'MARK_DELIVERED', 'ref': 'c3', 'order_id': self.order.id})
+                self.assertEqual(await kitchen.receive_json_from(), {
+                    'type': 'NACK', 'ref': 'c3', 'code': 500, 'error': mock.ANY,
+                })
+
+            # El socket sigue abierto y responde al siguiente comando
+            await kitchen.send_json_to({'type': 'MARK_DELIVERED', 'ref': 'c4', 'order_id': self.order.id})
+            self.assertEqual((await kitchen.receive_json_from())['code'], 409)
+            await kitchen.disconnect()
+
+        deleted = Order.objects.create(table=self.table)
+        deleted_id = deleted.id
+        deleted.delete()
+        async_to_sync(scenario)()
+
+    def test_table_call_waiter(self):
+        async def scenario():
+            table = WebsocketCommunicator(TableConsumer.as_asgi(), '/ws/table/M-01/')
+            table.scope['url_route'] = {'kwargs': {'table_code': 'M-01'}}
+            waiters = WebsocketCommunicator(KitchenConsumer.as_asgi(), '/ws/kitchen/?role=waiters')
+            self.assertTrue((await table.connect())[0])
+            self.assertTrue((await waiters.connect())[0])
+            await waiters.receive_json_from()  # SNAPSHOT
+
+            await table.send_json_to({'type': 'CALL_WAITER', 'ref': 1, 'token': 'otro'})
+            self.assertEqual((await table.receive_json_from())['code'], 403)
+            await table.send_json_to({'type': 'CALL_WAITER', 'ref': 2, 'token': str(self.table.session_token)})
+            self.assertEqual(await table.receive_json_from(), {'type': 'ACK', 'ref': 2})
+            self.assertEqual(await waiters.receive_json_from(), {
+                'type': 'WAITER_CALL', 'table_code': 'M-01', 'status': 'ON',
+            })
+
+            await table.disconnect()
+            await waiters.disconnect()
+
+        async_to_sync(scenario)()
+        self.table.refresh_from_db()
+        self.assertTrue(self.table.needs_assistance)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, ORDERS_OUTBOX_EAGER=True)
+class StationRoutingTests(APITestCase):
+    """Cada estación recibe solo los pedidos (e items) de su categoría."""
+
+    def setUp(self):
+        Product.objects.create(name='Jugo de Fresa', category='JUICE', base_price=Decimal('4.50'))
+        Product.objects.create(name='Club Sandwich', category='SANDWICH', base_price=Decimal('12.00'))
+        self.table = Table.objects.create(code='M-01')
+
+    def _post(self, path, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(path, data, format='json')
+
+    def _patch_status(self, order_id, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(f'/api/orders/{order_id}/set_status/', {'status': status}, format='json')
+
+    def _create(self, *names):
+        return self._post('/api/orders/', {'table': self.table.id, 'items': [{'product_name': n} for n in names]})
+
+    def test_station_receives_only_its_orders_and_items(self):
+        async def scenario():
+            juice = WebsocketCommunicator(KitchenConsumer.as_asgi(), '/ws/kitchen/?station=juice')
+            waiters = WebsocketCommunicator(KitchenConsumer.as_asgi(), '/ws/kitchen/?role=waiters')
+            self.assertTrue((await juice.connect())[0])
+            self.assertTrue((await waiters.connect())[0])
+            self.assertEqual((await juice.receive_json_from())['orders'], [])
+            self.assertEqual((await waiters.receive_json_from())['orders'], [])
+
+            await sync_to_async(self._create)('Club Sandwich')
+            self.assertTrue(await juice.receive_nothing())
+            self.assertEqual((await waiters.receive_json_from())['type'], 'NEW_ORDER')
+
+            response = await sync_to_async(self._create)('Jugo de Fresa', 'Club Sandwich')
+            new_order = await juice.receive_json_from()
+            self.assertEqual([i['product_name'] for i in new_order['order']['items']], ['Jugo de Fresa'])
+            full = await waiters.receive_json_from()
+            self.assertEqual(len(full['order']['items']), 2)
+
+            await sync_to_async(self._post)(f"/api/customer/table/{self.table.code}/call/", {
+                'token': str(await sync_to_async(lambda: Table.objects.get(pk=self.table.pk).session_token)())
+            })
+            self.assertEqual((await waiters.receive_json_from())['type'], 'WAITER_CALL')
+            self.assertTrue(await juice.receive_nothing())
+
+            snapshot_ids = [response.data['id']]
+            await juice.send_json_to({'type': 'SNAPSHOT', 'ids': snapshot_ids})
+            snapshot = await juice.receive_json_from()
+            self.assertEqual([i['product_name'] for i in snapshot['orders'][0]['items']], ['Jugo de Fresa'])
+
+            await sync_to_async(self._patch_status)(response.data['id'], 'PREPARING')
+            self.assertEqual((await juice.receive_json_from())['changes']['status'], 'PREPARING')
+
+            await juice.disconnect()
+            await waiters.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_unknown_station_is_rejected(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(KitchenConsumer.as_asgi(), '/ws/kitchen/?station=BAR')
+            connected, code = await communicator.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4400)
+
+        async_to_sync(scenario)()
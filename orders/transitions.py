@@ -0,0 +1,177 @@
+# orders/transitions.py
+"""
+Máquina de estados de los pedidos.
+
+Todas las reglas (de qué estados se puede pasar a cuál y qué fecha se estampa)
+viven en TRANSITIONS. Cada transición es un solo UPDATE condicional:
+
+    UPDATE orders_order SET status = ..., <fecha> = COALESCE(<fecha>, now), ...
+    WHERE id = %s AND status IN (<orígenes>)
+
+Si no actualiza ninguna fila, otro mesero ganó la carrera (o el estado no lo
+permite) y se responde 409 con el estado actual; nunca se pisan cambios ajenos
+ni se reescriben columnas que no cambian.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import status as drf_status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+
+from .models import Order
+from .rollups import record_paid_orders, remove_paid_orders
+
+S = Order.Status
+ALL_STATUSES = frozenset(S.values)
+EDITABLE = frozenset({S.NEW, S.PREPARING, S.WAITER_EDITING})
+
+# sources: estados desde los que se permite; target: estado final (None = borrar)
+Transition = namedtuple('Transition', ['sources', 'target', 'error'])
+
+TRANSITIONS = {
+    'deliver': Transition(frozenset({S.READY}), S.DELIVERED, "Solo se pueden entregar pedidos 'LISTOS'."),
+    'request_change': Transition(EDITABLE, S.CHANGE_REQUESTED, "El pedido no puede ser modificado en este estado."),
+    'edit_items': Transition(EDITABLE, S.NEW, "El pedido no puede ser modificado en este estado."),
+    'accept_change': Transition(frozenset({S.CHANGE_REQUESTED}), S.PREPARING, "El pedido no está en solicitud de cambio."),
+    'reject_change': Transition(frozenset({S.CHANGE_REQUESTED}), S.PREPARING, "El pedido no está en solicitud de cambio."),
+    'delete': Transition(frozenset({S.NEW, S.WAITER_EDITING}), None, "Solo se pueden borrar pedidos nuevos."),
+}
+
+# set_status permite ir a cualquier estado salvo estas restricciones
+SET_STATUS_TRANSITIONS = {
+    S.WAITER_EDITING: Transition(
+        frozenset({S.NEW, S.PREPARING}), S.WAITER_EDITING, "Solo se puede editar un pedido 'NUEVO' o 'EN PREPARACIÓN'."
+    ),
+}
+
+# Estado destino -> fecha que se estampa la primera vez que se llega
+STAMPS = {
+    S.PREPARING: 'preparing_at',
+    S.READY: 'ready_at',
+    S.DELIVERED: 'delivered_at',
+    S.PAID: 'paid_at',
+}
+
+
+class TransitionConflict(APIException):
+    status_code = drf_status.HTTP_409_CONFLICT
+    default_code = 'conflict'
+
+    def __init__(self, transition, current_status):
+        super().__init__({'detail': transition.error, 'status': current_status})
+        self.current_status = current_status
+
+
+def status_transition(new_status):
+    """Transición de set_status hacia `new_status`."""
+    if new_status not in ALL_STATUSES:
+        raise ValidationError({'detail': 'status inválido'})
+    return SET_STATUS_TRANSITIONS.get(new_status) or Transition(ALL_STATUSES, new_status, "Cambio de estado no permitido.")
+
+
+def transition_fields(transition, now):
+    """Columnas que escribe `transition` (para .update())."""
+    fields = {'status': transition.target, 'updated_at': now, 'version': F('version') + 1}
+    stamp = STAMPS.get(transition.target)
+    if stamp:
+        fields[stamp] = Coalesce(stamp, Value(now))
+    return fields
+
+
+def apply_stamps(order, transition, now):
+    """Refleja en memoria lo que escribió transition_fields()."""
+    order.status = transition.target
+    order.updated_at = now
+    order.version += 1
+    stamp = STAMPS.get(transition.target)
+    if stamp and getattr(order, stamp) is None:
+        setattr(order, stamp, now)
+
+
+def changed_fields(transition, *extra):
+    """Campos de OrderSerializer que cambia `transition` (para el delta de la cocina)."""
+    fields = ['status', 'status_display']
+    stamp = STAMPS.get(transition.target)
+    if stamp:
+        fields.append(stamp)
+    return fields + [name for name in extra if name not in fields]
+
+
+def allowed_sources(transition):
+    """
+    Estados desde los que `transition` se aplica. Pagar un pedido ya pagado
+    no se permite: lo registraría dos veces en el rollup diario.
+    """
+    if transition.target == S.PAID:
+        return transition.sources - {S.PAID}
+    return transition.sources
+
+
+def apply_bulk_transition(orders, transition):
+    """
+    Ejecuta `transition` sobre `orders` en un solo UPDATE, con los mismos
+    ajustes del rollup que apply_transition, y refleja el cambio en memoria.
+    Los pedidos ya deben estar bloqueados (select_for_update) y en
+    allowed_sources(transition).
+    """
+    now = timezone.now()
+    ids = [order.id for order in orders]
+    leaving_paid = [order.id for order in orders if order.status == S.PAID]
+    Order.objects.filter(pk__in=ids, status__in=allowed_sources(transition)).update(
+        **transition_fields(transition, now)
+    )
+    for order in orders:
+        apply_stamps(order, transition, now)
+
+    if transition.target == S.PAID:
+        record_paid_orders(ids)
+    elif leaving_paid:
+        remove_paid_orders(leaving_paid)
+
+
+def _conflict(pk, transition):
+    current = Order.objects.filter(pk=pk).values_list('status', flat=True).first()
+    if current is None:
+        raise NotFound()
+    raise TransitionConflict(transition, current)
+
+
+@transaction.atomic
+def apply_transition(pk, transition, **updates):
+    """
+    Ejecuta `transition` sobre el pedido `pk` (más `updates`) y devuelve el
+    pedido actualizado, con mesa e items, listo para serializar una sola vez.
+    """
+    fields = {**transition_fields(transition, timezone.now()), **updates}
+    target = transition.target
+    sources = allowed_sources(transition)
+
+    # El rollup diario depende de si el pedido entra o sale de PAID, así que
+    # ese caso se separa en su propio UPDATE condicional
+    if target != S.PAID and S.PAID in sources:
+        if Order.objects.filter(pk=pk, status=S.PAID).update(**fields):
+            remove_paid_orders([pk])
+            return _fetch(pk)
+        sources = sources - {S.PAID}
+
+    if not Order.objects.filter(pk=pk, status__in=sources).update(**fields):
+        _conflict(pk, transition)
+    if target == S.PAID:
+        record_paid_orders([pk])
+    return _fetch(pk)
+
+
+@transaction.atomic
+def delete_order(pk):
+    transition = TRANSITIONS['delete']
+    order = Order.objects.select_for_update().filter(pk=pk, status__in=transition.sources).first()
+    if order is None:
+        _conflict(pk, transition)
+    order.delete()
+
+
+def _fetch(pk):
+    return Order.objects.select_related('table').prefetch_related('items').get(pk=pk)
@@ -1,26 +1,40 @@
 # orders/views.py
 from rest_framework import viewsets, mixins, generics, status as drf_status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
-from django.db.models import Sum, Q
 from decimal import Decimal
 from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse
 from django.utils import timezone
-from datetime import timedelta
-from django.db.models import Count, Avg, Sum, F, ExpressionWrapper, fields
-from django.db.models.functions import TruncDate
-from rest_framework.permissions import IsAuthenticated
+from datetime import date, timedelta
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.views import APIView
 
-from .models import Order, OrderItem, Product, Table, Review
+from .models import Order, Product, Table
 from .serializers import (
-    OrderSerializer, ProductSerializer, TableSerializer, OrderItemSerializer,
-    PublicTableSerializer, ReviewSerializer
+    OrderSerializer, ProductSerializer, TableSerializer,
+    PublicTableSerializer, ReviewSerializer, order_deltas
+)
+from .dashboard import GRANULARITIES, get_dashboard_stats
+from .rollups import record_paid_orders
+from .pagination import OrderCursorPagination
+from .representations import serialize_order, serialize_order_rows, serialize_orders
+from .changes import get_changes
+from .cursors import decode_cursor
+from .transitions import (
+    TRANSITIONS, allowed_sources, apply_bulk_transition, apply_transition, changed_fields,
+    delete_order, status_transition,
 )
 
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from .outbox import publish
+from .stations import publish_batch, publish_waiter_call
+from . import commands, metrics
 
-KITCHEN_GROUP_NAME = "kitchen"
+VALID_STATUSES = {c[0] for c in Order.Status.choices}
+ACTIVE_STATUSES = VALID_STATUSES - {Order.Status.PAID}
+MAX_BULK_ORDERS = 500
 
 
 class OrderViewSet(
@@ -33,29 +47,76 @@ class OrderViewSet(
 ):
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
+    pagination_class = OrderCursorPagination
+    # Las respuestas salen de representations.py (sin floats): FastJSONRenderer
+    # no busca NaN en ellas (ver orders/fast_json.py)
+    json_check_floats = False
 
     def get_queryset(self):
         qs = (
             Order.objects
             .select_related("table")
             .prefetch_related("items")
-            .order_by("-created_at")
+            .order_by("-created_at", "-id")
         )
         status_param = self.request.query_params.get("status")
         if status_param:
             status_list = status_param.split(',')
             qs = qs.filter(status__in=status_list)
+            if set(status_list) <= ACTIVE_STATUSES:
+                # Redundante, pero deja que el planificador use el índice parcial
+                # order_active_created_idx (misma condición textual)
+                qs = qs.exclude(status=Order.Status.PAID)
         return qs
 
-    def update(self, request, *args, **kwargs):
-        order = self.get_object()
+    def paginate_queryset(self, queryset):
+        # Sin paginar solo si el filtro ?status= se limita a pedidos activos
+        # (las pantallas de cocina/meseros); el historial siempre va paginado.
+        status_param = self.request.query_params.get("status")
+        if status_param and set(status_param.split(',')) <= ACTIVE_STATUSES:
+            return None
+        return super().paginate_queryset(queryset)
 
-        if order.status not in [Order.Status.NEW, Order.Status.PREPARING, Order.Status.WAITER_EDITING]:
-            return Response(
-                {"detail": "El pedido no puede ser modificado en este estado."},
-                status=drf_status.HTTP_403_FORBIDDEN
-            )
+    # Las lecturas no pasan por OrderSerializer (orders/representations.py)
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize_orders(page))
+        return Response(serialize_order_rows(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(serialize_order(self.get_object()))
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        # ?since=<cursor>&limit=N -> pedidos creados/modificados y ids borrados desde el cursor
+        since = request.query_params.get('since')
+        since = decode_cursor(since)[:2] if since else None
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 200)), 1), 1000)
+        except ValueError:
+            limit = 200
+
+        queryset = Order.objects.select_related("table").prefetch_related("items")
+        changes = get_changes(queryset, since, limit)
+        changes['orders'] = serialize_orders(changes['orders'])
+        return Response(changes)
+
+    def _order_pk(self):
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except (TypeError, ValueError):
+            raise NotFound()
+
+    def _transition_response(self, order, fields):
+        # Respuesta completa por HTTP; a la cocina solo los campos que cambiaron
+        self.send_websocket_delta(order, fields)
+        return Response(serialize_order(order))
 
+    @transaction.atomic
+    def update(self, request, *args, **kwargs):
         previous_status = request.data.get('previous_status_on_edit')
         items_data = request.data.get('items')
 
@@ -66,114 +127,83 @@ class OrderViewSet(
             )
 
         if previous_status == Order.Status.PREPARING:
-            order.proposed_changes = {"items": items_data}
-            order.status = Order.Status.CHANGE_REQUESTED
-            order.save(update_fields=['status', 'proposed_changes'])
-            self.send_websocket_update(self.get_serializer(order).data)
-            return Response(self.get_serializer(order).data)
-
-        else:
-            request.data['status'] = Order.Status.NEW
-            response = super().update(request, *args, **kwargs)
-            order.refresh_from_db()
-            order.proposed_changes = {}
-            order.save(update_fields=['proposed_changes'])
-            self.send_websocket_update(response.data)
-            return response
+            transition = TRANSITIONS['request_change']
+            order = apply_transition(self._order_pk(), transition, proposed_changes={"items": items_data})
+            return self._transition_response(order, changed_fields(transition, 'proposed_changes'))
+
+        serializer = self.get_serializer(data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        # El estado lo decide la transición, no el cliente
+        serializer.validated_data.pop('status', None)
+        transition = TRANSITIONS['edit_items']
+        serializer.instance = apply_transition(self._order_pk(), transition, proposed_changes={})
+        serializer.save()
+        return self._transition_response(serializer.instance, changed_fields(
+            transition, 'proposed_changes', 'items', 'total_price', 'table_code'
+        ))
 
     def destroy(self, request, *args, **kwargs):
-        order = self.get_object()
-        if order.status not in [Order.Status.NEW, Order.Status.WAITER_EDITING]:
-            return Response({"detail": "Solo se pueden borrar pedidos nuevos."}, status=drf_status.HTTP_403_FORBIDDEN)
-        return super().destroy(request, *args, **kwargs)
+        delete_order(self._order_pk())
+        return Response(status=drf_status.HTTP_204_NO_CONTENT)
 
+    # set_status, mark-delivered, accept/reject-change también se pueden
+    # pedir por WebSocket: la lógica vive en orders/commands.py
     @action(detail=True, methods=["patch"])
     def set_status(self, request, pk=None):
-        order = self.get_object()
-        new_status = request.data.get("status")
-
-        valid_statuses = {c[0] for c in Order.Status.choices}
-        if new_status not in valid_statuses:
-            return Response({"detail": "status inválido"}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        if new_status == Order.Status.WAITER_EDITING:
-            if order.status not in [Order.Status.NEW, Order.Status.PREPARING]:
-                return Response({"detail": "Solo se puede editar un pedido 'NUEVO' o 'EN PREPARACIÓN'."},
-                                status=drf_status.HTTP_403_FORBIDDEN)
-
-        now = timezone.now()
-        if new_status == Order.Status.PREPARING and not order.preparing_at:
-            order.preparing_at = now
-        elif new_status == Order.Status.READY and not order.ready_at:
-            order.ready_at = now
-
-        order.status = new_status
-        order.save()
-
-        self.send_websocket_update(self.get_serializer(order).data)
-        return Response(self.get_serializer(order).data)
+        order = commands.set_status(self._order_pk(), request.data.get("status"))
+        return Response(serialize_order(order))
 
     @action(detail=True, methods=["patch"], url_path='mark-delivered')
     def mark_as_delivered(self, request, pk=None):
-        order = self.get_object()
-        if order.status != Order.Status.READY:
-            return Response({"detail": "Solo se pueden entregar pedidos 'LISTOS'."},
+        order = commands.mark_delivered(self._order_pk())
+        return Response(serialize_order(order))
+
+    @action(detail=False, methods=["post"], url_path='bulk-status')
+    @transaction.atomic
+    def bulk_status(self, request):
+        # {"ids": [1, 2, 3], "status": "READY"}: mismas reglas que set_status
+        # (y mark-delivered para DELIVERED), todo o nada.
+        new_status = request.data.get("status")
+        ids = request.data.get("ids")
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            return Response({"detail": "ids debe ser una lista de enteros."}, status=drf_status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MAX_BULK_ORDERS:
+            return Response({"detail": f"Máximo {MAX_BULK_ORDERS} pedidos por solicitud."},
                             status=drf_status.HTTP_400_BAD_REQUEST)
+        if new_status == Order.Status.DELIVERED:
+            transition = TRANSITIONS['deliver']
+        else:
+            transition = status_transition(new_status)
 
-        order.status = Order.Status.DELIVERED
-        order.delivered_at = timezone.now()
-        order.save()
+        orders = list(
+            Order.objects.select_for_update()
+            .filter(pk__in=ids)
+            .select_related("table")
+            .prefetch_related("items")
+            .order_by("id")
+        )
+        found = {order.id for order in orders}
+        errors = {order_id: "Pedido no encontrado." for order_id in ids if order_id not in found}
+        sources = allowed_sources(transition)
+        for order in orders:
+            if order.status not in sources:
+                errors[order.id] = transition.error
+        if errors:
+            return Response({"detail": "Ningún pedido fue modificado.", "errors": errors},
+                            status=drf_status.HTTP_400_BAD_REQUEST)
 
-        self.send_websocket_update(self.get_serializer(order).data)
-        return Response(self.get_serializer(order).data)
+        apply_bulk_transition(orders, transition)
+        self.send_websocket_batch(orders, changed_fields(transition))
+        return Response({"updated": len(orders), "orders": serialize_orders(orders)})
 
     @action(detail=True, methods=['post'], url_path='accept-change')
-    @transaction.atomic
     def accept_change(self, request, pk=None):
-        order = self.get_object()
-        if order.status != Order.Status.CHANGE_REQUESTED:
-            return Response({"detail": "El pedido no está en solicitud de cambio."},
-                            status=drf_status.HTTP_400_BAD_REQUEST)
-
-        items_data = order.proposed_changes.get('items')
-        if not items_data:
-            return Response({"detail": "Datos corruptos."}, status=drf_status.HTTP_400_BAD_REQUEST)
-
-        with transaction.atomic():
-            OrderItem.objects.filter(order=order).delete()
-            order_total = Decimal('0.00')
-            for item_data in items_data:
-                item_price = Decimal(str(item_data.get('unit_price', '0.00')))
-                OrderItem.objects.create(
-                    order=order,
-                    unit_price=item_price,
-                    product_name=item_data.get('product_name'),
-                    notes=item_data.get('notes'),
-                    selected_options=item_data.get('selected_options', {}),
-                )
-                order_total += item_price
-
-            order.total_price = order_total
-            order.status = Order.Status.PREPARING
-            order.proposed_changes = {}
-            order.save()
-
-        self.send_websocket_update(self.get_serializer(order).data)
+        commands.accept_change(self._order_pk())
         return Response({"detail": "Cambios aceptados."}, status=drf_status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'], url_path='reject-change')
-    @transaction.atomic
     def reject_change(self, request, pk=None):
-        order = self.get_object()
-        if order.status != Order.Status.CHANGE_REQUESTED:
-            return Response({"detail": "El pedido no está en solicitud de cambio."},
-                            status=drf_status.HTTP_400_BAD_REQUEST)
-
-        order.proposed_changes = {}
-        order.status = Order.Status.PREPARING
-        order.save()
-
-        self.send_websocket_update(self.get_serializer(order).data)
+        commands.reject_change(self._order_pk())
         return Response({"detail": "Cambios rechazados."}, status=drf_status.HTTP_200_OK)
 
     @action(detail=False, methods=["post"], url_path='close-table')
@@ -187,19 +217,30 @@ class OrderViewSet(
         except Table.DoesNotExist:
             return Response({"detail": "Mesa no encontrada"}, status=drf_status.HTTP_404_NOT_FOUND)
 
-        orders_to_close = table_obj.orders.filter(~Q(status=Order.Status.PAID))
-        total = Decimal('0.00')
-        updated_order_ids = []
+        # Un SELECT ... FOR UPDATE (+ items, para rutear a las estaciones) y un
+        # solo UPDATE, sin importar cuántas rondas de pedidos tenga la mesa
+        orders_to_close = list(
+            Order.objects.select_for_update()
+            .filter(table=table_obj)
+            .exclude(status=Order.Status.PAID)
+            .prefetch_related("items")
+        )
+        total = sum((order.total_price for order in orders_to_close), Decimal('0.00'))
 
-        if orders_to_close.exists():
-            total = orders_to_close.aggregate(total=Sum('total_price', default=Decimal('0.00')))['total']
+        if orders_to_close:
             now = timezone.now()
+            updated_order_ids = [order.id for order in orders_to_close]
+            Order.objects.filter(pk__in=updated_order_ids).update(
+                status=Order.Status.PAID, paid_at=now, updated_at=now, version=F('version') + 1
+            )
             for order in orders_to_close:
+                order.table = table_obj
                 order.status = Order.Status.PAID
                 order.paid_at = now
-                order.save()
-                updated_order_ids.append(order.id)
-                self.send_websocket_update(self.get_serializer(order).data)
+                order.updated_at = now
+                order.version += 1
+            record_paid_orders(updated_order_ids)
+            self.send_websocket_batch(orders_to_close, ['status', 'status_display', 'paid_at'])
 
         # Limpieza
         table_obj.status = Table.Status.LIBRE
@@ -208,28 +249,20 @@ class OrderViewSet(
         table_obj.save(update_fields=['status', 'session_token', 'needs_assistance'])
 
         # WS CLIENTE (MESA CERRADA)
-        try:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"table_{table_obj.code}",
-                {
-                    "type": "table.status.update",
-                    "data": {"type": "TABLE_CLOSED", "message": "Mesa cerrada"}
-                }
-            )
-        except Exception:
-            pass
+        publish(f"table_{table_obj.code}", {
+            "type": "table.status.update",
+            "data": {"type": "TABLE_CLOSED", "message": "Mesa cerrada"}
+        })
 
         return Response({"detail": "Mesa cerrada.", "total_billed": total}, status=drf_status.HTTP_200_OK)
 
-    def send_websocket_update(self, order_data):
-        try:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                KITCHEN_GROUP_NAME, {"type": "send.status.update", "order": order_data}
-            )
-        except Exception as e:
-            print(f"Error WS: {e}")
+    # Los eventos salen al confirmar la transacción (ver orders/outbox.py).
+    def send_websocket_delta(self, order, fields):
+        commands.send_order_delta(order, fields)
+
+    def send_websocket_batch(self, orders, fields):
+        # Un solo mensaje por grupo con todos los pedidos que cambiaron
+        publish_batch(orders, order_deltas(orders, fields))
 
 
 # --- VISTAS CLIENTE ---
@@ -245,7 +278,7 @@ class CustomerViewSet(viewsets.GenericViewSet):
 
         recent_paid_orders = Order.objects.filter(
             table=table, status=Order.Status.PAID, updated_at__gte=timezone.now() - timedelta(minutes=30)
-        )
+        ).prefetch_related("items")
         can_rate = recent_paid_orders.exists() and table.status == 'LIBRE'
         data = PublicTableSerializer(table).data
         data['can_rate'] = can_rate
@@ -267,32 +300,8 @@ class CustomerViewSet(viewsets.GenericViewSet):
 
     @action(detail=False, methods=['post'], url_path='table/(?P<code>[^/.]+)/call')
     def call_waiter(self, request, code=None):
-        try:
-            table = Table.objects.get(code=code)
-        except Table.DoesNotExist:
-            return Response(status=404)
-
-        client_token = request.data.get('token')
-        if str(table.session_token) != str(client_token):
-            return Response({"detail": "Sesión inválida."}, status=403)
-
-        table.needs_assistance = True
-        table.save(update_fields=['needs_assistance'])
-
-        # WS PARA AVISAR AL MESERO QUE EL CLIENTE LLAMA
-        try:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "kitchen",  # Usamos el grupo 'kitchen' porque los meseros también escuchan ahí
-                {
-                    "type": "waiter.call",
-                    "table_code": table.code,
-                    "status": "ON"  # Encender alerta
-                }
-            )
-        except Exception:
-            pass
-
+        # También por WebSocket (TableConsumer), ver orders/commands.py
+        commands.call_waiter(code, request.data.get('token'))
         return Response({"detail": "Mesero notificado"})
 
     @action(detail=False, methods=['post'], url_path='rate')
@@ -334,138 +343,52 @@ class TableViewSet(viewsets.ModelViewSet):
         table.save()
 
         # 1. AVISAR AL CLIENTE (QR) -> "El mesero viene"
-        try:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f"table_{table.code}",
-                {
-                    "type": "table.status.update",
-                    "data": {
-                        "type": "WAITER_COMING",
-                        "message": "El mesero va en camino."
-                    }
-                }
-            )
-        except Exception:
-            pass
+        publish(f"table_{table.code}", {
+            "type": "table.status.update",
+            "data": {
+                "type": "WAITER_COMING",
+                "message": "El mesero va en camino."
+            }
+        })
 
         # 2. AVISAR A OTROS MESEROS -> Apagar alerta naranja
-        try:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                "kitchen",
-                {
-                    "type": "waiter.call",
-                    "table_code": table.code,
-                    "status": "OFF"
-                }
-            )
-        except Exception:
-            pass
+        publish_waiter_call(table.code, "OFF")
 
         return Response({'status': 'attended'})
 
 
 class DashboardViewSet(viewsets.ViewSet):
     """
-    Versión con CÁLCULO MANUAL para asegurar compatibilidad total con fechas.
+    Estadísticas agregadas en la base de datos (ver orders/dashboard.py).
     """
     permission_classes = [IsAuthenticated]
 
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        # 1. TRAER PEDIDOS (Pagados o Entregados)
-        target_statuses = [Order.Status.PAID, Order.Status.DELIVERED]
+        # Filtros opcionales: ?from=YYYY-MM-DD&to=YYYY-MM-DD&granularity=hour|day|week|month
+        try:
+            date_from = self._parse_date(request.query_params.get('from'))
+            date_to = self._parse_date(request.query_params.get('to'))
+        except ValueError:
+            return Response({"detail": "Fecha inválida, use YYYY-MM-DD."}, status=drf_status.HTTP_400_BAD_REQUEST)
+
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return Response(
+                {"detail": f"granularity inválida, use una de: {', '.join(GRANULARITIES)}."},
+                status=drf_status.HTTP_400_BAD_REQUEST
+            )
 
-        # Traemos TODOS los objetos ordenados.
-        # Nota: Al no usar .values() ni .annotate() de la DB, evitamos el error de SQLite.
-        orders = Order.objects.filter(status__in=target_statuses).order_by('created_at')
+        return Response(get_dashboard_stats(date_from, date_to, granularity))
 
-        # --- VARIABLES PARA ACUMULAR DATOS ---
-        total_sales = Decimal('0.00')
-        sales_by_date_dict = {}  # Ejemplo: {"2025-11-26": 50.00}
+    @staticmethod
+    def _parse_date(value):
+        return date.fromisoformat(value) if value else None
 
-        prep_times = []  # Lista de segundos
-        prep_times_by_product = {}  # {"Hamburguesa": [600, 500]}
 
-        product_counts = {}  # {"Jugo": 5}
+class MetricsView(APIView):
+    """Métricas del proceso en formato Prometheus (ver orders/metrics.py)."""
+    permission_classes = [IsAdminUser]
 
-        # --- BUCLE PRINCIPAL (Procesamos en Python) ---
-        for order in orders:
-            # A. Ventas Totales
-            total_sales += order.total_price
-
-            # B. Historial de Ventas
-            if order.created_at:
-                # Convertimos a string "YYYY-MM-DD" respetando zona horaria local
-                local_date = timezone.localtime(order.created_at).strftime("%Y-%m-%d")
-
-                if local_date not in sales_by_date_dict:
-                    sales_by_date_dict[local_date] = Decimal('0.00')
-                sales_by_date_dict[local_date] += order.total_price
-
-            # C. Productos y Tiempos
-            # (Nota: Esto hace consultas adicionales, pero para reportes de admin es aceptable)
-            items = order.items.all()
-
-            for item in items:
-                # Conteo Top Productos
-                p_name = item.product_name
-                if p_name not in product_counts:
-                    product_counts[p_name] = 0
-                product_counts[p_name] += 1
-
-                # Tiempos (Solo si la orden tiene inicio y fin)
-                if order.ready_at and order.created_at:
-                    duration = (order.ready_at - order.created_at).total_seconds()
-                    prep_times.append(duration)
-
-                    if p_name not in prep_times_by_product:
-                        prep_times_by_product[p_name] = []
-                    prep_times_by_product[p_name].append(duration)
-
-        # --- FORMATO DE SALIDA PARA EL FRONTEND ---
-
-        # 1. Historial de Ventas (Lista ordenada)
-        sales_history = [
-            {"date": date, "total": total}
-            for date, total in sales_by_date_dict.items()
-        ]
-        sales_history.sort(key=lambda x: x['date'])  # Ordenar cronológicamente
-
-        # 2. KPI: Tiempo Promedio Global (minutos)
-        avg_minutes = 0
-        if prep_times:
-            avg_seconds = sum(prep_times) / len(prep_times)
-            avg_minutes = round(avg_seconds / 60, 1)
-
-        # 3. Gráfico: Tiempo por Producto
-        prep_time_chart = []
-        for name, times in prep_times_by_product.items():
-            avg_prod_seconds = sum(times) / len(times)
-            prep_time_chart.append({
-                "product": name,
-                "minutes": round(avg_prod_seconds / 60, 1)
-            })
-        # Ordenar los más lentos primero y tomar Top 10
-        prep_time_chart.sort(key=lambda x: x['minutes'], reverse=True)
-        prep_time_chart = prep_time_chart[:10]
-
-        # 4. Top Ventas
-        top_products_list = [
-            {"product_name": name, "total": count}
-            for name, count in product_counts.items()
-        ]
-        top_products_list.sort(key=lambda x: x['total'], reverse=True)
-        top_products_list = top_products_list[:5]
-
-        return Response({
-            "kpi": {
-                "total_sales": total_sales,
-                "orders_count": orders.count(),
-                "avg_prep_time_minutes": avg_minutes,
-            },
-            "top_products": top_products_list,
-            "prep_time_by_product": prep_time_chart,
-            "sales_history": sales_history
-        })
\ No newline at end of file
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')